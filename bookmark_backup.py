@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+书签备份仓库
+按内容哈希存放压缩快照，相同内容只保存一次，并按保留策略清理旧快照
+"""
+
+import bisect
+import gzip
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from bookmark_io import atomic_write_bytes
+from bookmark_lock import SyncLock
+
+
+class RetentionPolicy:
+    """保留策略：最近 N 个，以及每小时/每天/每周各保留一个"""
+
+    def __init__(self, keep_last=10, hourly=24, daily=7, weekly=4):
+        self.keep_last = keep_last
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+
+    def select(self, entries):
+        """返回需要保留的条目（entries 按时间从新到旧排列）"""
+        keep = set(range(min(self.keep_last, len(entries))))
+        rules = [
+            (self.hourly, '%Y-%m-%d %H'),
+            (self.daily, '%Y-%m-%d'),
+            (self.weekly, '%G-%V'),
+        ]
+        for count, period_format in rules:
+            seen = set()
+            for i, entry in enumerate(entries):
+                if len(seen) >= count:
+                    break
+                period = datetime.fromtimestamp(entry['time']).strftime(period_format)
+                if period not in seen:
+                    seen.add(period)
+                    keep.add(i)
+        return [entry for i, entry in enumerate(entries) if i in keep]
+
+
+class BackupStore:
+    """内容寻址的备份仓库"""
+
+    def __init__(self, backup_dir, policy=None):
+        self.backup_dir = Path(backup_dir)
+        self.objects_dir = self.backup_dir / "objects"
+        self.index_path = self.backup_dir / "backups.jsonl"
+        self.policy = policy or RetentionPolicy()
+        # 多个进程（V1、V2、多目标子进程、监听模式）共用备份目录，修改索引时持有索引锁
+        self.index_lock = SyncLock(self.backup_dir, "backups", lock_name="backups")
+        self._entries = None
+        self._index_stat = None
+
+    def object_path(self, digest):
+        """快照文件路径"""
+        return self.objects_dir / digest[:2] / f"{digest}.json.gz"
+
+    def _stat_index(self):
+        """索引文件的 (inode, 大小, 修改时间)，用于发现其他进程的修改"""
+        try:
+            st = self.index_path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _read_index(self):
+        entries = []
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        entries.sort(key=lambda e: e['time'])
+        return entries
+
+    def reload(self):
+        """丢弃缓存，下次访问时重新读取索引"""
+        self._entries = None
+        self._index_stat = None
+
+    @property
+    def entries(self):
+        """全部备份记录，按时间从旧到新排列；索引文件被其他进程修改过时重新读取"""
+        stat = self._stat_index()
+        if self._entries is None or stat != self._index_stat:
+            self._entries = self._read_index()
+            self._index_stat = stat
+        return self._entries
+
+    def add(self, file_path, browser_name, digest=None):
+        """备份文件；内容已存在时只追加记录，不再读取和写入文件，返回备份记录"""
+        file_path = Path(file_path)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        # 写入快照也在锁内进行，避免其他进程的清理删掉刚写入、尚未登记的快照
+        with self.index_lock.hold():
+            if digest is None or not self.object_path(digest).exists():
+                data = file_path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                object_path = self.object_path(digest)
+                if not object_path.exists():
+                    self._write_object(object_path, data)
+
+            self.reload()
+            latest = self.latest(browser_name)
+            if latest and latest['digest'] == digest:
+                return latest
+
+            now = datetime.now()
+            entry = {
+                'time': now.timestamp(),
+                'date': now.strftime("%Y-%m-%d %H:%M:%S"),
+                'browser': browser_name,
+                'digest': digest,
+                'size': file_path.stat().st_size,
+                'source': str(file_path),
+            }
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            # 持有锁期间没有其他写入者，直接更新缓存
+            self._entries.append(entry)
+            self._index_stat = self._stat_index()
+        return entry
+
+    def _write_object(self, object_path, data):
+        """压缩写入快照"""
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(object_path, gzip.compress(data, compresslevel=6, mtime=0), fsync=False)
+
+    def latest(self, browser_name):
+        """某个浏览器最新的备份记录"""
+        for entry in reversed(self.entries):
+            if entry['browser'] == browser_name:
+                return entry
+        return None
+
+    def find(self, browser_name=None, at=None, digest=None):
+        """按哈希前缀或时间查找备份：时间取该时刻及之前最新的一个"""
+        entries = [e for e in self.entries if browser_name is None or e['browser'] == browser_name]
+        if digest:
+            for entry in reversed(entries):
+                if entry['digest'].startswith(digest):
+                    return entry
+            return None
+        if at is None:
+            return entries[-1] if entries else None
+        times = [e['time'] for e in entries]
+        pos = bisect.bisect_right(times, at.timestamp())
+        return entries[pos - 1] if pos else None
+
+    def read(self, entry):
+        """读取快照内容"""
+        with gzip.open(self.object_path(entry['digest']), 'rb') as f:
+            return f.read()
+
+    def restore(self, entry, target_path):
+        """把快照恢复到目标文件（原子替换）"""
+        target_path = Path(target_path)
+        atomic_write_bytes(target_path, self.read(entry))
+        return target_path
+
+    def prune(self):
+        """按保留策略清理记录，并删除不再引用的快照，返回删除的快照数
+
+        在索引锁内重新读取索引后再改写，不会丢掉其他进程追加的记录。
+        """
+        if not self.index_path.exists():
+            return 0
+        with self.index_lock.hold():
+            self.reload()
+            entries = self.entries
+            by_browser = {}
+            for entry in entries:
+                by_browser.setdefault(entry['browser'], []).append(entry)
+
+            kept = []
+            for browser_entries in by_browser.values():
+                kept.extend(self.policy.select(browser_entries[::-1]))
+            kept.sort(key=lambda e: e['time'])
+
+            if len(kept) == len(entries):
+                return 0
+
+            lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in kept)
+            atomic_write_bytes(self.index_path, lines.encode('utf-8'), fsync=False)
+            self._entries = kept
+            self._index_stat = self._stat_index()
+
+            referenced = {entry['digest'] for entry in kept}
+            removed = 0
+            for entry in entries:
+                digest = entry['digest']
+                if digest in referenced:
+                    continue
+                referenced.add(digest)
+                try:
+                    self.object_path(digest).unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+书签同步性能基准
+- placement: 验证放置新书签的耗时随数量线性增长
+- suite: 生成 Chromium 格式的合成书签，分阶段测量 V1/V2 同步的耗时和内存
+- scenarios: 在内存中运行大量随机同步场景，检查同步结果的不变量并统计每秒场景数
+"""
+
+import argparse
+import json
+import logging
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from bookmark_model import URL, BookmarkFile, BookmarkNode
+from bookmark_sync import BookmarkMerger, MemoryStorage, sync_files
+from bookmark_tree import iter_bookmarks, iter_roots, walk_tree
+from sync_bookmarks import BookmarkSyncer
+from sync_bookmarks_v2 import BookmarkSyncerV2
+
+# Chromium 时间戳：1601-01-01 起的微秒数
+CHROME_EPOCH_OFFSET = 11644473600 * 1000000
+
+UNICODE_WORDS = [
+    '书签', '文档', '工作', '学习', 'ブックマーク', '資料', '북마크', 'Ñandú', 'Ünïcödé',
+    'مرحبا', 'שלום', 'Привет', 'Ελληνικά', '📚', '🔖', '🚀', '👨‍👩‍👧', 'ﬁ', 'ẞ',
+]
+
+
+def make_chrome_tree(folder_count, fanout):
+    """生成带有宽文件夹的 Chrome 书签树"""
+    bar_children = []
+    for i in range(folder_count):
+        bar_children.append({
+            'children': [
+                {'id': '0', 'name': f'页面 {i}-{j}', 'type': 'url', 'url': f'https://chrome.example/{i}/{j}'}
+                for j in range(fanout)
+            ],
+            'id': '0',
+            'name': f'文件夹 {i}',
+            'type': 'folder',
+        })
+    return BookmarkFile.from_json({
+        'roots': {
+            'bookmark_bar': {'children': bar_children, 'id': '1', 'name': '书签栏', 'type': 'folder'},
+            'other': {'children': [], 'id': '2', 'name': '其他书签', 'type': 'folder'},
+        },
+        'version': 1,
+    })
+
+
+def make_new_bookmarks(count, folder_count):
+    """生成待添加的新书签，分散到已有文件夹和新文件夹中"""
+    items = []
+    for i in range(count):
+        folder = i % (folder_count * 2)
+        items.append((
+            ('书签栏', f'文件夹 {folder}', f'子目录 {i % 7}'),
+            BookmarkNode(URL, f'新书签 {i}', f'https://atlas.example/{i}'),
+        ))
+    return items
+
+
+def time_placement(merger, count, folder_count, fanout):
+    """测量放置 count 个新书签的耗时（秒）"""
+    chrome_data = make_chrome_tree(folder_count, fanout)
+    new_bookmarks = make_new_bookmarks(count, folder_count)
+    start = time.perf_counter()
+    added = merger.add_bookmarks_to_chrome(chrome_data, new_bookmarks)
+    elapsed = time.perf_counter() - start
+    assert added == count
+    return elapsed
+
+
+def parse_size(value):
+    """解析 1k / 10k / 1m 这样的数量"""
+    value = value.strip().lower()
+    multiplier = 1
+    if value.endswith('k'):
+        multiplier, value = 1000, value[:-1]
+    elif value.endswith('m'):
+        multiplier, value = 1000000, value[:-1]
+    return int(float(value) * multiplier)
+
+
+def make_name(rng, prefix, i, unicode_names):
+    if not unicode_names:
+        return f'{prefix} {i}'
+    words = rng.sample(UNICODE_WORDS, 3)
+    return f'{prefix} {i} ' + ' '.join(words)
+
+
+def generate_bookmarks(node_count, url_ids, depth=4, fanout=20, unicode_names=False, seed=0):
+    """生成 Chromium 格式的书签文件数据
+
+    node_count 为节点总数（文件夹 + 书签），url_ids 为书签使用的 URL 编号；
+    文件夹按 depth 层、每层若干子文件夹排列，书签轮流放入各文件夹，每个文件夹约 fanout 个子节点。
+    """
+    rng = random.Random(seed)
+    folder_count = max(1, min(node_count // max(fanout, 1), node_count - len(url_ids)))
+    # 每个文件夹的子文件夹数量，使层数约为 depth
+    branch = max(2, round(folder_count ** (1.0 / max(depth, 1))))
+
+    next_id = [4]
+
+    def new_id():
+        next_id[0] += 1
+        return str(next_id[0])
+
+    base_time = CHROME_EPOCH_OFFSET + 1700000000 * 1000000
+
+    def timestamp():
+        return str(base_time + rng.randrange(10 ** 12))
+
+    roots = {
+        'bookmark_bar': {'children': [], 'date_added': timestamp(), 'date_modified': timestamp(),
+                         'id': '1', 'name': '书签栏', 'type': 'folder'},
+        'other': {'children': [], 'date_added': timestamp(), 'date_modified': '0',
+                  'id': '2', 'name': '其他书签', 'type': 'folder'},
+        'synced': {'children': [], 'date_added': timestamp(), 'date_modified': '0',
+                   'id': '3', 'name': '移动设备书签', 'type': 'folder'},
+    }
+
+    # 文件夹 0 即书签栏，文件夹 i 的父文件夹为 (i - 1) // branch
+    folders = [roots['bookmark_bar']]
+    for i in range(1, folder_count):
+        folder = {
+            'children': [],
+            'date_added': timestamp(),
+            'date_last_used': '0',
+            'date_modified': timestamp(),
+            'id': new_id(),
+            'name': make_name(rng, '文件夹', i, unicode_names),
+            'type': 'folder',
+        }
+        folders[(i - 1) // branch]['children'].append(folder)
+        folders.append(folder)
+
+    for n, url_id in enumerate(url_ids):
+        folders[n % len(folders)]['children'].append({
+            'date_added': timestamp(),
+            'date_last_used': '0',
+            'id': new_id(),
+            'name': make_name(rng, '页面', url_id, unicode_names),
+            'type': 'url',
+            'url': f'https://example{url_id % 97}.com/path/{url_id}?q={url_id}',
+        })
+
+    return {'checksum': '', 'roots': roots, 'version': 1}
+
+
+def generate_pair(node_count, depth=4, fanout=20, overlap=0.9, unicode_names=False, seed=0):
+    """生成一对 (Chrome, Atlas) 书签，Atlas 中 overlap 比例的 URL 在 Chrome 中也存在"""
+    url_count = max(1, node_count - max(1, node_count // max(fanout, 1)))
+    shared = int(url_count * overlap)
+    chrome_ids = list(range(url_count))
+    atlas_ids = chrome_ids[:shared] + list(range(url_count, url_count + (url_count - shared)))
+    random.Random(seed).shuffle(atlas_ids)
+    chrome = generate_bookmarks(node_count, chrome_ids, depth, fanout, unicode_names, seed)
+    atlas = generate_bookmarks(node_count, atlas_ids, depth, fanout, unicode_names, seed + 1)
+    return chrome, atlas
+
+
+class PhaseTimer:
+    """记录每个阶段的耗时和峰值内存"""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.phases = []
+
+    def run(self, name, func, *args):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        self.phases.append({'phase': name, 'seconds': elapsed, 'peak_bytes': peak})
+        return result
+
+
+def bench_v2(workdir, timer):
+    """分阶段执行 V2 同步流程"""
+    syncer = BookmarkSyncerV2(workdir / 'Chrome', workdir / 'Atlas', workdir / 'backup-v2', logger=quiet_logger())
+    chrome_data = timer.run('load_chrome', syncer.load_bookmarks, syncer.chrome_path)
+    atlas_data = timer.run('load_atlas', syncer.load_bookmarks, syncer.atlas_path)
+    chrome_index = timer.run('walk_chrome', walk_tree, chrome_data)
+    atlas_index = timer.run('walk_atlas', walk_tree, atlas_data)
+    new_bookmarks = timer.run('diff', lambda: [
+        (path, node) for url, (path, node) in atlas_index.url_map.items() if url not in chrome_index.url_set
+    ])
+    timer.run('place', syncer.add_bookmarks_to_chrome, chrome_data, new_bookmarks, chrome_index.folder_index)
+    timer.run('save', syncer.save_bookmarks, workdir / 'Chrome.out', chrome_data)
+    # 完整流程（首次运行，没有状态缓存）
+    timer.run('sync_total', syncer.sync_atlas_to_chrome)
+    return len(new_bookmarks)
+
+
+def bench_v1(workdir, timer):
+    """分阶段执行 V1 同步流程"""
+    syncer = BookmarkSyncer(workdir / 'Chrome', workdir / 'Atlas', workdir / 'backup-v1', logger=quiet_logger())
+    chrome_data = timer.run('load_chrome', syncer.load_bookmarks, syncer.chrome_path)
+    atlas_data = timer.run('load_atlas', syncer.load_bookmarks, syncer.atlas_path)
+    merged_chrome, merged_atlas = timer.run('merge', syncer.merge_roots, chrome_data, atlas_data)
+    timer.run('save', syncer.save_bookmarks, workdir / 'Chrome.out', merged_chrome)
+    timer.run('sync_total', syncer.sync)
+    return None
+
+
+def run_suite(args):
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    syncers = [s.strip() for s in args.syncers.split(',') if s.strip()]
+    if args.memory:
+        tracemalloc.start()
+
+    results = []
+    for size in sizes:
+        chrome, atlas = generate_pair(size, args.depth, args.fanout, args.overlap, args.unicode, args.seed)
+        for name in syncers:
+            with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmp:
+                workdir = Path(tmp)
+                # 每个同步器使用独立的输入文件，避免相互影响
+                start = time.perf_counter()
+                for file_name, data in (('Chrome', chrome), ('Atlas', atlas)):
+                    with open(workdir / file_name, 'w', encoding='utf-8') as f:
+                        json.dump(data, f, ensure_ascii=False, indent=3)
+                write_seconds = time.perf_counter() - start
+                input_bytes = (workdir / 'Chrome').stat().st_size + (workdir / 'Atlas').stat().st_size
+
+                timer = PhaseTimer(args.memory)
+                bench = bench_v1 if name == 'v1' else bench_v2
+                added = bench(workdir, timer)
+
+            total = sum(p['seconds'] for p in timer.phases if p['phase'] != 'sync_total')
+            result = {
+                'syncer': name,
+                'nodes': size,
+                'input_bytes': input_bytes,
+                'generate_write_seconds': write_seconds,
+                'phases': timer.phases,
+                'phase_seconds_total': total,
+                'added': added,
+                'max_rss_bytes': max_rss_bytes(),
+            }
+            results.append(result)
+            report(result, args.json)
+    return results
+
+
+def max_rss_bytes():
+    """进程峰值常驻内存（macOS 单位为字节，Linux 为 KB）"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def report(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    print(f"\n== {result['syncer']}  {result['nodes']:,} 个节点  输入 {result['input_bytes'] / 1e6:.1f} MB ==")
+    for phase in result['phases']:
+        peak = f"{phase['peak_bytes'] / 1e6:9.1f} MB" if phase['peak_bytes'] is not None else ''
+        print(f"  {phase['phase']:<12} {phase['seconds'] * 1000:10.1f} ms  {peak}")
+    print(f"  进程峰值内存 {result['max_rss_bytes'] / 1e6:.1f} MB")
+
+
+def run_placement(args):
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+
+    # 只在内存中放置，不需要备份目录和日志文件
+    merger = BookmarkMerger(logger=quiet_logger())
+
+    per_item = []
+    for count in sizes:
+        # 文件夹数量和宽度随规模增长，线性扫描会表现为平方级
+        folder_count = max(count // 20, 1)
+        elapsed = time_placement(merger, count, folder_count, fanout=50)
+        per_item.append(elapsed / count)
+        print(f"{count:>8} 个书签  {elapsed * 1000:9.1f} ms  {elapsed / count * 1e6:7.2f} µs/条")
+
+    ratio = max(per_item) / min(per_item)
+    print(f"单条耗时比值: {ratio:.2f} (上限 {args.max_ratio})")
+    if ratio > args.max_ratio:
+        print("❌ 放置耗时不再随数量线性增长")
+        return 1
+    print("✅ 放置耗时随数量线性增长")
+    return 0
+
+
+def quiet_logger():
+    """不输出的 logger，基准中不写日志文件"""
+    logger = logging.getLogger('bookmark_bench.quiet')
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    return logger
+
+
+def random_scenario(rng, size):
+    """随机的一对小书签文件（名称、URL 和文件夹有重叠，包括重复 URL 和 http/https 变体）"""
+    def random_tree():
+        counter = [0]
+
+        def folder(depth):
+            children = []
+            for _ in range(rng.randrange(size)):
+                if depth < 3 and rng.random() < 0.2:
+                    children.append(folder(depth + 1) | {'name': f'文件夹 {rng.randrange(4)}'})
+                else:
+                    counter[0] += 1
+                    scheme = rng.choice(('http', 'https'))
+                    children.append({'id': str(counter[0]), 'name': f'页面 {counter[0]}', 'type': 'url',
+                                     'url': f'{scheme}://site{rng.randrange(size * 2)}.example/'})
+            return {'children': children, 'id': '0', 'type': 'folder'}
+
+        return {'roots': {'bookmark_bar': folder(0) | {'name': '书签栏', 'id': '1'},
+                          'other': folder(0) | {'name': '其他书签', 'id': '2'}}, 'version': 1}
+
+    return random_tree(), random_tree()
+
+
+def url_keys(tree, url_key):
+    return {url_key(node.url) for _, root in iter_roots(tree) for _, node in iter_bookmarks(root) if node.url}
+
+
+def run_scenarios(args):
+    """在内存中运行随机同步场景，检查：源书签都在目标中、原有书签不丢、再次同步没有变更"""
+    rng = random.Random(args.seed)
+    logger = quiet_logger()
+    clock = lambda: 1700000000.0
+    url_key = BookmarkMerger().url_key
+    failures = 0
+    start = time.perf_counter()
+    for i in range(args.count):
+        source, target = random_scenario(rng, args.size)
+        storage = MemoryStorage({'Atlas': json.dumps(source).encode('utf-8'),
+                                 'Chrome': json.dumps(target).encode('utf-8')})
+        before = BookmarkFile.from_json(target)
+        result = sync_files(storage, 'Atlas', 'Chrome', logger=logger, clock=clock)
+        after = url_keys(result.target, url_key)
+        again = sync_files(storage, 'Atlas', 'Chrome', logger=logger, clock=clock)
+        problems = []
+        if not url_keys(BookmarkFile.from_json(source), url_key) <= after:
+            problems.append("源书签没有全部添加")
+        if not url_keys(before, url_key) <= after:
+            problems.append("目标原有书签丢失")
+        if again.changed:
+            problems.append("再次同步仍有变更")
+        if problems:
+            failures += 1
+            print(f"❌ 场景 {i}（seed {args.seed}）: {'；'.join(problems)}")
+    elapsed = time.perf_counter() - start
+    print(f"{args.count} 个场景  {elapsed:.2f} 秒  {args.count / elapsed:,.0f} 个/秒")
+    if failures:
+        print(f"❌ {failures} 个场景不满足不变量")
+        return 1
+    print("✅ 全部场景满足不变量")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="书签同步性能基准")
+    parser.add_argument('--tmpdir', help="临时目录位置（默认系统临时目录）")
+    subparsers = parser.add_subparsers(dest='command')
+
+    placement = subparsers.add_parser('placement', help="放置新书签的线性增长回归检查（默认）")
+    placement.add_argument('--sizes', default='2000,4000,8000,16000', help="新书签数量，逗号分隔")
+    placement.add_argument('--max-ratio', type=float, default=3.0, help="最大/最小单条耗时的允许比值")
+
+    suite = subparsers.add_parser('suite', help="用合成书签分阶段测量同步")
+    suite.add_argument('--sizes', default='1k,10k,100k', help="节点总数，逗号分隔，如 1k,10k,100k,1m")
+    suite.add_argument('--depth', type=int, default=4, help="文件夹层数")
+    suite.add_argument('--fanout', type=int, default=20, help="每个文件夹的平均子节点数")
+    suite.add_argument('--overlap', type=float, default=0.9, help="两边共有 URL 的比例")
+    suite.add_argument('--unicode', action='store_true', help="使用多语言/emoji 名称")
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--syncers', default='v1,v2', help="要测量的同步器：v1,v2")
+    suite.add_argument('--memory', action='store_true', help="用 tracemalloc 记录各阶段峰值内存（会变慢）")
+    suite.add_argument('--json', action='store_true', help="每个结果输出一行 JSON")
+
+    scenarios = subparsers.add_parser('scenarios', help="在内存中运行随机同步场景并检查不变量")
+    scenarios.add_argument('--count', type=int, default=2000, help="场景数量")
+    scenarios.add_argument('--size', type=int, default=6, help="每个文件夹最多的子节点数")
+    scenarios.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'suite':
+        run_suite(args)
+        return 0
+    if args.command == 'scenarios':
+        return run_scenarios(args)
+    if args.command is None:
+        args = parser.parse_args(sys.argv[1:] + ['placement'])
+    return run_placement(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
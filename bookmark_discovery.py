@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Atlas 书签文件定位
+上次找到的位置缓存在状态目录中，启动时只 stat 一次；缓存失效时才重新查找，
+查找只进入名称像 Atlas 的应用目录，并限制目录深度
+"""
+
+import glob
+import json
+import os
+from pathlib import Path
+
+from bookmark_io import write_json_atomic
+
+APP_SUPPORT = Path.home() / "Library/Application Support"
+
+# Application Support 下名称包含这些关键字的目录才会进入
+APP_KEYWORDS = ('atlas', 'openai')
+
+# 应用目录下已知的书签位置，按优先级排列（可以包含通配符）
+KNOWN_LAYOUTS = (
+    "browser-data/host/user-*/Bookmarks",
+    "Default/Bookmarks",
+    "Bookmarks",
+    "Atlas/Bookmarks",
+    "Atlas/Default/Bookmarks",
+)
+
+# 已知位置都不存在时，在应用目录下查找 Bookmarks 的最大深度
+MAX_DEPTH = 4
+
+CACHE_VERSION = 1
+
+
+def app_dirs(app_support=APP_SUPPORT):
+    """Application Support 下可能属于 Atlas 的目录（只读取目录项名称，不 stat 其他应用）"""
+    try:
+        with os.scandir(app_support) as entries:
+            dirs = [Path(entry.path) for entry in entries
+                    if any(keyword in entry.name.lower() for keyword in APP_KEYWORDS) and entry.is_dir()]
+    except OSError:
+        return []
+    # 名称包含 atlas 的优先
+    return sorted(dirs, key=lambda path: ('atlas' not in path.name.lower(), path.name))
+
+
+def _newest(paths):
+    """多个用户目录时取最近修改的书签文件"""
+    best, best_mtime = None, None
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        if best_mtime is None or mtime > best_mtime:
+            best, best_mtime = Path(path), mtime
+    return best
+
+
+def scan_bookmarks(root, max_depth=MAX_DEPTH):
+    """在 root 下最多 max_depth 层目录中查找名为 Bookmarks 的文件（不跟随符号链接）"""
+    found = []
+    stack = [(root, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth < max_depth:
+                            stack.append((entry.path, depth + 1))
+                    elif entry.name == 'Bookmarks' and entry.is_file():
+                        found.append(entry.path)
+        except OSError:
+            continue
+    return _newest(found)
+
+
+def discover_atlas_bookmarks(app_support=APP_SUPPORT, max_depth=MAX_DEPTH):
+    """查找 Atlas 书签文件，找不到时返回 None"""
+    dirs = app_dirs(app_support)
+    for app_dir in dirs:
+        for layout in KNOWN_LAYOUTS:
+            pattern = os.path.join(glob.escape(str(app_dir)), layout)
+            match = _newest(glob.glob(pattern))
+            if match:
+                return match
+    for app_dir in dirs:
+        match = scan_bookmarks(app_dir, max_depth)
+        if match:
+            return match
+    return None
+
+
+class AtlasLocator:
+    """带缓存的 Atlas 书签定位"""
+
+    def __init__(self, state_dir, app_support=APP_SUPPORT):
+        self.cache_path = Path(state_dir) / "atlas_location.json"
+        self.app_support = Path(app_support)
+
+    def cached(self):
+        """缓存的位置仍然是文件时返回它（一次 stat）"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION or not data.get('path'):
+            return None
+        path = Path(data['path'])
+        return path if path.is_file() else None
+
+    def remember(self, path):
+        try:
+            write_json_atomic(self.cache_path, {'version': CACHE_VERSION, 'path': str(path)}, fsync=False)
+        except OSError:
+            pass
+
+    def locate(self, known_paths=()):
+        """依次尝试缓存、known_paths 和重新查找；找到后更新缓存"""
+        path = self.cached()
+        if path:
+            return path
+        for candidate in known_paths:
+            if Path(candidate).is_file():
+                path = Path(candidate)
+                break
+        else:
+            path = discover_atlas_bookmarks(self.app_support)
+        if path:
+            self.remember(path)
+        return path
+
+    def hints(self):
+        """找不到书签时提示可能的应用目录"""
+        return app_dirs(self.app_support)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+书签导入导出格式
+- Netscape 书签 HTML（各浏览器“导出书签”使用的格式）
+- CSV：name, url, folder, date_added
+导出为逐段产出文本的生成器，导入为逐个产出 (文件夹路径, 书签节点) 的生成器，都不在内存中拼出整个文件
+"""
+
+import csv
+from html import escape
+from html.parser import HTMLParser
+
+from bookmark_model import URL, BookmarkNode
+from bookmark_tree import iter_roots
+
+# 导入时书签所在的根节点名称（与 ROOT_MAPPING 中的英文名称一致）
+BOOKMARK_BAR = 'Bookmarks bar'
+OTHER_BOOKMARKS = 'Other bookmarks'
+
+CSV_FIELDS = ('name', 'url', 'folder', 'date_added')
+
+# DictReader 存放多余字段的键
+_EXTRA_FIELDS = object()
+
+# Chromium 时间戳为 1601-01-01 起的微秒数
+_EPOCH_DELTA = 11644473600
+
+
+def chromium_to_unix(value):
+    """Chromium 时间戳转为 Unix 秒，无法转换时返回 None"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value // 1000000 - _EPOCH_DELTA if value > 0 else None
+
+
+def unix_to_chromium(value):
+    """Unix 秒转为 Chromium 时间戳，无法转换时返回 None"""
+    try:
+        value = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return (value + _EPOCH_DELTA) * 1000000 if value > 0 else None
+
+
+def _date_attr(node):
+    seconds = chromium_to_unix(node.date_added)
+    return f' ADD_DATE="{seconds}"' if seconds is not None else ''
+
+
+def iter_netscape_html(data, title="Bookmarks"):
+    """把 BookmarkFile 导出为 Netscape 书签 HTML，逐段产出文本
+
+    与 Chrome 的导出一致：书签栏是带 PERSONAL_TOOLBAR_FOLDER 的文件夹，其他书签直接放在顶层。
+    """
+    yield ('<!DOCTYPE NETSCAPE-Bookmark-file-1>\n'
+           '<!-- This is an automatically generated file.\n'
+           '     It will be read and overwritten.\n'
+           '     DO NOT EDIT! -->\n'
+           '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+           f'<TITLE>{escape(title)}</TITLE>\n'
+           f'<H1>{escape(title)}</H1>\n'
+           '<DL><p>\n')
+    for root_key, root in iter_roots(data):
+        children = root.children or []
+        if root_key == 'other':
+            depth = 1
+        elif children:
+            attrs = ' PERSONAL_TOOLBAR_FOLDER="true"' if root_key == 'bookmark_bar' else ''
+            yield f'    <DT><H3{_date_attr(root)}{attrs}>{escape(root.name)}</H3>\n    <DL><p>\n'
+            depth = 2
+        else:
+            continue
+        # 先序遍历，栈中保存 (子节点迭代器, 缩进层级)；文件夹遍历完时输出结束标签
+        stack = [(iter(children), depth)]
+        while stack:
+            items, level = stack[-1]
+            node = next(items, None)
+            indent = '    ' * level
+            if node is None:
+                stack.pop()
+                if level > 1:
+                    yield f"{'    ' * (level - 1)}</DL><p>\n"
+                continue
+            if node.type == URL:
+                yield (f'{indent}<DT><A HREF="{escape(node.url or "")}"{_date_attr(node)}>'
+                       f'{escape(node.name)}</A>\n')
+            elif node.children is not None:
+                yield f'{indent}<DT><H3{_date_attr(node)}>{escape(node.name)}</H3>\n{indent}<DL><p>\n'
+                stack.append((iter(node.children), level + 1))
+    yield '</DL><p>\n'
+
+
+def iter_csv_rows(data):
+    """逐行产出 CSV 行 (name, url, folder, date_added)；folder 为从根节点名称开始的路径"""
+    for _, root in iter_roots(data):
+        stack = [(iter(root.children or []), root.name)]
+        while stack:
+            items, folder = stack[-1]
+            node = next(items, None)
+            if node is None:
+                stack.pop()
+            elif node.type == URL:
+                seconds = chromium_to_unix(node.date_added)
+                yield node.name, node.url or '', folder, '' if seconds is None else seconds
+            elif node.children is not None:
+                stack.append((iter(node.children), f"{folder}/{node.name}"))
+
+
+def write_export(f, data, fmt):
+    """把 BookmarkFile 以 fmt（html / csv）格式写入文本流，返回导出的书签数"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for row in iter_csv_rows(data):
+            writer.writerow(row)
+            count += 1
+    else:
+        for chunk in iter_netscape_html(data):
+            f.write(chunk)
+            count += chunk.count('<DT><A ')
+    return count
+
+
+class _NetscapeParser(HTMLParser):
+    """增量解析 Netscape 书签 HTML，解析出的书签放入 records 等待取走"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        # 当前所在的文件夹路径（导入后的根节点名称在最前）；DL 栈中保存进入每层之前的路径
+        self.path = ()
+        self.dl_stack = []
+        self.pending_folder = None
+        self.text = None
+        self.link = None
+        self.folder_attrs = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.link = dict(attrs)
+            self.text = []
+        elif tag == 'h3':
+            self.folder_attrs = dict(attrs)
+            self.text = []
+        elif tag == 'dl':
+            self.dl_stack.append(self.path)
+            if self.pending_folder is not None:
+                self.path = self.pending_folder
+                self.pending_folder = None
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.link is not None:
+            url = self.link.get('href')
+            if url:
+                name = ''.join(self.text).strip()
+                date_added = unix_to_chromium(self.link.get('add_date'))
+                self.records.append((self.path or (OTHER_BOOKMARKS,),
+                                     BookmarkNode(URL, name, url, date_added=date_added)))
+            self.link = None
+            self.text = None
+        elif tag == 'h3' and self.folder_attrs is not None:
+            name = ''.join(self.text).strip()
+            attrs = self.folder_attrs
+            if self.path:
+                self.pending_folder = self.path + (name,)
+            elif 'personal_toolbar_folder' in attrs:
+                self.pending_folder = (BOOKMARK_BAR,)
+            elif 'unfiled_bookmarks_folder' in attrs:
+                self.pending_folder = (OTHER_BOOKMARKS,)
+            else:
+                # 顶层的普通文件夹放到“其他书签”下
+                self.pending_folder = (OTHER_BOOKMARKS, name)
+            self.folder_attrs = None
+            self.text = None
+        elif tag == 'dl' and self.dl_stack:
+            self.path = self.dl_stack.pop()
+
+    def handle_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+
+def iter_netscape_bookmarks(file_path, chunk_size=64 * 1024):
+    """流式读取 Netscape 书签 HTML，逐个产出 (文件夹路径, 书签节点)"""
+    parser = _NetscapeParser()
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            parser.feed(chunk)
+            if parser.records:
+                yield from parser.records
+                parser.records = []
+    parser.close()
+    yield from parser.records
+
+
+def iter_csv_bookmarks(file_path):
+    """流式读取 CSV，逐个产出 (文件夹路径, 书签节点)
+
+    需要 url 列；name（或 title）、folder（或 path，用 / 分隔，第一级为根节点名称）、
+    date_added（Unix 秒）可选。没有 folder 时放到“其他书签”。字段数多于表头的行视为格式错误，抛出 csv.Error。
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f, restkey=_EXTRA_FIELDS)
+        for row in reader:
+            if _EXTRA_FIELDS in row:
+                raise csv.Error(f"第 {reader.line_num} 行的字段数多于表头")
+            row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+            url = row.get('url')
+            if not url:
+                continue
+            folder = row.get('folder') or row.get('path') or ''
+            path = tuple(part for part in folder.split('/') if part) or (OTHER_BOOKMARKS,)
+            name = row.get('name') or row.get('title') or url
+            yield path, BookmarkNode(URL, name, url, date_added=unix_to_chromium(row.get('date_added')))
+
+
+def guess_format(file_path):
+    """按扩展名判断格式：.csv 为 CSV，其他为 HTML"""
+    return 'csv' if str(file_path).lower().endswith('.csv') else 'html'
+
+
+def iter_import(file_path, fmt=None):
+    """按格式读取导入文件，逐个产出 (文件夹路径, 书签节点)"""
+    fmt = fmt or guess_format(file_path)
+    if fmt == 'csv':
+        return iter_csv_bookmarks(file_path)
+    return iter_netscape_bookmarks(file_path)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+书签文件读写工具
+- 原子写入：写入同目录下唯一命名的临时文件，fsync 后改名替换（也可以边生成边写入）
+- 流式读取：逐个产出书签记录，不在内存中构建整棵树
+"""
+
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from json.decoder import scanstring
+from pathlib import Path
+
+
+def fsync_dir(dir_path):
+    """把目录项的变化（改名）刷到磁盘"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(file_path, fsync=True, mode=None, text=False):
+    """以原子写入方式打开文件：写入临时文件，with 正常结束时改名替换，出错时删除临时文件
+
+    mode 为新文件的权限（默认沿用 mkstemp 的 0600）；text 为真时得到 UTF-8 文本流。
+    多个进程同时写入也不会互相覆盖临时文件。
+    """
+    file_path = Path(file_path)
+    fd, temp_name = tempfile.mkstemp(prefix=file_path.name + '.', suffix='.tmp', dir=file_path.parent)
+    try:
+        if mode is not None:
+            os.fchmod(fd, mode)
+        if text:
+            f = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+        else:
+            f = os.fdopen(fd, 'wb')
+        with f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_name, file_path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        fsync_dir(file_path.parent)
+
+
+def atomic_write_bytes(file_path, data, fsync=True, mode=None):
+    """原子写入二进制内容，返回写入的字节数"""
+    with atomic_open(file_path, fsync, mode) as f:
+        f.write(data)
+    return len(data)
+
+
+def write_json_atomic(file_path, data, indent=None, fsync=True):
+    """原子写入 JSON 文件，返回写入的字节数"""
+    if indent is None:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=indent)
+    return atomic_write_bytes(file_path, text.encode('utf-8'), fsync)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SCALAR = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+def iter_json_events(f, chunk_size=64 * 1024):
+    """从文本流中逐个产出 JSON 事件
+
+    事件为 (类型, 值)：start_map / end_map / start_array / end_array / key / value。
+    内存只与单个字符串的长度和嵌套深度有关。
+    """
+    buf = f.read(chunk_size)
+    pos = 0
+    eof = not buf
+    containers = []
+    expect_key = False
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        need_more = pos >= len(buf)
+
+        if not need_more:
+            ch = buf[pos]
+            if ch == '"':
+                try:
+                    value, end = scanstring(buf, pos + 1)
+                except ValueError:
+                    if eof:
+                        raise
+                    need_more = True
+                else:
+                    pos = end
+                    if expect_key:
+                        expect_key = False
+                        yield 'key', value
+                    else:
+                        yield 'value', value
+            elif ch == '{':
+                pos += 1
+                containers.append('m')
+                expect_key = True
+                yield 'start_map', None
+            elif ch == '}':
+                pos += 1
+                containers.pop()
+                expect_key = False
+                yield 'end_map', None
+            elif ch == '[':
+                pos += 1
+                containers.append('a')
+                yield 'start_array', None
+            elif ch == ']':
+                pos += 1
+                containers.pop()
+                yield 'end_array', None
+            elif ch == ',':
+                pos += 1
+                expect_key = bool(containers) and containers[-1] == 'm'
+            elif ch == ':':
+                pos += 1
+            else:
+                match = _SCALAR.match(buf, pos)
+                if not match or (match.end() == len(buf) and not eof):
+                    # 数字或字面量可能被分块截断
+                    if eof:
+                        raise ValueError(f"无效的 JSON（位置 {pos}）")
+                    need_more = True
+                else:
+                    token = match.group()
+                    pos = match.end()
+                    if token in _LITERALS:
+                        yield 'value', _LITERALS[token]
+                    elif '.' in token or 'e' in token or 'E' in token:
+                        yield 'value', float(token)
+                    else:
+                        yield 'value', int(token)
+
+        if need_more:
+            if eof:
+                if containers:
+                    raise ValueError("JSON 不完整")
+                return
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+class FolderRef:
+    """流式读取时的文件夹引用；Chromium 把 name 写在 children 之后，名称在文件夹读完后才确定"""
+
+    __slots__ = ('parent', 'name')
+
+    def __init__(self, parent, name=''):
+        self.parent = parent
+        self.name = name
+
+    def path(self):
+        """从根节点名称开始的文件夹路径"""
+        parts = []
+        folder = self
+        while folder is not None:
+            parts.append(folder.name)
+            folder = folder.parent
+        return tuple(reversed(parts))
+
+
+class StreamedBookmark:
+    """流式读取得到的书签记录"""
+
+    __slots__ = ('folder', 'url', 'name', 'date_added')
+
+    def __init__(self, folder, url, name, date_added):
+        self.folder = folder
+        self.url = url
+        self.name = name
+        self.date_added = date_added
+
+    @property
+    def path(self):
+        """所在文件夹路径（读完整个文件后才完整）"""
+        return self.folder.path() if self.folder is not None else ()
+
+
+class _MapFrame:
+    __slots__ = ('is_node', 'is_roots', 'parent_folder', 'folder', 'fields', 'key')
+
+    def __init__(self, is_node, is_roots, parent_folder):
+        self.is_node = is_node
+        self.is_roots = is_roots
+        self.parent_folder = parent_folder
+        self.folder = None
+        self.fields = {} if is_node else None
+        self.key = None
+
+
+_NODE_FIELDS = frozenset(('type', 'url', 'name', 'date_added'))
+
+
+def iter_bookmark_records(file_path, chunk_size=64 * 1024):
+    """流式读取 Chromium 书签文件，逐个产出 StreamedBookmark
+
+    只保留每个书签的 URL、名称、添加时间和所在文件夹引用，不构建整棵树。
+    记录的 path 要等所在文件夹读完后才完整，需要路径的调用方应在迭代结束后再读取。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stack = []
+        for event, value in iter_json_events(f, chunk_size):
+            if event == 'key':
+                stack[-1].key = value
+            elif event == 'value':
+                top = stack[-1] if stack else None
+                if isinstance(top, _MapFrame) and top.is_node and top.key in _NODE_FIELDS:
+                    top.fields[top.key] = value
+                    if top.key == 'name' and top.folder is not None:
+                        top.folder.name = value
+            elif event == 'start_map':
+                parent = stack[-1] if stack else None
+                if isinstance(parent, FolderRef):
+                    # children 数组中的节点
+                    stack.append(_MapFrame(True, False, parent))
+                elif isinstance(parent, _MapFrame) and parent.is_roots:
+                    # 根节点
+                    stack.append(_MapFrame(True, False, None))
+                else:
+                    is_roots = len(stack) == 1 and parent is not None and parent.key == 'roots'
+                    stack.append(_MapFrame(False, is_roots, None))
+            elif event == 'end_map':
+                frame = stack.pop()
+                if frame.is_node:
+                    fields = frame.fields
+                    if fields.get('type') == 'url' and fields.get('url'):
+                        yield StreamedBookmark(frame.parent_folder, fields['url'],
+                                               fields.get('name', ''), fields.get('date_added'))
+            elif event == 'start_array':
+                top = stack[-1] if stack else None
+                if isinstance(top, _MapFrame) and top.is_node and top.key == 'children':
+                    # 文件夹的子节点数组，用文件夹引用作为栈帧
+                    top.folder = FolderRef(top.parent_folder, top.fields.get('name', ''))
+                    stack.append(top.folder)
+                else:
+                    stack.append(None)
+            elif event == 'end_array':
+                stack.pop()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+三方合并
+上次同步后两边共有的书签保存为紧凑的基准快照（规范 URL 摘要 -> 文件夹路径、名称）；
+每边与基准比较得到变更日志（添加、删除、移动、改名），只把对方的变更应用到这一边，删除也会同步
+"""
+
+import base64
+import time
+
+from bookmark_formats import _EPOCH_DELTA
+from bookmark_model import FOLDER, URL, BookmarkNode
+
+SNAPSHOT_VERSION = 1
+
+ADD = 'add'
+REMOVE = 'remove'
+MOVE = 'move'
+RENAME = 'rename'
+
+
+class Snapshot:
+    """书签树的紧凑形式；文件夹路径以根节点键开头，如 ('bookmark_bar', '工作')"""
+
+    __slots__ = ('folders', 'bookmarks', 'nodes', 'duplicates')
+
+    def __init__(self, folders=None, bookmarks=None, nodes=None, duplicates=None):
+        # 文件夹路径集合（包括根节点本身）
+        self.folders = folders if folders is not None else set()
+        # 索引键 -> (文件夹路径, 名称)，重复的书签保留第一个
+        self.bookmarks = bookmarks if bookmarks is not None else {}
+        # 索引键 -> 书签节点（只在从书签树生成时有，添加书签时复制其字段）
+        self.nodes = nodes if nodes is not None else {}
+        # 有多个副本的索引键；删除这些书签时要删掉接收一方的所有副本
+        self.duplicates = duplicates if duplicates is not None else set()
+
+    @classmethod
+    def from_tree(cls, data, url_key, roots=None):
+        """非递归遍历书签文件生成快照；roots 限定参与同步的根节点"""
+        folders = set()
+        bookmarks = {}
+        nodes = {}
+        duplicates = set()
+        for root_key, root in data.roots.items():
+            if roots is not None and root_key not in roots:
+                continue
+            stack = [(root, None)]
+            while stack:
+                node, parent_path = stack.pop()
+                if node.type == URL:
+                    if node.url:
+                        key = url_key(node.url)
+                        if key not in bookmarks:
+                            bookmarks[key] = (parent_path, node.name)
+                            nodes[key] = node
+                        else:
+                            duplicates.add(key)
+                    continue
+                children = node.children
+                if children is None:
+                    continue
+                path = (root_key,) if parent_path is None else parent_path + (node.name,)
+                folders.add(path)
+                for i in range(len(children) - 1, -1, -1):
+                    stack.append((children[i], path))
+        return cls(folders, bookmarks, nodes, duplicates)
+
+    def common(self, other):
+        """两边都有的文件夹和书签（位置取自 self），作为下次同步的基准"""
+        bookmarks = {key: entry for key, entry in self.bookmarks.items() if key in other.bookmarks}
+        duplicates = {key for key in self.duplicates | other.duplicates if key in bookmarks}
+        return Snapshot(self.folders & other.folders, bookmarks, duplicates=duplicates)
+
+    def to_json(self, rules=None):
+        # 文件夹路径只保存一次，书签引用其序号；索引键拼接后整体 base64
+        folders = sorted(self.folders)
+        numbers = {path: i for i, path in enumerate(folders)}
+        keys = list(self.bookmarks)
+        return {
+            'version': SNAPSHOT_VERSION,
+            'rules': rules,
+            'folders': [list(path) for path in folders],
+            'keys': base64.b64encode(b''.join(keys)).decode('ascii'),
+            'key_size': len(keys[0]) if keys else 0,
+            'bookmarks': [[numbers[self.bookmarks[key][0]], self.bookmarks[key][1]] for key in keys],
+            'duplicates': [i for i, key in enumerate(keys) if key in self.duplicates],
+        }
+
+    @classmethod
+    def from_json(cls, data, rules=None):
+        """读取保存的快照；版本或 URL 规范化选项不一致时返回 None"""
+        if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION or data.get('rules') != rules:
+            return None
+        try:
+            folders = [tuple(path) for path in data['folders']]
+            blob = base64.b64decode(data['keys'])
+            size = data['key_size']
+            bookmarks = {}
+            for i, (number, name) in enumerate(data['bookmarks']):
+                bookmarks[blob[i * size:(i + 1) * size]] = (folders[number], name)
+            duplicates = {blob[i * size:(i + 1) * size] for i in data.get('duplicates', ())}
+        except (KeyError, TypeError, ValueError, IndexError):
+            return None
+        return cls(set(folders), bookmarks, duplicates=duplicates)
+
+
+class JournalEntry:
+    """一个书签的变更；路径为变更一方当前的文件夹路径"""
+
+    __slots__ = ('op', 'key', 'path', 'name', 'old_path', 'node')
+
+    def __init__(self, op, key, path, name=None, old_path=None, node=None):
+        self.op = op
+        self.key = key
+        self.path = path
+        self.name = name
+        # 变更前所在的文件夹（移动、改名、删除时）
+        self.old_path = old_path
+        self.node = node
+
+
+def _translate(path, renames):
+    """按文件夹改名表 {旧路径: 新路径} 换算路径（最长前缀优先）"""
+    if not renames or path is None:
+        return path
+    for i in range(len(path), 0, -1):
+        new = renames.get(path[:i])
+        if new is not None:
+            return new + path[i:]
+    return path
+
+
+class Journal:
+    """一边相对基准的变更日志"""
+
+    def __init__(self):
+        # 文件夹改名 {基准路径: 当前路径}
+        self.folder_renames = {}
+        self.folder_adds = []
+        self.folder_removes = []
+        # 索引键 -> JournalEntry
+        self.bookmarks = {}
+        # 这一边当前有多个副本的索引键（只在比较过时有）
+        self.duplicates = set()
+
+    def __len__(self):
+        return len(self.folder_renames) + len(self.folder_adds) + len(self.folder_removes) + len(self.bookmarks)
+
+    def translate(self, path):
+        """基准中的路径在这一边的当前路径"""
+        return _translate(path, self.folder_renames)
+
+    def counts(self):
+        """各类变更的数量，用于日志"""
+        counts = {}
+        for entry in self.bookmarks.values():
+            counts[entry.op] = counts.get(entry.op, 0) + 1
+        for op, items in (('folder_rename', self.folder_renames), ('folder_add', self.folder_adds),
+                          ('folder_remove', self.folder_removes)):
+            if items:
+                counts[op] = len(items)
+        return counts
+
+    def describe(self):
+        """逐行产出可读的变更描述"""
+        for old, new in self.folder_renames.items():
+            yield f"~ 📁 {'/'.join(old)} -> {new[-1]}"
+        for path in self.folder_adds:
+            yield f"+ 📁 {'/'.join(path)}"
+        for entry in self.bookmarks.values():
+            location = '/'.join(entry.path or entry.old_path)
+            symbol = {ADD: '+', REMOVE: '-', MOVE: '→', RENAME: '~'}[entry.op]
+            yield f"{symbol} 🔖 {location}: {entry.name}"
+        for path in self.folder_removes:
+            yield f"- 📁 {'/'.join(path)}"
+
+    @classmethod
+    def diff(cls, base, current):
+        """current 相对 base 的变更；同一父文件夹下内容大体相同的“删除 + 新建”文件夹视为改名"""
+        journal = cls()
+        journal.duplicates = current.duplicates
+        renames = journal.folder_renames
+        removed = base.folders - current.folders
+        added = current.folders - base.folders
+
+        if removed and added:
+            # 只为涉及的文件夹统计直接包含的书签
+            base_children = {path: set() for path in removed}
+            for key, (path, _) in base.bookmarks.items():
+                if path in base_children:
+                    base_children[path].add(key)
+            current_children = {path: set() for path in added}
+            for key, (path, _) in current.bookmarks.items():
+                if path in current_children:
+                    current_children[path].add(key)
+            for old in sorted(removed, key=len):
+                if journal.translate(old) in current.folders:
+                    continue
+                parent = journal.translate(old[:-1])
+                best, best_score = None, 0
+                for new in added:
+                    if len(new) == len(old) and new[:-1] == parent and new not in renames.values():
+                        score = len(base_children[old] & current_children[new])
+                        if score > best_score:
+                            best, best_score = new, score
+                if best and best_score * 2 >= max(len(base_children[old]), len(current_children[best])):
+                    renames[old] = best
+
+        moved_folders = {journal.translate(path) for path in base.folders}
+        journal.folder_adds = sorted((path for path in added if path not in moved_folders), key=len)
+        journal.folder_removes = sorted((journal.translate(path) for path in removed
+                                         if path not in renames and journal.translate(path) not in current.folders),
+                                        key=len, reverse=True)
+
+        entries = journal.bookmarks
+        for key, (path, name) in current.bookmarks.items():
+            previous = base.bookmarks.get(key)
+            if previous is None:
+                entries[key] = JournalEntry(ADD, key, path, name, node=current.nodes.get(key))
+                continue
+            old_path = journal.translate(previous[0])
+            if old_path != path:
+                entries[key] = JournalEntry(MOVE, key, path, name, old_path, current.nodes.get(key))
+            elif name != previous[1]:
+                entries[key] = JournalEntry(RENAME, key, path, name, old_path, current.nodes.get(key))
+        for key, (path, name) in base.bookmarks.items():
+            if key not in current.bookmarks:
+                entries[key] = JournalEntry(REMOVE, key, None, name, journal.translate(path))
+        return journal
+
+
+class ThreeWayMerge:
+    """合并两边相对同一基准的变更日志，得到应用到每一边的变更和新的基准
+
+    同一个书签两边都改了时：一边删除、另一边修改则保留修改；都修改则以较新的一边（chrome_wins）为准。
+    """
+
+    def __init__(self, base, chrome, atlas, chrome_wins):
+        self.base = base
+        self.chrome = chrome
+        self.atlas = atlas
+        self.to_chrome = Journal()
+        self.to_atlas = Journal()
+        self.chrome_applied = {}
+        self.atlas_applied = {}
+        # 任一边可能有多个副本的书签（基准中记录的，以及这次比较时发现的）
+        self.duplicates = base.duplicates | chrome.duplicates | atlas.duplicates
+
+        # 文件夹改名：两边都改了同一个文件夹时以较新的一边为准
+        winner, loser = (chrome, atlas) if chrome_wins else (atlas, chrome)
+        self.final = dict(loser.folder_renames)
+        self.final.update(winner.folder_renames)
+        for side, incoming in ((chrome, self.to_chrome), (atlas, self.to_atlas)):
+            for old, new in self.final.items():
+                current = side.folder_renames.get(old, old)
+                if current != new:
+                    incoming.folder_renames[current] = new
+        # 各边的当前路径 -> 合并后的路径
+        self.chrome_map = {chrome.folder_renames.get(old, old): new for old, new in self.final.items()}
+        self.atlas_map = {atlas.folder_renames.get(old, old): new for old, new in self.final.items()}
+
+        to_chrome, to_atlas = self.to_chrome, self.to_atlas
+        chrome_map, atlas_map = self.chrome_map, self.atlas_map
+        to_chrome.folder_adds = [_translate(path, atlas_map) for path in atlas.folder_adds]
+        to_atlas.folder_adds = [_translate(path, chrome_map) for path in chrome.folder_adds]
+        to_chrome.folder_removes = [_translate(path, atlas_map) for path in atlas.folder_removes]
+        to_atlas.folder_removes = [_translate(path, chrome_map) for path in chrome.folder_removes]
+
+        for key in chrome.bookmarks.keys() | atlas.bookmarks.keys():
+            c = chrome.bookmarks.get(key)
+            a = atlas.bookmarks.get(key)
+            if a is None:
+                to_atlas.bookmarks[key] = self._send(c, chrome_map, atlas, atlas_map)
+            elif c is None:
+                to_chrome.bookmarks[key] = self._send(a, atlas_map, chrome, chrome_map)
+            elif a.op == REMOVE and c.op == REMOVE:
+                continue
+            elif a.op == REMOVE:
+                # 一边删除、另一边修改：保留修改，在删除的一边重新添加
+                to_atlas.bookmarks[key] = self._send(c, chrome_map, atlas, atlas_map, ADD)
+            elif c.op == REMOVE:
+                to_chrome.bookmarks[key] = self._send(a, atlas_map, chrome, chrome_map, ADD)
+            elif (_translate(c.path, chrome_map), c.name) == (_translate(a.path, atlas_map), a.name):
+                continue
+            elif chrome_wins:
+                to_atlas.bookmarks[key] = self._send(c, chrome_map, atlas, atlas_map, MOVE)
+            else:
+                to_chrome.bookmarks[key] = self._send(a, atlas_map, chrome, chrome_map, MOVE)
+
+    def _send(self, entry, origin_map, target, target_map, op=None):
+        """把一边的变更转为应用到另一边的变更：路径换算为合并后的路径，old_path 为书签在接收一方的位置"""
+        current = target.bookmarks.get(entry.key)
+        if current is not None:
+            old_path = current.path if current.op != REMOVE else None
+        else:
+            previous = self.base.bookmarks.get(entry.key)
+            old_path = target.translate(previous[0]) if previous else None
+        return JournalEntry(op or entry.op, entry.key, _translate(entry.path, origin_map), entry.name,
+                            _translate(old_path, target_map), entry.node)
+
+    def apply(self, chrome_data, atlas_data, url_key, clock=None):
+        """原地修改两边的书签，返回 (Chrome 是否变化, Atlas 是否变化)；clock 返回 Unix 秒，用于新文件夹的时间戳"""
+        chrome_editor = TreeEditor(chrome_data, url_key, self.duplicates, clock)
+        atlas_editor = TreeEditor(atlas_data, url_key, self.duplicates, clock)
+        self.chrome_applied = chrome_editor.apply(self.to_chrome)
+        self.atlas_applied = atlas_editor.apply(self.to_atlas)
+        return chrome_editor.changed, atlas_editor.changed
+
+    def unapplied(self):
+        """有变更没能应用到另一边的一方（'chrome' / 'atlas'），下次同步时需要重新比较"""
+        sides = set()
+        if not all(self.atlas_applied.values()):
+            sides.add('chrome')
+        if not all(self.chrome_applied.values()):
+            sides.add('atlas')
+        return sides
+
+    def new_base(self):
+        """应用后的基准快照；只与变更的数量有关，不需要重新遍历书签树
+
+        没能应用到另一边的书签从基准中去掉，下次同步时视为新书签重新添加，不会误删。
+        """
+        base = self.base
+        final = self.final
+        folders = {_translate(path, final) for path in base.folders} if final else set(base.folders)
+        bookmarks = ({key: (_translate(path, final), name) for key, (path, name) in base.bookmarks.items()}
+                     if final else dict(base.bookmarks))
+
+        sides = ((self.chrome, self.chrome_map, self.to_atlas, self.atlas_applied),
+                 (self.atlas, self.atlas_map, self.to_chrome, self.chrome_applied))
+        # 先处理两边的文件夹，书签所在的文件夹最后补上，不会被另一边删除同名文件夹时去掉
+        for _, _, sent, applied in sides:
+            for path in sent.folder_adds:
+                if applied.get(path):
+                    folders.add(path)
+            for path in sent.folder_removes:
+                if applied.get(path):
+                    folders.discard(path)
+        for origin, origin_map, sent, applied in sides:
+            for key, entry in origin.bookmarks.items():
+                outgoing = sent.bookmarks.get(key)
+                if outgoing is not None:
+                    if not applied.get(key):
+                        bookmarks.pop(key, None)
+                        continue
+                    entry = outgoing
+                elif key in self.to_chrome.bookmarks or key in self.to_atlas.bookmarks:
+                    # 冲突时由另一边发出的变更决定
+                    continue
+                if entry.op == REMOVE:
+                    bookmarks.pop(key, None)
+                else:
+                    path = entry.path if outgoing is not None else _translate(entry.path, origin_map)
+                    bookmarks[key] = (path, entry.name)
+                    folders.update(path[:i] for i in range(1, len(path) + 1))
+        duplicates = {key for key in self.duplicates if key in bookmarks}
+        return Snapshot(folders, bookmarks, duplicates=duplicates)
+
+
+class TreeEditor:
+    """把变更日志原地应用到 BookmarkFile；按路径查找，只访问涉及的文件夹"""
+
+    def __init__(self, data, url_key, duplicates=(), clock=None):
+        self.data = data
+        self.url_key = url_key
+        # 新文件夹时间戳使用的时钟（返回 Unix 秒），默认为系统时钟
+        self.clock = clock or time.time
+        # 可能有多个副本的索引键，删除时遍历整棵树删掉所有副本
+        self.duplicates = duplicates
+        self.folders = {}
+        # 按路径找不到书签时才建立的完整索引 {索引键: [(所在文件夹, 书签节点), ...]}
+        self._index = None
+        self.changed = False
+
+    def find_folder(self, path, create=False):
+        """路径对应的文件夹（同名文件夹取第一个）；create 时逐级创建缺失的文件夹"""
+        folder = self.folders.get(path)
+        if folder is not None:
+            return folder
+        folder = self.data.roots.get(path[0])
+        if folder is None or folder.children is None:
+            return None
+        for i, name in enumerate(path[1:], 2):
+            parent = folder
+            folder = self.folders.get(path[:i])
+            if folder is None:
+                folder = next((child for child in parent.children
+                               if child.type == FOLDER and child.name == name), None)
+            if folder is None:
+                if not create:
+                    return None
+                folder = self.new_folder(parent, name)
+            self.folders[path[:i]] = folder
+        return folder
+
+    def new_folder(self, parent, name):
+        now = int((self.clock() + _EPOCH_DELTA) * 1000000)
+        folder = BookmarkNode(FOLDER, name=name, id=self.data.ids.allocate(), date_added=now, date_modified=now,
+                              children=[], extra=(('date_last_used', '0'),))
+        parent.children.append(folder)
+        self.changed = True
+        return folder
+
+    def find_bookmark(self, key, path):
+        """(所在文件夹, 书签节点)；先在 path 中查找，找不到时遍历整棵树"""
+        url_key = self.url_key
+        folder = self.find_folder(path) if path else None
+        if folder is not None:
+            for child in folder.children:
+                if child.type == URL and child.url and url_key(child.url) == key:
+                    return folder, child
+        copies = self.find_copies(key)
+        return copies[0] if copies else (None, None)
+
+    def find_copies(self, key):
+        """整棵树中这个书签的所有副本 [(所在文件夹, 书签节点), ...]；索引在第一次调用时建立"""
+        if self._index is None:
+            url_key = self.url_key
+            index = self._index = {}
+            for root in self.data.roots.values():
+                stack = [root]
+                while stack:
+                    node = stack.pop()
+                    for child in node.children or ():
+                        if child.type == URL:
+                            if child.url:
+                                index.setdefault(url_key(child.url), []).append((node, child))
+                    for child in reversed(node.children or ()):
+                        if child.type != URL and child.children is not None:
+                            stack.append(child)
+        # 建立索引之后移走或删除的节点不再返回
+        return [(parent, node) for parent, node in self._index.get(key, ())
+                if any(child is node for child in parent.children)]
+
+    def apply(self, journal):
+        """按文件夹改名、新建文件夹、书签、删除文件夹的顺序应用，返回 {书签或文件夹: 是否成功应用}"""
+        applied = {}
+        for old, new in sorted(journal.folder_renames.items(), key=lambda item: len(item[0])):
+            folder = self.find_folder(_translate(old[:-1], journal.folder_renames) + old[-1:])
+            if folder is not None and self.find_folder(new) is None:
+                folder.name = new[-1]
+                self.folders.clear()
+                self.changed = True
+                applied[old] = True
+            else:
+                applied[old] = False
+        for path in journal.folder_adds:
+            applied[path] = self.find_folder(path, create=True) is not None
+        for key, entry in journal.bookmarks.items():
+            applied[key] = self.apply_bookmark(entry)
+        for path in journal.folder_removes:
+            applied[path] = self.remove_folder(path)
+        return applied
+
+    def apply_bookmark(self, entry):
+        if entry.old_path is None:
+            # 接收一方没有这个书签
+            parent = node = None
+        else:
+            parent, node = self.find_bookmark(entry.key, entry.old_path)
+        if entry.op == REMOVE:
+            if node is not None:
+                parent.children.remove(node)
+                self.changed = True
+            if entry.key in self.duplicates:
+                # 另一边删掉了所有副本，这一边也全部删除
+                for parent, node in self.find_copies(entry.key):
+                    parent.children.remove(node)
+                    self.changed = True
+            return True
+
+        target = self.find_folder(entry.path, create=True)
+        if target is None:
+            return False
+        if node is None:
+            source = entry.node
+            if source is None:
+                return False
+            target.children.append(BookmarkNode(URL, entry.name, source.url, id=self.data.ids.allocate(),
+                                                date_added=source.date_added, extra=source.extra))
+            self.changed = True
+            return True
+        if parent is not target:
+            parent.children.remove(node)
+            target.children.append(node)
+            self.changed = True
+        if node.name != entry.name:
+            node.name = entry.name
+            self.changed = True
+        return True
+
+    def remove_folder(self, path):
+        """删除空文件夹；另一边在其中添加了内容时保留"""
+        if len(path) < 2:
+            return False
+        parent = self.find_folder(path[:-1])
+        folder = self.find_folder(path)
+        if parent is None or folder is None:
+            return True
+        if folder.children:
+            return False
+        parent.children.remove(folder)
+        self.folders.pop(path, None)
+        self.changed = True
+        return True
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+跨进程同步锁
+用 fcntl.flock 保证同一时间只有一个进程在同步；同步期间到达的触发只登记一次，
+锁释放后合并为一次后续同步，不会排队执行 N 次完整同步
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # 没有 fcntl 的平台（Windows）不加锁
+    fcntl = None
+
+
+class SyncLock:
+    """锁文件由所有同步命令共用，待处理标记按命令区分"""
+
+    def __init__(self, lock_dir, name, lock_name="sync"):
+        lock_dir = Path(lock_dir)
+        self.lock_path = lock_dir / f"{lock_name}.lock"
+        # 存在时表示有一次尚未处理的同步请求
+        self.pending_path = lock_dir / f"{name}.pending"
+
+    @contextmanager
+    def hold(self, logger=None):
+        """持有锁；其他进程正在同步时阻塞等待"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if logger:
+                    logger.info("⏳ 另一个同步正在运行，等待其完成...")
+                start = time.monotonic()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if logger:
+                    logger.info(f"✓ 已获得同步锁（等待 {time.monotonic() - start:.1f} 秒）")
+            yield
+        finally:
+            # 关闭文件描述符即释放锁
+            os.close(fd)
+
+    def request(self):
+        """登记一次同步请求；已有未处理的请求时与之合并"""
+        self.pending_path.touch()
+
+    def take_request(self):
+        """取走未处理的请求，返回是否存在"""
+        try:
+            self.pending_path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def run(self, func, logger=None):
+        """登记请求后在锁内执行 func
+
+        等锁期间请求已被其他进程的后续同步处理时不再执行，返回 None；否则返回 func 的结果。
+        请求在执行 func 之前取走，执行期间的新触发会再登记一次，由下一个拿到锁的进程处理。
+        """
+        self.request()
+        with self.hold(logger):
+            if not self.take_request():
+                return None
+            return func()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+日志配置
+每个进程只配置一次：记录日志时只把消息放入队列，由后台线程写入文件和终端
+"""
+
+import atexit
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(log_file=None, level=logging.INFO):
+    """配置根日志：QueueHandler + 后台 QueueListener（文件和终端）
+
+    与 logging.basicConfig 一样，进程中已经配置过（或宿主程序已有处理器）时不做任何事，返回 False。
+    """
+    global _listener, _queue_handler
+    with _lock:
+        root = logging.getLogger()
+        if _listener is not None or root.handlers:
+            return False
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        if log_file is not None:
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        # 进程池的子进程退出时不执行 atexit，由 multiprocessing 的退出清理写完剩余日志
+        multiprocessing.util.Finalize(None, shutdown_logging, exitpriority=0)
+        return True
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener, _queue_handler
+    with _lock:
+        listener, _listener = _listener, None
+        handler, _queue_handler = _queue_handler, None
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def _reset_after_fork():
+    """fork 出的子进程没有后台线程，队列中的日志不会被写出：丢弃继承的配置，子进程需要重新配置"""
+    global _lock, _listener, _queue_handler
+    _lock = threading.Lock()
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
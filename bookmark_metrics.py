@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+同步指标
+记录每次同步各阶段的耗时和计数，输出为 JSON Lines，也可以写成 Prometheus textfile
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from bookmark_io import atomic_write_bytes
+
+# 每次都输出的计数器（没有发生时为 0），保证监控面板上的序列连续
+COUNTERS = ('nodes_scanned', 'bookmarks_added', 'folders_created', 'bytes_read', 'bytes_written')
+
+
+class SyncMetrics:
+    """一次同步的阶段耗时（秒）和计数器"""
+
+    def __init__(self, command, target=None):
+        self.command = command
+        # 多目标同步时的目标名称
+        self.target = target
+        self.started = time.time()
+        self._start = time.perf_counter()
+        # 阶段名称 -> 累计耗时，按首次进入的顺序排列
+        self.phases = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.success = None
+        self.duration = None
+
+    @contextmanager
+    def phase(self, name):
+        """计时一个阶段；同名阶段多次进入时累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, success):
+        self.success = bool(success)
+        self.duration = time.perf_counter() - self._start
+
+    def to_json(self):
+        data = {
+            'time': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'command': self.command,
+        }
+        if self.target is not None:
+            data['target'] = self.target
+        data.update({
+            'success': self.success,
+            'duration_seconds': round(self.duration or 0.0, 6),
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'counters': dict(self.counters),
+        })
+        return data
+
+    def write_jsonl(self, file_path):
+        """追加一行 JSON"""
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.to_json(), ensure_ascii=False) + '\n')
+
+    def labels(self):
+        if self.target is None:
+            return f'command="{escape_label(self.command)}"'
+        return f'command="{escape_label(self.command)}",target="{escape_label(self.target)}"'
+
+    def to_prometheus(self):
+        return format_prometheus([self])
+
+    def write_prometheus(self, file_path):
+        write_prometheus(file_path, [self])
+
+
+def escape_label(value):
+    """按 Prometheus 文本格式转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(runs):
+    """Prometheus 文本格式：每个同步（目标）最近一次运行的结果"""
+    lines = []
+
+    def gauge(metric, help_text, samples):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        lines.extend(f'{metric}{{{labels}}} {value}' for labels, value in samples)
+
+    gauge('bookmark_sync_last_run_timestamp_seconds', '最近一次同步的开始时间',
+          [(run.labels(), f'{run.started:.3f}') for run in runs])
+    gauge('bookmark_sync_last_success', '最近一次同步是否成功',
+          [(run.labels(), 1 if run.success else 0) for run in runs])
+    gauge('bookmark_sync_duration_seconds', '最近一次同步的总耗时',
+          [(run.labels(), f'{run.duration or 0.0:.6f}') for run in runs])
+    gauge('bookmark_sync_phase_seconds', '最近一次同步各阶段的耗时',
+          [(f'{run.labels()},phase="{escape_label(name)}"', f'{seconds:.6f}')
+           for run in runs for name, seconds in run.phases.items()])
+
+    names = []
+    for run in runs:
+        names.extend(name for name in run.counters if name not in names)
+    for name in names:
+        gauge(f'bookmark_sync_{name}', f'最近一次同步的 {name}',
+              [(run.labels(), run.counters[name]) for run in runs if name in run.counters])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(file_path, runs):
+    """原子写入 textfile collector 读取的 .prom 文件（collector 需要可读权限）"""
+    atomic_write_bytes(Path(file_path), format_prometheus(runs).encode('utf-8'), fsync=False, mode=0o644)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+书签树模型
+同步过程中使用紧凑的节点对象，只在读写文件时与 Chromium JSON 互相转换
+"""
+
+import hashlib
+import sys
+
+URL = sys.intern('url')
+FOLDER = sys.intern('folder')
+
+# 单独存放的字段，其余字段原样保存在 extra 中
+_KNOWN_FIELDS = frozenset(('type', 'id', 'name', 'url', 'date_added', 'date_modified', 'children'))
+
+# Chromium 计算 checksum 时根节点的顺序
+CHECKSUM_ROOTS = ('bookmark_bar', 'other', 'synced')
+
+
+def parse_timestamp(value):
+    """Chromium 时间戳字符串转为整数，无法转换时返回 None"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _id_value(node_id):
+    """数字 id 转为整数，其他情况返回 0"""
+    if node_id and node_id.isdigit():
+        return int(node_id)
+    return 0
+
+
+class IdAllocator:
+    """顺序分配新的节点 id，从已有的最大 id 之后开始"""
+
+    __slots__ = ('last_id',)
+
+    def __init__(self, max_id=0):
+        self.last_id = max_id
+
+    def allocate(self):
+        self.last_id += 1
+        return str(self.last_id)
+
+
+class BookmarkNode:
+    """书签或文件夹节点"""
+
+    __slots__ = ('type', 'id', 'name', 'url', 'date_added', 'date_modified', 'children', 'extra')
+
+    def __init__(self, type, name='', url=None, id=None, date_added=None, date_modified=None,
+                 children=None, extra=()):
+        self.type = type
+        self.id = id
+        self.name = name
+        self.url = url
+        # 整数时间戳；原文件中没有该字段时为 None
+        self.date_added = date_added
+        self.date_modified = date_modified
+        # 文件夹的子节点列表；书签为 None
+        self.children = children
+        # 其他字段 ((键, 值), ...)，写回时原样输出
+        self.extra = extra
+
+    @property
+    def is_folder(self):
+        return self.children is not None
+
+    @property
+    def modified_time(self):
+        """比较新旧时使用的时间：修改时间，没有时用添加时间"""
+        return self.date_modified or self.date_added or 0
+
+    def with_children(self, children):
+        """返回只替换了子节点的新节点，其余字段共用"""
+        return BookmarkNode(self.type, self.name, self.url, self.id, self.date_added,
+                            self.date_modified, children, self.extra)
+
+    @classmethod
+    def from_json(cls, data, ids=None):
+        """把 Chromium JSON 节点（含子树）转换为 BookmarkNode，非递归
+
+        传入 IdAllocator 时，同一次遍历中把它推进到子树中的最大 id 之后。
+        """
+        return cls._convert(data, ids)[0]
+
+    @classmethod
+    def _convert(cls, data, ids):
+        """转换子树，返回 (根节点, 节点数)"""
+        root = cls._from_dict(data)
+        max_id = _id_value(root.id)
+        count = 1
+        stack = [(root, data)]
+        while stack:
+            node, raw = stack.pop()
+            raw_children = raw.get('children')
+            if raw_children is None:
+                continue
+            children = node.children
+            for raw_child in raw_children:
+                if not isinstance(raw_child, dict):
+                    continue
+                child = cls._from_dict(raw_child)
+                children.append(child)
+                count += 1
+                child_id = _id_value(child.id)
+                if child_id > max_id:
+                    max_id = child_id
+                if child.children is not None:
+                    stack.append((child, raw_child))
+        if ids is not None and max_id > ids.last_id:
+            ids.last_id = max_id
+        return root, count
+
+    @classmethod
+    def _from_dict(cls, raw):
+        """转换单个节点（不含子节点）"""
+        extra = []
+        for key, value in raw.items():
+            if key not in _KNOWN_FIELDS:
+                extra.append((sys.intern(key), value))
+        date_added = parse_timestamp(raw.get('date_added'))
+        date_modified = parse_timestamp(raw.get('date_modified'))
+        # 无法解析的时间戳原样保留
+        if date_added is None and 'date_added' in raw:
+            extra.append(('date_added', raw['date_added']))
+        if date_modified is None and 'date_modified' in raw:
+            extra.append(('date_modified', raw['date_modified']))
+
+        is_folder = 'children' in raw
+        node_type = raw.get('type')
+        if node_type == URL:
+            node_type = URL
+        elif node_type == FOLDER:
+            node_type = FOLDER
+        name = raw.get('name', '')
+        if is_folder:
+            name = sys.intern(name)
+        return cls(node_type, name, raw.get('url'), raw.get('id'), date_added, date_modified,
+                   [] if is_folder else None, tuple(extra))
+
+    def _to_dict(self):
+        """转换单个节点（不含子节点），键按 Chromium 的字母顺序排列"""
+        items = list(self.extra)
+        if self.date_added is not None:
+            items.append(('date_added', str(self.date_added)))
+        if self.date_modified is not None:
+            items.append(('date_modified', str(self.date_modified)))
+        if self.id is not None:
+            items.append(('id', self.id))
+        items.append(('name', self.name))
+        if self.type is not None:
+            items.append(('type', self.type))
+        if self.url is not None:
+            items.append(('url', self.url))
+        if self.children is not None:
+            items.append(('children', None))
+        items.sort(key=lambda item: item[0])
+        return dict(items)
+
+    def to_json(self, checksum=None):
+        """转换为 Chromium JSON 节点（含子树），非递归
+
+        checksum 为 hashlib.md5 对象时，按 Chromium 的规则在同一次前序遍历中更新校验和。
+        """
+        output = []
+        stack = [(self, output)]
+        while stack:
+            node, siblings = stack.pop()
+            raw = node._to_dict()
+            siblings.append(raw)
+            if checksum is not None:
+                node._update_checksum(checksum)
+            if node.children is not None:
+                raw_children = raw['children'] = []
+                for child in reversed(node.children):
+                    stack.append((child, raw_children))
+        return output[0]
+
+    def _update_checksum(self, checksum):
+        """按 Chromium BookmarkCodec 的规则更新校验和：id、UTF-16 名称、类型和 URL"""
+        checksum.update((self.id or '').encode('utf-8'))
+        checksum.update(self.name.encode('utf-16-le'))
+        if self.type == URL:
+            checksum.update(b'url')
+            checksum.update((self.url or '').encode('utf-8'))
+        else:
+            checksum.update(b'folder')
+
+
+class BookmarkFile:
+    """整个书签文件：根节点和文件级字段（checksum、version 等）"""
+
+    __slots__ = ('roots', 'extra', 'ids', 'node_count')
+
+    def __init__(self, roots=None, extra=None, ids=None, node_count=0):
+        # 根节点键 -> BookmarkNode，保持原文件顺序
+        self.roots = roots if roots is not None else {}
+        # 其他顶层字段
+        self.extra = extra if extra is not None else {}
+        # 新节点的 id 分配器
+        self.ids = ids if ids is not None else IdAllocator()
+        # 读取时转换的节点数
+        self.node_count = node_count
+
+    @classmethod
+    def from_json(cls, data):
+        """转换整个文件，并在同一次遍历中找出最大 id"""
+        roots = {}
+        ids = IdAllocator()
+        node_count = 0
+        for root_key, root in data.get('roots', {}).items():
+            if isinstance(root, dict):
+                roots[root_key], count = BookmarkNode._convert(root, ids)
+                node_count += count
+        extra = {key: value for key, value in data.items() if key != 'roots'}
+        return cls(roots, extra, ids, node_count)
+
+    def to_json(self):
+        """转换为 Chromium JSON，同时重新计算 checksum"""
+        checksum = hashlib.md5()
+        roots = {}
+        ordered = [key for key in CHECKSUM_ROOTS if key in self.roots]
+        ordered.extend(key for key in self.roots if key not in CHECKSUM_ROOTS)
+        for root_key in ordered:
+            roots[root_key] = self.roots[root_key].to_json(checksum)
+
+        data = dict(self.extra)
+        data['checksum'] = checksum.hexdigest()
+        data['roots'] = {root_key: roots[root_key] for root_key in self.roots}
+        return dict(sorted(data.items()))
+
+    def with_roots(self, roots):
+        """返回只替换了根节点的新文件对象，文件级字段和 id 分配器共用"""
+        return BookmarkFile(roots, self.extra, self.ids, self.node_count)
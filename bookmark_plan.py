@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+同步变更集
+规划阶段只生成变更（创建文件夹、在某路径下添加书签），不读写浏览器文件；
+应用阶段按顺序重放变更，变更集也可以保存为 JSON 以后再应用
+"""
+
+import json
+from pathlib import Path
+
+from bookmark_io import write_json_atomic
+
+CHANGESET_VERSION = 1
+
+CREATE_FOLDER = 'create_folder'
+ADD_BOOKMARK = 'add_bookmark'
+
+
+class Change:
+    """一条变更；路径为 Chrome 根节点以下的文件夹名称"""
+
+    __slots__ = ('op', 'root', 'path', 'name', 'url', 'date_added')
+
+    def __init__(self, op, root, path, name=None, url=None, date_added=None):
+        self.op = op
+        self.root = root
+        self.path = tuple(path)
+        self.name = name
+        self.url = url
+        self.date_added = date_added
+
+    def describe(self):
+        """一行可读的描述"""
+        location = '/'.join((self.root,) + self.path)
+        if self.op == CREATE_FOLDER:
+            return f"+ 📁 {location}"
+        return f"+ 🔖 {location}: {self.name} <{self.url}>"
+
+    def to_json(self):
+        data = {'op': self.op, 'root': self.root, 'path': list(self.path)}
+        if self.op == ADD_BOOKMARK:
+            data['name'] = self.name
+            data['url'] = self.url
+            if self.date_added is not None:
+                data['date_added'] = str(self.date_added)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        date_added = data.get('date_added')
+        return cls(data['op'], data['root'], data.get('path', ()), data.get('name'), data.get('url'),
+                   int(date_added) if date_added else None)
+
+
+class Changeset:
+    """按顺序排列的变更，以及规划时两边文件的指纹"""
+
+    def __init__(self, changes=None, chrome_fp=None, atlas_fp=None):
+        self.changes = changes if changes is not None else []
+        # 规划时的输入指纹 {size, mtime_ns, digest}，应用时用来判断文件是否已变化
+        self.chrome_fp = chrome_fp
+        self.atlas_fp = atlas_fp
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def create_folder(self, root, path):
+        self.changes.append(Change(CREATE_FOLDER, root, path))
+
+    def add_bookmark(self, root, path, name, url, date_added=None):
+        self.changes.append(Change(ADD_BOOKMARK, root, path, name, url, date_added))
+
+    @property
+    def bookmark_count(self):
+        return sum(1 for change in self.changes if change.op == ADD_BOOKMARK)
+
+    @property
+    def folder_count(self):
+        return sum(1 for change in self.changes if change.op == CREATE_FOLDER)
+
+    def describe(self):
+        """逐行产出可读的变更描述"""
+        for change in self.changes:
+            yield change.describe()
+
+    def to_json(self):
+        return {
+            'version': CHANGESET_VERSION,
+            'chrome': self.chrome_fp,
+            'atlas': self.atlas_fp,
+            'changes': [change.to_json() for change in self.changes],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('version') != CHANGESET_VERSION:
+            raise ValueError(f"不支持的变更集版本: {data.get('version')}")
+        changes = [Change.from_json(item) for item in data.get('changes', [])]
+        return cls(changes, data.get('chrome'), data.get('atlas'))
+
+    def save(self, file_path):
+        """保存为 JSON 文件"""
+        write_json_atomic(Path(file_path), self.to_json(), indent=1)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+
+class SyncPlan:
+    """规划阶段的结果：变更集和应用时可以复用的中间数据"""
+
+    def __init__(self, changeset, atlas_fp, chrome_fp, chrome_urls=None, chrome_data=None, chrome_index=None,
+                 up_to_date=False):
+        self.changeset = changeset
+        self.atlas_fp = atlas_fp
+        self.chrome_fp = chrome_fp
+        # 规划时 Chrome 中已有 URL 的索引键
+        self.chrome_urls = chrome_urls
+        # 规划时已经加载的 Chrome 书签（没有新书签时不加载，为 None）
+        self.chrome_data = chrome_data
+        self.chrome_index = chrome_index
+        # Atlas 自上次同步后没有变化，无需任何操作
+        self.up_to_date = up_to_date
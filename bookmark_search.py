@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+书签搜索索引
+同步时顺带维护的 SQLite 全文索引（名称、URL、文件夹路径），按 bm25 排序；
+SQLite 没有 FTS5 时退化为 LIKE 查询
+"""
+
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+
+INDEX_VERSION = '1'
+
+# 中日韩文字之间没有空格，逐字切分后用短语查询匹配连续的字
+CJK_RANGES = ((0x3040, 0x30ff), (0x3400, 0x4dbf), (0x4e00, 0x9fff), (0xac00, 0xd7af), (0xf900, 0xfaff))
+
+# bm25 中名称、URL、路径的权重
+RANK_WEIGHTS = (10.0, 2.0, 1.0)
+
+_cjk_table = None
+
+
+def index_text(text):
+    """写入全文索引前的文本：中日韩文字逐字分开"""
+    global _cjk_table
+    if not text or text.isascii():
+        return text or ''
+    if _cjk_table is None:
+        # 用 str.translate 逐字替换，比正则替换快得多；第一次遇到非 ASCII 文本时才构建
+        _cjk_table = {cp: f' {chr(cp)} ' for start, end in CJK_RANGES for cp in range(start, end + 1)}
+    return text.translate(_cjk_table)
+
+
+@lru_cache(maxsize=4096)
+def index_path(path):
+    """文件夹路径大量重复，缓存切分结果"""
+    return index_text(path)
+
+
+def fts_query(text):
+    """把用户输入转为 FTS5 查询：每个词为一个短语，最后一个字按前缀匹配，多个词同时满足"""
+    phrases = []
+    for term in text.split():
+        term = index_text(term).strip()
+        if term:
+            phrases.append('"' + term.replace('"', '""') + '"*')
+    return ' '.join(phrases)
+
+
+def has_fts5(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class SearchResult:
+    """一条搜索结果"""
+
+    __slots__ = ('name', 'url', 'path')
+
+    def __init__(self, name, url, path):
+        self.name = name
+        self.url = url
+        self.path = path
+
+
+class SearchIndex:
+    """书签文件的全文索引；索引键为规范 URL 的摘要，同一个键只保留一条"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.fts = has_fts5(self.conn)
+        # 写入全文索引的文本在 SQL 中生成，批量写入时不逐行回到 Python
+        self.conn.create_function('index_text', 1, index_text, deterministic=True)
+        self.conn.create_function('index_path', 1, index_path, deterministic=True)
+        self._create()
+
+    def _create(self):
+        conn = self.conn
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self.get_meta('version') not in (None, INDEX_VERSION):
+            conn.execute("DROP TABLE IF EXISTS bookmarks")
+            conn.execute("DROP TABLE IF EXISTS bookmarks_fts")
+            conn.execute("DELETE FROM meta")
+        conn.execute("""CREATE TABLE IF NOT EXISTS bookmarks (
+            id INTEGER PRIMARY KEY, key BLOB NOT NULL UNIQUE, name TEXT, url TEXT, path TEXT)""")
+        if self.fts:
+            # 不保存内容的 FTS5 表，结果通过 rowid 从 bookmarks 取出
+            conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+                name, url, path, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')""")
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def digest(self):
+        """已索引的书签文件内容摘要"""
+        return self.get_meta('digest')
+
+    @property
+    def rules(self):
+        """生成索引键的 URL 规范化选项摘要"""
+        return self.get_meta('rules')
+
+    def is_current(self, digest, rules):
+        return self.digest == digest and self.rules == rules
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM bookmarks").fetchone()[0]
+
+    def _insert(self, entries):
+        """写入新条目（索引键已存在的忽略），返回写入的条数"""
+        conn = self.conn
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bookmarks").fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO bookmarks (key, name, url, path) VALUES (?, ?, ?, ?)", entries)
+        # 新条目的 id 都大于写入前的最大 id
+        if self.fts:
+            conn.execute("INSERT INTO bookmarks_fts (rowid, name, url, path) "
+                         "SELECT id, index_text(name), index_text(url), index_path(path) FROM bookmarks WHERE id > ?",
+                         (last_id,))
+        return conn.execute("SELECT COUNT(*) FROM bookmarks WHERE id > ?", (last_id,)).fetchone()[0]
+
+    def _delete(self, keys):
+        """删除索引键对应的条目"""
+        conn = self.conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS removed_keys (key BLOB PRIMARY KEY)")
+        conn.execute("DELETE FROM removed_keys")
+        conn.executemany("INSERT OR IGNORE INTO removed_keys VALUES (?)", ((key,) for key in keys))
+        if self.fts:
+            # 不保存内容的表删除时需要提供原来写入的文本
+            conn.execute("INSERT INTO bookmarks_fts (bookmarks_fts, rowid, name, url, path) "
+                         "SELECT 'delete', id, index_text(name), index_text(url), index_path(path) FROM bookmarks "
+                         "WHERE key IN (SELECT key FROM removed_keys)")
+        conn.execute("DELETE FROM bookmarks WHERE key IN (SELECT key FROM removed_keys)")
+
+    def _set_source(self, digest, rules):
+        self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [('digest', digest), ('rules', rules)])
+
+    def add(self, entries, digest, rules):
+        """增量添加 (索引键, 名称, URL, 路径)，并记录书签文件的新摘要；返回添加的条数"""
+        with self.conn:
+            count = self._insert(entries)
+            self._set_source(digest, rules)
+        return count
+
+    def update(self, entries, digest, rules):
+        """与书签文件的完整内容对齐：删除已不存在的条目、添加新条目，名称或路径变化的条目重新写入
+
+        返回 (添加数, 删除数, 更新数)。
+        """
+        if self.rules != rules:
+            # 索引键的生成方式变了，旧条目无法比较
+            with self.conn:
+                self.conn.execute("DELETE FROM bookmarks")
+                if self.fts:
+                    self.conn.execute("INSERT INTO bookmarks_fts (bookmarks_fts) VALUES ('delete-all')")
+        current = {}
+        for entry in entries:
+            current.setdefault(entry[0], entry)
+        indexed = {row[0]: row[1:] for row in self.conn.execute("SELECT key, name, url, path FROM bookmarks")}
+        removed = indexed.keys() - current.keys()
+        # 改名或移动过的书签：删除旧条目后与新条目一起写入
+        changed = {key for key, entry in current.items() if key in indexed and indexed[key] != entry[1:]}
+        with self.conn:
+            self._delete(removed | changed)
+            inserted = self._insert(entry for key, entry in current.items() if key not in indexed or key in changed)
+            self._set_source(digest, rules)
+        return inserted - len(changed), len(removed), len(changed)
+
+    def search(self, query, limit=20):
+        """返回按相关度排列的 SearchResult 列表"""
+        if self.fts:
+            match = fts_query(query)
+            if not match:
+                return []
+            rows = self.conn.execute(
+                "SELECT b.name, b.url, b.path FROM bookmarks_fts JOIN bookmarks b ON b.id = bookmarks_fts.rowid "
+                "WHERE bookmarks_fts MATCH ? ORDER BY bm25(bookmarks_fts, ?, ?, ?) LIMIT ?",
+                (match,) + RANK_WEIGHTS + (limit,)).fetchall()
+        else:
+            terms = query.split()
+            if not terms:
+                return []
+            where = ' AND '.join("(name LIKE ? OR url LIKE ? OR path LIKE ?)" for _ in terms)
+            params = []
+            for term in terms:
+                pattern = f"%{term}%"
+                params.extend((pattern, pattern, pattern))
+            rows = self.conn.execute(
+                f"SELECT name, url, path FROM bookmarks WHERE {where} "
+                f"ORDER BY (name LIKE ?) DESC, length(url) LIMIT ?",
+                params + [f"%{terms[0]}%", limit]).fetchall()
+        return [SearchResult(*row) for row in rows]
+
+    def close(self):
+        self.conn.close()
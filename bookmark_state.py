@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+同步状态缓存
+记录上次成功同步时输入文件的指纹、Chrome URL 索引和三方合并的基准快照，输入未变化时跳过解析
+"""
+
+import base64
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from bookmark_io import write_json_atomic
+
+STATE_VERSION = 1
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncState:
+    """保存在备份目录中的同步状态"""
+
+    def __init__(self, state_dir, name="sync_state", url_rules=None):
+        self.state_path = Path(state_dir) / f"{name}.json"
+        # URL 索引单独存放，输入未变化时不需要读取；索引键为规范 URL 的定长摘要，
+        # url_rules 为生成索引键的规范化选项摘要，选项变化后旧索引作废
+        self.urls_path = Path(state_dir) / f"{name}_urls.json"
+        self.url_rules = url_rules
+        self.data = self._load(self.state_path)
+        if self.data.get('version') != STATE_VERSION:
+            self.data = {'version': STATE_VERSION, 'files': {}}
+        self._urls = None
+        self._urls_dirty = False
+        # 文件夹指纹缓存：{名称: {'digest': 文件摘要, 'folders': {id: 指纹}}}
+        self.fingerprints_path = Path(state_dir) / f"{name}_fingerprints.json"
+        self._fingerprints = None
+        self._fingerprints_dirty = False
+        # 三方合并的基准快照（上次同步后两边共有的书签），与状态文件通过 token 对应
+        self.base_path = Path(state_dir) / f"{name}_base.json"
+        self._base = None
+
+    @staticmethod
+    def _load(file_path):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def fingerprint(self, name, file_path):
+        """返回文件指纹 {size, mtime_ns, digest}；大小和修改时间未变时不读取内容"""
+        st = os.stat(file_path)
+        previous = self.data['files'].get(name)
+        if (previous and previous.get('path') == str(file_path)
+                and previous.get('size') == st.st_size
+                and previous.get('mtime_ns') == st.st_mtime_ns):
+            return previous
+        return {
+            'path': str(file_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'digest': file_digest(file_path),
+        }
+
+    def is_unchanged(self, name, fingerprint):
+        """指纹与上次成功同步时的内容是否一致"""
+        previous = self.data['files'].get(name)
+        return bool(previous) and previous.get('digest') == fingerprint['digest']
+
+    def update_file(self, name, fingerprint):
+        self.data['files'][name] = fingerprint
+
+    def forget_file(self, name):
+        """忘掉文件指纹，下次视为已变化"""
+        self.data['files'].pop(name, None)
+
+    def has_urls(self):
+        """是否记录过 URL 索引（不读取索引文件）"""
+        return bool(self.data.get('urls_digest')) and self.urls_path.exists()
+
+    def get_urls(self):
+        """上次同步后的 Chrome URL 索引键集合，没有缓存时返回 None"""
+        if self._urls is None:
+            data = self._load(self.urls_path)
+            if (data.get('version') == STATE_VERSION and data.get('digest') == self.data.get('urls_digest')
+                    and data.get('rules') == self.url_rules and 'keys' in data):
+                blob = base64.b64decode(data['keys'])
+                size = data.get('key_size') or 1
+                self._urls = {blob[i:i + size] for i in range(0, len(blob), size)}
+        return self._urls
+
+    def set_urls(self, urls):
+        self._urls = set(urls)
+        self._urls_dirty = True
+
+    def get_fingerprints(self, name, digest):
+        """文件内容未变化时返回上次缓存的文件夹指纹，否则返回 None"""
+        if self._fingerprints is None:
+            data = self._load(self.fingerprints_path)
+            self._fingerprints = data if data.get('version') == STATE_VERSION else {'version': STATE_VERSION}
+        entry = self._fingerprints.get(name)
+        if entry and entry.get('digest') == digest:
+            return entry.get('folders')
+        return None
+
+    def set_fingerprints(self, name, digest, folders):
+        if self._fingerprints is None:
+            self.get_fingerprints(name, digest)
+        self._fingerprints[name] = {'digest': digest, 'folders': folders}
+        self._fingerprints_dirty = True
+
+    def get_base(self):
+        """上次同步后保存的基准快照（JSON），没有或与状态不对应时返回 None"""
+        token = self.data.get('base_token')
+        if not token:
+            return None
+        data = self._load(self.base_path)
+        return data if data.get('token') == token else None
+
+    def set_base(self, data):
+        self._base = data
+
+    def save(self):
+        """保存状态（URL 索引只在变化时重写）"""
+        if self._urls_dirty:
+            # 定长的索引键排序后拼接保存
+            keys = sorted(self._urls)
+            blob = b''.join(keys)
+            digest = hashlib.sha256(blob).hexdigest()
+            write_json_atomic(self.urls_path, {
+                'version': STATE_VERSION,
+                'digest': digest,
+                'rules': self.url_rules,
+                'key_size': len(keys[0]) if keys else 0,
+                'keys': base64.b64encode(blob).decode('ascii'),
+            }, fsync=False)
+            self.data['urls_digest'] = digest
+            self._urls_dirty = False
+        if self._fingerprints_dirty:
+            write_json_atomic(self.fingerprints_path, self._fingerprints, fsync=False)
+            self._fingerprints_dirty = False
+        if self._base is not None:
+            token = os.urandom(8).hex()
+            write_json_atomic(self.base_path, dict(self._base, token=token), fsync=False)
+            self.data['base_token'] = token
+            self._base = None
+        write_json_atomic(self.state_path, self.data, fsync=False)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+书签同步库接口
+- BookmarkMerger：把源书签中缺少的书签放入目标书签对应的文件夹（V2 同步的核心，不读写文件）
+- sync(source_tree, target_tree)：在内存中完成一次同步，返回 SyncResult
+- 存储后端 FileStorage / MemoryStorage，时钟和 logger 都可以替换
+库代码不配置全局日志、不创建目录、不退出进程，错误以异常抛出
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+
+from bookmark_formats import _EPOCH_DELTA
+from bookmark_io import atomic_write_bytes
+from bookmark_metrics import SyncMetrics
+from bookmark_model import FOLDER, URL, BookmarkFile, BookmarkNode
+from bookmark_plan import ADD_BOOKMARK, Changeset
+from bookmark_tree import iter_bookmarks, iter_roots, walk_tree
+from bookmark_url import UrlCanonicalizer
+
+# 映射源书签根节点名称到目标根节点
+ROOT_MAPPING = {
+    '书签栏': 'bookmark_bar',
+    'Bookmarks bar': 'bookmark_bar',
+    '其他书签': 'other',
+    'Other bookmarks': 'other',
+}
+
+
+class BookmarkMerger:
+    """只添加缺失书签的合并逻辑：规划变更集并应用到目标书签（原地修改）"""
+
+    def __init__(self, url_rules=None, root_mapping=None, logger=None, clock=None, metrics=None):
+        # 源根节点名称到目标根节点的映射
+        self.root_mapping = dict(ROOT_MAPPING)
+        if root_mapping:
+            self.root_mapping.update(root_mapping)
+
+        # 判断书签是否重复时使用的 URL 规范化（比较的是规范 URL 的摘要）
+        self.canonicalizer = url_rules or UrlCanonicalizer()
+        self.url_key = self.canonicalizer.key
+
+        # 没有传入时使用模块 logger（不添加 handler）和系统时钟（返回 Unix 秒）
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock or time.time
+        self.metrics = metrics or SyncMetrics('sync')
+
+    def now_timestamp(self):
+        """新节点的时间戳：Chromium 格式（1601-01-01 起的微秒），与 bookmark_formats 的换算一致"""
+        return int((self.clock() + _EPOCH_DELTA) * 1000000)
+
+    def find_folder_by_path(self, root, path_parts):
+        """根据路径查找文件夹"""
+        folder = root
+        for folder_name in path_parts:
+            if folder.children is None:
+                return None
+            for child in folder.children:
+                if child.type == FOLDER and child.name == folder_name:
+                    folder = child
+                    break
+            else:
+                return None
+        return folder
+
+    def new_folder(self, parent, folder_name, ids):
+        """在 parent 末尾创建新文件夹，id 由 ids（IdAllocator）分配"""
+        if parent.children is None:
+            parent.children = []
+        now_timestamp = self.now_timestamp()
+        folder = BookmarkNode(
+            FOLDER,
+            name=folder_name,
+            id=ids.allocate(),
+            date_added=now_timestamp,
+            date_modified=now_timestamp,
+            children=[],
+            extra=(('date_last_used', '0'),)
+        )
+        parent.children.append(folder)
+        self.metrics.count('folders_created')
+        self.logger.debug("  创建文件夹: %s", folder_name)
+        return folder
+
+    def create_folder_path(self, root, path_parts, ids):
+        """创建文件夹路径（如果不存在）"""
+        folder = root
+        for i, folder_name in enumerate(path_parts):
+            child = self.find_folder_by_path(folder, path_parts[i:i + 1])
+            folder = child if child is not None else self.new_folder(folder, folder_name, ids)
+        return folder
+
+    def build_folder_index(self, data):
+        """建立文件夹索引：(根节点, 路径) -> 文件夹节点"""
+        return walk_tree(data, url_key=self.url_key).folder_index
+
+    def get_or_create_folder(self, folder_index, root_key, path_parts, ids):
+        """通过索引查找文件夹，不存在则逐级创建并加入索引"""
+        path_parts = tuple(path_parts)
+        folder = folder_index.get((root_key, path_parts))
+        if folder is not None:
+            return folder
+
+        # 找到已存在的最长前缀
+        depth = len(path_parts)
+        while depth > 0 and (root_key, path_parts[:depth]) not in folder_index:
+            depth -= 1
+        folder = folder_index[(root_key, path_parts[:depth])]
+
+        # 逐级创建缺失的文件夹
+        for i in range(depth, len(path_parts)):
+            folder = self.new_folder(folder, path_parts[i], ids)
+            folder_index[(root_key, path_parts[:i + 1])] = folder
+
+        return folder
+
+    def plan_changes(self, new_bookmarks, folder_index, changeset=None):
+        """规划把新书签 (文件夹路径, 书签节点) 放入 Chrome 所需的变更，不修改 Chrome 书签"""
+        if changeset is None:
+            changeset = Changeset()
+        planned_folders = set()
+
+        for path_parts, bookmark in new_bookmarks:
+            if not path_parts:
+                continue
+
+            # 找到对应的根节点
+            chrome_root_key = self.root_mapping.get(path_parts[0], 'bookmark_bar')
+            if (chrome_root_key, ()) not in folder_index:
+                continue
+
+            # 缺失的文件夹逐级创建
+            folder_parts = tuple(path_parts[1:])
+            key = (chrome_root_key, folder_parts)
+            if key not in folder_index and key not in planned_folders:
+                depth = len(folder_parts)
+                while depth > 0 and (chrome_root_key, folder_parts[:depth]) not in folder_index:
+                    depth -= 1
+                for i in range(depth + 1, len(folder_parts) + 1):
+                    missing = (chrome_root_key, folder_parts[:i])
+                    if missing not in planned_folders:
+                        planned_folders.add(missing)
+                        changeset.create_folder(chrome_root_key, folder_parts[:i])
+
+            changeset.add_bookmark(chrome_root_key, folder_parts, bookmark.name, bookmark.url, bookmark.date_added)
+
+        return changeset
+
+    def apply_changeset(self, chrome_data, changeset, folder_index=None, known_urls=None):
+        """按顺序把变更应用到 Chrome 书签，返回添加的书签数量
+
+        known_urls 为 Chrome 中已有 URL 的索引键：已存在的书签会被跳过，实际添加的书签会加入其中。
+        """
+        if folder_index is None:
+            folder_index = self.build_folder_index(chrome_data)
+
+        ids = chrome_data.ids
+        added_count = 0
+        # 每个文件夹添加的数量，逐条明细只在 DEBUG 级别输出
+        added_by_folder = {}
+        detail = self.logger.isEnabledFor(logging.DEBUG)
+        for change in changeset:
+            if change.root not in chrome_data.roots:
+                continue
+
+            # 查找或创建目标文件夹
+            target_folder = self.get_or_create_folder(folder_index, change.root, change.path, ids)
+            if change.op != ADD_BOOKMARK:
+                continue
+            if known_urls is not None:
+                key = self.url_key(change.url)
+                if key in known_urls:
+                    continue
+                known_urls.add(key)
+
+            # 添加书签
+            if target_folder.children is None:
+                target_folder.children = []
+
+            date_added = change.date_added
+            if date_added is None:
+                date_added = self.now_timestamp()
+            new_bookmark = BookmarkNode(
+                URL,
+                name=change.name,
+                url=change.url,
+                id=ids.allocate(),
+                date_added=date_added,
+                extra=(('date_last_used', '0'),)
+            )
+
+            target_folder.children.append(new_bookmark)
+            added_count += 1
+
+            folder_key = (change.root,) + change.path
+            added_by_folder[folder_key] = added_by_folder.get(folder_key, 0) + 1
+            if detail:
+                self.logger.debug("  ✓ [%d] %s", added_count, change.name)
+                self.logger.debug("      位置: %s", '/'.join(folder_key))
+
+        self.log_added_summary(added_by_folder)
+        self.metrics.count('bookmarks_added', added_count)
+        return added_count
+
+    def log_added_summary(self, added_by_folder, limit=20):
+        """按文件夹汇总输出添加的书签数量，数量最多的在前"""
+        if not added_by_folder:
+            return
+        ranked = sorted(added_by_folder.items(), key=lambda item: -item[1])
+        for folder_key, count in ranked[:limit]:
+            self.logger.info(f"  ✓ {'/'.join(folder_key)}: +{count}")
+        if len(ranked) > limit:
+            rest = sum(count for _, count in ranked[limit:])
+            self.logger.info(f"  … 另外 {len(ranked) - limit} 个文件夹: +{rest}")
+
+    def add_bookmarks_to_chrome(self, chrome_data, new_bookmarks, folder_index=None):
+        """把新书签 (文件夹路径, 书签节点) 放入 Chrome 对应的文件夹，返回添加数量"""
+        if folder_index is None:
+            folder_index = self.build_folder_index(chrome_data)
+        changeset = self.plan_changes(new_bookmarks, folder_index)
+        return self.apply_changeset(chrome_data, changeset, folder_index)
+
+
+class SyncResult:
+    """一次同步的结果"""
+
+    __slots__ = ('target', 'changeset', 'added', 'metrics')
+
+    def __init__(self, target, changeset, added, metrics):
+        # 同步后的目标书签（BookmarkFile）
+        self.target = target
+        self.changeset = changeset
+        # 实际添加的书签数（dry_run 时为 0）
+        self.added = added
+        self.metrics = metrics
+
+    @property
+    def changed(self):
+        return self.added > 0 or self.metrics.counters.get('folders_created', 0) > 0
+
+
+def as_tree(tree):
+    """BookmarkFile、Chromium JSON（dict）或其文本都转换为 BookmarkFile"""
+    if isinstance(tree, BookmarkFile):
+        return tree
+    if isinstance(tree, (str, bytes)):
+        tree = json.loads(tree)
+    return BookmarkFile.from_json(tree)
+
+
+def missing_bookmarks(source, url_key, known):
+    """源书签中 known（目标已有的索引键）没有的书签 (文件夹路径, 书签节点)，重复的只保留第一个"""
+    for _, root in iter_roots(source):
+        for path, node in iter_bookmarks(root):
+            if not node.url:
+                continue
+            key = url_key(node.url)
+            if key in known:
+                continue
+            known.add(key)
+            yield path, node
+
+
+def sync(source_tree, target_tree, url_rules=None, root_mapping=None, clock=None, logger=None, dry_run=False):
+    """把 source_tree 中 target_tree 缺少的书签添加到 target_tree，返回 SyncResult
+
+    只添加、不删除，不改变原有顺序。target_tree 为 BookmarkFile 时原地修改；dry_run 时只规划变更集。
+    """
+    merger = BookmarkMerger(url_rules, root_mapping, logger, clock)
+    metrics = merger.metrics
+    source = as_tree(source_tree)
+    target = as_tree(target_tree)
+    metrics.count('nodes_scanned', source.node_count + target.node_count)
+
+    with metrics.phase('plan'):
+        index = walk_tree(target, url_key=merger.url_key)
+        changeset = merger.plan_changes(missing_bookmarks(source, merger.url_key, set(index.url_set)),
+                                        index.folder_index)
+    added = 0
+    if changeset and not dry_run:
+        with metrics.phase('apply'):
+            added = merger.apply_changeset(target, changeset, index.folder_index)
+    metrics.finish(True)
+    return SyncResult(target, changeset, added, metrics)
+
+
+class MemoryStorage:
+    """内存中的书签存储：名称 -> 字节"""
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+
+    def read_bytes(self, name):
+        try:
+            return self.files[str(name)]
+        except KeyError:
+            raise FileNotFoundError(name) from None
+
+    def write_bytes(self, name, data):
+        self.files[str(name)] = bytes(data)
+        return len(data)
+
+    def exists(self, name):
+        return str(name) in self.files
+
+
+class FileStorage:
+    """文件系统中的书签存储；相对名称基于 root，写入为原子替换"""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else None
+
+    def path(self, name):
+        path = Path(name)
+        return self.root / path if self.root and not path.is_absolute() else path
+
+    def read_bytes(self, name):
+        return self.path(name).read_bytes()
+
+    def write_bytes(self, name, data):
+        return atomic_write_bytes(self.path(name), data)
+
+    def exists(self, name):
+        return self.path(name).exists()
+
+
+def load_tree(storage, name):
+    return BookmarkFile.from_json(json.loads(storage.read_bytes(name)))
+
+
+def save_tree(storage, name, tree):
+    """按 Chrome 的格式写回（缩进 3），返回写入的字节数"""
+    text = json.dumps(tree.to_json(), ensure_ascii=False, indent=3)
+    return storage.write_bytes(name, text.encode('utf-8'))
+
+
+def sync_files(storage, source_name, target_name, dry_run=False, **options):
+    """从 storage 读取两边书签同步，有变化时写回目标；读写失败抛出 OSError / ValueError"""
+    source = load_tree(storage, source_name)
+    target = load_tree(storage, target_name)
+    result = sync(source, target, dry_run=dry_run, **options)
+    if result.changed and not dry_run:
+        with result.metrics.phase('save'):
+            result.metrics.count('bytes_written', save_tree(storage, target_name, result.target))
+        result.metrics.finish(True)
+    return result
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+书签树遍历工具
+一次非递归遍历生成同步所需的全部索引（节点为 bookmark_model.BookmarkNode）
+"""
+
+import hashlib
+
+from bookmark_model import URL
+
+
+class TreeIndex:
+    """一次遍历得到的书签索引"""
+
+    def __init__(self):
+        # 所有书签 URL 的索引键（指定 url_key 时为规范 URL 的摘要，否则为 URL 本身）
+        self.url_set = set()
+        # 索引键 -> (文件夹路径, 书签节点)，路径包含根节点名称，重复的书签保留第一个
+        self.url_map = {}
+        # (根节点键, 根节点以下的文件夹路径) -> 文件夹节点
+        self.folder_index = {}
+        # 最大节点 id
+        self.max_id = 0
+        # 遍历过的节点数
+        self.node_count = 0
+
+
+def iter_roots(data):
+    """按顺序返回 BookmarkFile 的 (根节点键, 根节点)"""
+    return iter(data.roots.items())
+
+
+def walk_tree(data, index=None, url_key=None):
+    """非递归遍历整个书签文件，填充并返回 TreeIndex"""
+    return walk_nodes(iter_roots(data), index, url_key)
+
+
+def walk_nodes(roots, index=None, url_key=None):
+    """非递归遍历 (根节点键, 节点) 序列，填充并返回 TreeIndex
+
+    url_key 把 URL 转换为索引键（如 UrlCanonicalizer.key），默认直接使用 URL。
+    """
+    if index is None:
+        index = TreeIndex()
+    url_set = index.url_set
+    url_map = index.url_map
+    folder_index = index.folder_index
+    max_id = index.max_id
+    count = 0
+
+    for root_key, root in roots:
+        # 栈中保存 (节点, 包含根名称的路径, 根以下的路径)；路径元组按文件夹共享，不逐层拼接字符串
+        # 根以下的路径为 None 表示该文件夹被前面的同名文件夹遮蔽，不进入文件夹索引
+        stack = [(root, (), ())]
+        is_root = True
+        while stack:
+            node, parent_path, parent_parts = stack.pop()
+            count += 1
+
+            node_id = node.id
+            if node_id:
+                try:
+                    node_id = int(node_id)
+                except (TypeError, ValueError):
+                    node_id = 0
+                if node_id > max_id:
+                    max_id = node_id
+
+            if node.type == URL:
+                url = node.url
+                if url:
+                    if url_key is not None:
+                        url = url_key(url)
+                    url_set.add(url)
+                    if url not in url_map:
+                        url_map[url] = (parent_path, node)
+                continue
+
+            children = node.children
+            if children is None:
+                continue
+
+            name = node.name
+            path = parent_path + (name,)
+            if is_root:
+                parts = ()
+                is_root = False
+            elif parent_parts is None:
+                parts = None
+            else:
+                parts = parent_parts + (name,)
+            if parts is not None:
+                # 同名文件夹只索引第一个，与线性查找的行为一致
+                key = (root_key, parts)
+                if key in folder_index:
+                    parts = None
+                else:
+                    folder_index[key] = node
+
+            # 逆序压栈，保证按原始顺序访问
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((children[i], path, parts))
+
+    index.max_id = max_id
+    index.node_count += count
+    return index
+
+
+def iter_bookmarks(node, path=()):
+    """非递归按顺序产出子树中的每个书签 (文件夹路径, 书签节点)，包括重复 URL"""
+    stack = [(node, path)]
+    while stack:
+        node, parent_path = stack.pop()
+        if node.type == URL:
+            yield parent_path, node
+            continue
+        children = node.children
+        if children:
+            path = parent_path + (node.name,)
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((children[i], path))
+
+
+def folder_fingerprints(data, cached=None):
+    """非递归计算每个文件夹的语义指纹，返回 {id(节点): 十六进制摘要}
+
+    指纹由文件夹名称以及按顺序排列的子节点（书签的 URL 和名称、子文件夹的指纹）决定，
+    与 id、时间戳、checksum 无关，内容相同的两个文件夹指纹相同。
+    cached 为文件内容未变化时上次保存的 {Chromium id: 指纹}，命中的文件夹不再计算摘要。
+    """
+    fingerprints = {}
+    for _, root in iter_roots(data):
+        # 后序遍历：子文件夹先于父文件夹计算
+        stack = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            children = node.children
+            if children is None:
+                continue
+            if not ready:
+                stack.append((node, True))
+                for child in children:
+                    if child.children is not None:
+                        stack.append((child, False))
+                continue
+            if cached:
+                fingerprint = cached.get(node.id)
+                if fingerprint:
+                    fingerprints[id(node)] = fingerprint
+                    continue
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(b'F' + node.name.encode('utf-8') + b'\0')
+            for child in children:
+                if child.type == URL:
+                    digest.update(b'U' + (child.url or '').encode('utf-8') + b'\0'
+                                  + child.name.encode('utf-8') + b'\0')
+                elif child.children is not None:
+                    digest.update(b'D' + bytes.fromhex(fingerprints[id(child)]))
+            fingerprints[id(node)] = digest.hexdigest()
+    return fingerprints
+
+
+def export_fingerprints(data, fingerprints):
+    """把指纹转换为 {Chromium id: 指纹} 以便缓存；文件夹 id 有重复时返回 None"""
+    exported = {}
+    for _, root in iter_roots(data):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            children = node.children
+            if children is None:
+                continue
+            node_id = node.id
+            if not node_id or node_id in exported:
+                return None
+            exported[node_id] = fingerprints[id(node)]
+            for child in children:
+                if child.children is not None:
+                    stack.append(child)
+    return exported
+
+
+def dedupe_tree(data, url_key):
+    """一次线性遍历删除重复书签（索引键相同），按原始顺序保留第一个，返回删除的 [(文件夹路径, 书签节点)]
+
+    直接修改 data 中的文件夹；文件夹本身即使变空也保留。
+    """
+    seen = set()
+    removed = []
+    for _, root in iter_roots(data):
+        if root.children is None:
+            continue
+        # 先序遍历：栈中保存 (文件夹, 子节点迭代器, 保留的子节点, 路径)，文件夹遍历完时替换子节点
+        stack = [(root, iter(root.children), [], (root.name,))]
+        while stack:
+            folder, children, kept, path = stack[-1]
+            child = next(children, None)
+            if child is None:
+                if len(kept) != len(folder.children):
+                    folder.children = kept
+                stack.pop()
+                continue
+            if child.type == URL:
+                key = url_key(child.url or '')
+                if key in seen:
+                    removed.append((path, child))
+                    continue
+                seen.add(key)
+            kept.append(child)
+            if child.children is not None:
+                stack.append((child, iter(child.children), [], path + (child.name,)))
+    return removed
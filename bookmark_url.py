@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+URL 规范化
+判断书签是否重复前把 URL 化为规范形式（忽略 http/https、主机名大小写、默认端口、末尾斜杠、跟踪参数等），
+索引中只保存规范 URL 的定长摘要，不保存完整的 URL 字符串
+"""
+
+import hashlib
+import json
+
+# 索引键（摘要）的字节数
+KEY_SIZE = 16
+
+# 默认去掉的跟踪参数
+TRACKING_PARAMS = (
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'mkt_tok', 'spm', 'ref_src',
+)
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+
+class UrlCanonicalizer:
+    """可配置的 URL 规范化；只处理 http/https，其他协议（javascript:、chrome:// 等）原样比较"""
+
+    OPTIONS = ('ignore_scheme', 'lowercase_host', 'strip_www', 'strip_default_port', 'strip_trailing_slash',
+               'drop_fragment', 'sort_query', 'tracking_params', 'tracking_prefixes')
+
+    def __init__(self, ignore_scheme=True, lowercase_host=True, strip_www=False, strip_default_port=True,
+                 strip_trailing_slash=True, drop_fragment=False, sort_query=False,
+                 tracking_params=TRACKING_PARAMS, tracking_prefixes=TRACKING_PREFIXES):
+        self.ignore_scheme = ignore_scheme
+        self.lowercase_host = lowercase_host
+        self.strip_www = strip_www
+        self.strip_default_port = strip_default_port
+        self.strip_trailing_slash = strip_trailing_slash
+        self.drop_fragment = drop_fragment
+        self.sort_query = sort_query
+        self.tracking_params = frozenset(param.lower() for param in tracking_params)
+        self.tracking_prefixes = tuple(prefix.lower() for prefix in tracking_prefixes)
+        # 所有选项都关闭时按原始字符串比较
+        self.exact = not any((ignore_scheme, lowercase_host, strip_www, strip_default_port, strip_trailing_slash,
+                              drop_fragment, sort_query, self.tracking_params, self.tracking_prefixes))
+
+    @classmethod
+    def exact_match(cls):
+        """不做任何规范化（与旧版本的精确比较一致）"""
+        return cls(False, False, False, False, False, False, False, (), ())
+
+    def to_json(self):
+        data = {name: getattr(self, name) for name in self.OPTIONS}
+        data['tracking_params'] = sorted(self.tracking_params)
+        data['tracking_prefixes'] = list(self.tracking_prefixes)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        unknown = set(data) - set(cls.OPTIONS)
+        if unknown:
+            raise ValueError(f"未知的 URL 规范化选项: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    @classmethod
+    def load(cls, file_path):
+        """从 JSON 文件读取选项，未写出的选项使用默认值"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+    @property
+    def signature(self):
+        """选项的摘要；选项变化后，按旧选项保存的索引键不能再使用"""
+        text = json.dumps(self.to_json(), sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+    def canonical(self, url):
+        """规范形式的 URL（只用于比较，不写回书签）"""
+        if not url or self.exact:
+            return url or ''
+        scheme, sep, rest = url.partition('://')
+        scheme = scheme.lower()
+        if not sep or scheme not in DEFAULT_PORTS:
+            return url
+        # 与 urlsplit 的拆分方式相同，但不做额外的校验和转换（每次同步要处理所有 URL）
+        rest, _, fragment = rest.partition('#')
+        rest, _, query = rest.partition('?')
+        slash = rest.find('/')
+        if slash < 0:
+            host, path = rest, ''
+        else:
+            host, path = rest[:slash], rest[slash:]
+
+        if self.lowercase_host:
+            host = host.lower()
+        if self.strip_default_port and host.endswith(DEFAULT_PORTS[scheme]):
+            host = host[:-len(DEFAULT_PORTS[scheme])]
+        if self.strip_www and host.startswith('www.'):
+            host = host[4:]
+
+        if self.strip_trailing_slash:
+            path = path.rstrip('/')
+
+        if query and (self.tracking_params or self.tracking_prefixes or self.sort_query):
+            # 按原始文本过滤参数，不重新编码
+            tracking, prefixes = self.tracking_params, self.tracking_prefixes
+            params = []
+            for param in query.split('&'):
+                name = param.partition('=')[0].lower()
+                if param and name not in tracking and not name.startswith(prefixes):
+                    params.append(param)
+            if self.sort_query:
+                params.sort()
+            query = '&'.join(params)
+
+        if self.drop_fragment:
+            fragment = ''
+
+        canonical = f"//{host}{path}" if self.ignore_scheme else f"{scheme}://{host}{path}"
+        if query:
+            canonical += '?' + query
+        if fragment:
+            canonical += '#' + fragment
+        return canonical
+
+    def key(self, url):
+        """规范 URL 的定长摘要，作为去重索引的键"""
+        return hashlib.blake2b(self.canonical(url).encode('utf-8'), digest_size=KEY_SIZE).digest()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+书签文件监听
+Linux 使用 inotify，macOS 使用 kqueue，其他情况退回到定时轮询
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+
+def stat_signature(file_path):
+    """文件的 (inode, 大小, 修改时间)，不存在时返回 None"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class PollingWatcher:
+    """定时检查文件大小和修改时间"""
+
+    name = "polling"
+
+    def __init__(self, file_path, poll_interval=5.0):
+        self.file_path = Path(file_path)
+        self.poll_interval = poll_interval
+        self._signature = stat_signature(self.file_path)
+
+    def wait_event(self, timeout=None):
+        """等待一次变化，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            signature = stat_signature(self.file_path)
+            if signature != self._signature:
+                self._signature = signature
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.poll_interval, remaining))
+            else:
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """通过 inotify 监听文件所在目录（浏览器以改名方式替换书签文件）"""
+
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(str(self.file_path.parent)), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"无法监听 {self.file_path.parent}")
+        self._target = os.fsencode(self.file_path.name)
+
+    def wait_event(self, timeout=None):
+        """等待一次与目标文件相关的事件，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                return False
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            matched = False
+            while offset + self._EVENT_HEADER.size <= len(data):
+                _, _, _, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+                offset += self._EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b'\0')
+                offset += name_len
+                if name == self._target:
+                    matched = True
+            if matched:
+                return True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class KqueueWatcher:
+    """通过 kqueue 监听文件及其所在目录"""
+
+    name = "kqueue"
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self._kq = select.kqueue()
+        # O_EVTONLY 只用于接收事件，不会阻止卸载卷
+        self._open_flags = getattr(os, 'O_EVTONLY', os.O_RDONLY)
+        self._dir_fd = os.open(self.file_path.parent, self._open_flags)
+        self._file_fd = None
+        self._signature = stat_signature(self.file_path)
+        self._register(self._dir_fd)
+        self._open_file()
+
+    def _register(self, fd):
+        fflags = select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME | select.KQ_NOTE_EXTEND
+        event = select.kevent(fd, filter=select.KQ_FILTER_VNODE,
+                              flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR, fflags=fflags)
+        self._kq.control([event], 0, 0)
+
+    def _open_file(self):
+        """重新打开目标文件（被改名替换后 inode 会变化）"""
+        if self._file_fd is not None:
+            os.close(self._file_fd)
+            self._file_fd = None
+        try:
+            self._file_fd = os.open(self.file_path, self._open_flags)
+        except OSError:
+            return
+        self._register(self._file_fd)
+
+    def wait_event(self, timeout=None):
+        """等待一次与目标文件相关的事件，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            events = self._kq.control(None, 8, remaining)
+            if not events:
+                return False
+            file_changed = any(e.ident == self._file_fd for e in events)
+            # 目录变化或文件被删除/改名时，重新打开目标文件
+            if not file_changed or any(e.fflags & (select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME) for e in events):
+                self._open_file()
+            # 同目录下其他文件的变化不算
+            signature = stat_signature(self.file_path)
+            if file_changed or signature != self._signature:
+                self._signature = signature
+                return True
+
+    def close(self):
+        if self._file_fd is not None:
+            os.close(self._file_fd)
+        os.close(self._dir_fd)
+        self._kq.close()
+
+
+def create_watcher(file_path, poll_interval=5.0, logger=None):
+    """选择当前平台可用的监听方式，失败时退回轮询"""
+    candidates = []
+    if sys.platform.startswith('linux'):
+        candidates.append(InotifyWatcher)
+    if hasattr(select, 'kqueue'):
+        candidates.append(KqueueWatcher)
+    for watcher_class in candidates:
+        try:
+            return watcher_class(file_path)
+        except (OSError, AttributeError) as e:
+            if logger:
+                logger.warning(f"⚠️  {watcher_class.name} 不可用，改用轮询: {e}")
+    return PollingWatcher(file_path, poll_interval)
+
+
+def wait_for_change(watcher, debounce=2.0, max_delay=30.0, timeout=None):
+    """等待文件变化，并在连续写入停止 debounce 秒后返回 True；timeout 内没有变化返回 False"""
+    if not watcher.wait_event(timeout):
+        return False
+    first = time.monotonic()
+    while True:
+        remaining = max_delay - (time.monotonic() - first)
+        if remaining <= 0:
+            return True
+        if not watcher.wait_event(min(debounce, remaining)):
+            return True
+
+
+def run_on_change(file_path, callback, logger, debounce=2.0, poll_interval=5.0, rescan_interval=3600):
+    """常驻监听文件：启动时执行一次 callback，之后每次变化平稳后再执行；Ctrl+C 退出"""
+    watcher = create_watcher(file_path, poll_interval, logger)
+    logger.info(f"👀 开始监听（{watcher.name}）: {file_path}")
+    try:
+        while True:
+            # 启动时的第一次同步出错也不退出
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ 同步出错: {e}")
+            # 长时间没有事件时也检查一次，防止遗漏
+            wait_for_change(watcher, debounce, timeout=rescan_interval)
+    except KeyboardInterrupt:
+        logger.info("👋 停止监听")
+    finally:
+        watcher.close()
@@ -1,12 +1,12 @@
 #!/bin/bash
-# 设置 macOS 定时任务 - 自动同步书签
+# 设置 macOS 后台任务 - 监听 Atlas 书签变化并自动同步
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PYTHON_SCRIPT="${SCRIPT_DIR}/sync_bookmarks.py"
+PYTHON_SCRIPT="${SCRIPT_DIR}/sync_bookmarks_v2.py"
 PLIST_FILE="${HOME}/Library/LaunchAgents/com.bookmarksync.plist"
 
 echo "================================================"
-echo "  设置书签自动同步 (每小时执行一次)"
+echo "  设置书签自动同步 (监听 Atlas 书签变化)"
 echo "================================================"
 echo ""
 
@@ -21,7 +21,7 @@ fi
 chmod +x "$PYTHON_SCRIPT"
 
 # 创建 LaunchAgent plist 文件
-echo "正在创建定时任务配置..."
+echo "正在创建后台任务配置..."
 
 cat > "$PLIST_FILE" << EOF
 <?xml version="1.0" encoding="UTF-8"?>
@@ -35,14 +35,18 @@ cat > "$PLIST_FILE" << EOF
     <array>
         <string>/usr/bin/python3</string>
         <string>${PYTHON_SCRIPT}</string>
+        <string>--watch</string>
     </array>
     
-    <key>StartInterval</key>
-    <integer>3600</integer>
-    
     <key>RunAtLoad</key>
     <true/>
     
+    <key>KeepAlive</key>
+    <true/>
+    
+    <key>ThrottleInterval</key>
+    <integer>30</integer>
+    
     <key>StandardOutPath</key>
     <string>${HOME}/bookmark-sync-backups/launchd.log</string>
     
@@ -62,18 +66,18 @@ echo "✓ 配置文件已创建: $PLIST_FILE"
 echo ""
 
 # 加载 LaunchAgent
-echo "正在启动定时任务..."
+echo "正在启动后台任务..."
 launchctl unload "$PLIST_FILE" 2>/dev/null
 launchctl load "$PLIST_FILE"
 
 if [ $? -eq 0 ]; then
     echo ""
     echo "================================================"
-    echo "✅ 定时任务设置成功！"
+    echo "✅ 后台任务设置成功！"
     echo "================================================"
     echo ""
     echo "📋 任务详情:"
-    echo "   - 执行频率: 每小时"
+    echo "   - 触发方式: Atlas 书签文件变化后自动同步（常驻监听）"
     echo "   - 脚本位置: $PYTHON_SCRIPT"
     echo "   - 日志位置: ${HOME}/bookmark-sync-backups/"
     echo ""
@@ -82,10 +86,11 @@ if [ $? -eq 0 ]; then
     echo "   启动任务: launchctl load $PLIST_FILE"
     echo "   查看状态: launchctl list | grep bookmarksync"
     echo "   立即执行: python3 $PYTHON_SCRIPT"
+    echo "   前台监听: python3 $PYTHON_SCRIPT --watch"
     echo ""
 else
     echo ""
-    echo "❌ 启动定时任务失败"
+    echo "❌ 启动后台任务失败"
     echo "   请检查权限或手动执行同步脚本"
     exit 1
 fi
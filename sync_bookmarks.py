@@ -4,22 +4,40 @@
 支持双向同步，以最新修改时间为准
 """
 
+import argparse
 import json
-import shutil
 import os
+import sys
+import time
 from datetime import datetime
 from pathlib import Path
 import hashlib
 import logging
 
+from bookmark_backup import BackupStore
+from bookmark_discovery import AtlasLocator
+from bookmark_io import write_json_atomic
+from bookmark_journal import Journal, Snapshot, ThreeWayMerge
+from bookmark_lock import SyncLock
+from bookmark_logging import setup_logging
+from bookmark_metrics import SyncMetrics
+from bookmark_model import FOLDER, URL, BookmarkFile, BookmarkNode
+from bookmark_state import SyncState
+from bookmark_tree import export_fingerprints, folder_fingerprints
+from bookmark_url import UrlCanonicalizer
+
 class BookmarkSyncer:
-    def __init__(self):
+    def __init__(self, chrome_path=None, atlas_path=None, backup_dir=None, prometheus_path=None, logger=None,
+                 url_rules=None, clock=None):
         # Chrome 书签路径
-        self.chrome_path = Path.home() / "Library/Application Support/Google/Chrome/Default/Bookmarks"
+        self.chrome_path = Path(chrome_path) if chrome_path else Path.home() / "Library/Application Support/Google/Chrome/Default/Bookmarks"
+        
+        # Atlas 书签路径：指定时只使用指定的文件，否则在同步时查找（结果缓存在备份目录）
+        self.atlas_path = Path(atlas_path) if atlas_path else None
+        self.atlas_path_given = atlas_path is not None
         
-        # Atlas 书签路径（需要根据实际情况调整）
-        # 常见可能的路径
-        atlas_paths = [
+        # 常见可能的路径，缓存失效时先于目录查找尝试
+        self.atlas_paths = [
             # 实际找到的 Atlas 路径
             Path.home() / "Library/Application Support/com.openai.atlas/browser-data/host/user-Am0Q4EbYlB5U8O6IwUFaUZM7__bb9ad6a0-2ac3-437c-a7dd-fd1f6bd9ff0b/Bookmarks",
             Path.home() / "Library/Application Support/Atlas/Default/Bookmarks",
@@ -27,72 +45,69 @@ class BookmarkSyncer:
             Path.home() / "Library/Application Support/OpenAI/Atlas/Bookmarks",
         ]
         
-        self.atlas_path = None
-        for path in atlas_paths:
-            if path.exists():
-                self.atlas_path = path
-                break
-        
         # 备份目录
-        self.backup_dir = Path.home() / "bookmark-sync-backups"
+        self.backup_dir = Path(backup_dir) if backup_dir else Path.home() / "bookmark-sync-backups"
         self.backup_dir.mkdir(exist_ok=True)
+        self.atlas_locator = AtlasLocator(self.backup_dir)
+        
+        # 日志配置（每个进程只配置一次，由后台线程写入）；传入 logger 时由调用方负责配置
+        if logger is None:
+            setup_logging(self.backup_dir / "sync.log")
+            logger = logging.getLogger(__name__)
+        self.logger = logger
+        
+        # 内容寻址的备份仓库
+        self.backup_store = BackupStore(self.backup_dir)
+        
+        # 比较书签时使用的 URL 规范化（http/https、末尾斜杠、跟踪参数等视为同一个书签）
+        self.canonicalizer = url_rules or UrlCanonicalizer()
+        
+        # 三方合并新建文件夹时使用的时钟（返回 Unix 秒）
+        self.clock = clock or time.time
+        
+        # 同步状态、文件夹指纹缓存和三方合并的基准快照
+        self.state = SyncState(self.backup_dir, "sync_state_v1", self.canonicalizer.signature)
+        
+        # 跨进程同步锁（与 V2 共用备份目录下的锁文件）
+        self.lock = SyncLock(self.backup_dir, "sync_v1")
         
-        # 日志配置
-        log_file = self.backup_dir / "sync.log"
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
+        # 每次同步的阶段耗时和计数
+        self.metrics = SyncMetrics('sync_v1')
+        self.metrics_path = self.backup_dir / "metrics_v1.jsonl"
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
     
     def find_atlas_bookmarks(self):
         """查找 Atlas 书签文件"""
-        if self.atlas_path and self.atlas_path.exists():
-            return self.atlas_path
-        
-        # 搜索可能的位置
-        app_support = Path.home() / "Library/Application Support"
-        if app_support.exists():
-            for item in app_support.iterdir():
-                if 'atlas' in item.name.lower():
-                    possible_bookmark = item / "Default/Bookmarks"
-                    if possible_bookmark.exists():
-                        self.logger.info(f"找到 Atlas 书签: {possible_bookmark}")
-                        return possible_bookmark
-                    # 尝试其他可能的路径
-                    possible_bookmark = item / "Bookmarks"
-                    if possible_bookmark.exists():
-                        self.logger.info(f"找到 Atlas 书签: {possible_bookmark}")
-                        return possible_bookmark
-        
-        return None
+        if self.atlas_path_given:
+            # 指定的文件不存在时报错，不改用其他位置的书签
+            return self.atlas_path if self.atlas_path.exists() else None
+        
+        atlas_path = self.atlas_locator.locate(self.atlas_paths)
+        if atlas_path and atlas_path != self.atlas_path:
+            self.logger.info(f"找到 Atlas 书签: {atlas_path}")
+        return atlas_path
     
     def backup_file(self, file_path, browser_name):
-        """备份书签文件"""
+        """备份书签文件（相同内容只保存一次）"""
         if not file_path.exists():
             return None
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"{browser_name}_bookmarks_{timestamp}.json"
-        backup_path = self.backup_dir / backup_name
-        
-        shutil.copy2(file_path, backup_path)
+        entry = self.backup_store.add(file_path, browser_name)
+        backup_path = self.backup_store.object_path(entry['digest'])
         self.logger.info(f"已备份 {browser_name}: {backup_path}")
         return backup_path
     
     def load_bookmarks(self, file_path):
-        """加载书签文件"""
+        """加载书签文件，转换为 BookmarkFile"""
         if not file_path.exists():
             self.logger.warning(f"书签文件不存在: {file_path}")
             return None
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = BookmarkFile.from_json(json.load(f))
+                self.metrics.count('bytes_read', f.tell())
+            self.metrics.count('nodes_scanned', data.node_count)
             return data
         except Exception as e:
             self.logger.error(f"读取书签失败 {file_path}: {e}")
@@ -104,13 +119,11 @@ class BookmarkSyncer:
             # 确保父目录存在
             file_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # 先写入临时文件
-            temp_path = file_path.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=3)
-            
-            # 替换原文件
-            shutil.move(temp_path, file_path)
+            # 写入唯一命名的临时文件，fsync 后原子替换原文件
+            if isinstance(data, BookmarkFile):
+                data = data.to_json()
+            written = write_json_atomic(file_path, data, indent=3)
+            self.metrics.count('bytes_written', written)
             self.logger.info(f"已保存书签: {file_path}")
             return True
         except Exception as e:
@@ -131,72 +144,316 @@ class BookmarkSyncer:
             return 0
         return file_path.stat().st_mtime
     
-    def merge_bookmark_folders(self, target, source, path="root"):
-        """递归合并书签文件夹"""
-        if not isinstance(target, dict) or not isinstance(source, dict):
+    def get_folder_fingerprints(self, name, data, digest):
+        """计算文件夹指纹；文件内容未变化时复用上次缓存的结果"""
+        cached = self.state.get_fingerprints(name, digest)
+        fingerprints = folder_fingerprints(data, cached)
+        if cached is None:
+            exported = export_fingerprints(data, fingerprints)
+            if exported is not None:
+                self.state.set_fingerprints(name, digest, exported)
+        return fingerprints
+    
+    def merge_bookmark_folders(self, target, source, path="root", fingerprints=None, ids=None, swapped=False):
+        """合并两个书签文件夹，返回合并结果（不修改输入，未变化的子树直接共用）
+        
+        fingerprints 为 (目标指纹, 源指纹)，两边指纹相同的子树直接跳过。
+        合并结果会写入两边，ids 为 Chrome 的 IdAllocator：来自 Atlas 的节点沿用 Chrome 中对应节点的 id，
+        只在 Atlas 中有的分配新 id。swapped 表示 target 来自 Atlas（较新的一边是 Atlas 时递归合并）。
+        """
+        if not isinstance(target, BookmarkNode) or not isinstance(source, BookmarkNode):
             return target
         
-        # 处理子节点
-        if 'children' in target and 'children' in source:
-            target_children = {self.get_bookmark_key(item): item for item in target['children']}
-            source_children = {self.get_bookmark_key(item): item for item in source['children']}
-            
-            # 合并子节点
-            merged_keys = set(target_children.keys()) | set(source_children.keys())
-            merged_children = []
-            
-            for key in sorted(merged_keys):
-                if key in target_children and key in source_children:
-                    # 两边都有，比较时间戳
-                    target_item = target_children[key]
-                    source_item = source_children[key]
-                    
-                    target_time = float(target_item.get('date_modified', 0) or target_item.get('date_added', 0))
-                    source_time = float(source_item.get('date_modified', 0) or source_item.get('date_added', 0))
-                    
-                    if source_time > target_time:
-                        # 源更新，使用源
-                        merged_children.append(source_item)
-                        self.logger.debug(f"使用较新的书签: {source_item.get('name', 'unknown')} (来自源)")
-                    else:
-                        # 目标更新或相同，使用目标
-                        merged_children.append(target_item)
-                    
-                    # 如果是文件夹，递归合并
-                    if target_item.get('type') == 'folder' and source_item.get('type') == 'folder':
-                        merged_item = merged_children[-1]
-                        self.merge_bookmark_folders(merged_item, source_item, f"{path}/{key}")
-                
-                elif key in source_children:
-                    # 只在源中有，添加
-                    merged_children.append(source_children[key])
-                    self.logger.info(f"添加新书签: {source_children[key].get('name', 'unknown')}")
+        if target.children is None or source.children is None:
+            return self._adopt(target, ids) if swapped else target
+        
+        if fingerprints:
+            target_fp = fingerprints[0].get(id(target))
+            if target_fp and target_fp == fingerprints[1].get(id(source)):
+                # 内容相同，直接共用 Chrome 一边的子树
+                return source if swapped else target
+        
+        target_items = target.children
+        target_keys = [self.get_bookmark_key(item) for item in target_items]
+        target_key_set = set(target_keys)
+        
+        # 源中的书签：两边都有的按键记录；只在源中有的，挂在它前面最近一个共有书签之后
+        source_children = {}
+        inserts = {}
+        anchor = None
+        for item in source.children:
+            key = self.get_bookmark_key(item)
+            if key in source_children:
+                continue
+            source_children[key] = item
+            if key in target_key_set:
+                anchor = key
+            else:
+                inserts.setdefault(anchor, []).append(item)
+        
+        # 按目标顺序输出，源独有的书签插入到稳定位置
+        merged_children = []
+        self._append_source_items(merged_children, inserts.pop(None, ()), None if swapped else ids)
+        
+        for key, target_item in zip(target_keys, target_items):
+            source_item = source_children.pop(key, None)
+            if source_item is None:
+                # 只在目标中有（或重复的键），保留
+                merged_children.append(self._adopt(target_item, ids) if swapped else target_item)
+            else:
+                # 两边都有，比较时间戳
+                if source_item.modified_time > target_item.modified_time:
+                    # 源更新，以源为准
+                    newer, older = source_item, target_item
+                    child_fingerprints = fingerprints[::-1] if fingerprints else None
+                    newer_swapped = not swapped
+                    self.logger.debug("使用较新的书签: %s (来自源)", source_item.name)
                 else:
-                    # 只在目标中有，保留
-                    merged_children.append(target_children[key])
+                    # 目标更新或相同，以目标为准
+                    newer, older = target_item, source_item
+                    child_fingerprints = fingerprints
+                    newer_swapped = swapped
+                
+                # 如果是文件夹，递归合并
+                if newer.type == FOLDER and older.type == FOLDER:
+                    newer = self.merge_bookmark_folders(newer, older, f"{path}/{key}", child_fingerprints,
+                                                        ids, newer_swapped)
+                elif newer_swapped:
+                    newer = self._adopt(newer, ids)
+                merged_children.append(self._with_id(newer, source_item if swapped else target_item, ids))
             
-            target['children'] = merged_children
+            if key in inserts:
+                self._append_source_items(merged_children, inserts.pop(key), None if swapped else ids)
         
-        # 更新其他属性
-        if 'date_modified' in source:
-            target['date_modified'] = source['date_modified']
+        # 子节点没有变化时直接返回原节点
+        if len(merged_children) == len(target_items) and all(a is b for a, b in zip(merged_children, target_items)):
+            return target
         
-        return target
+        return target.with_children(merged_children)
+    
+    def _append_source_items(self, merged_children, items, ids=None):
+        """添加只在源中存在的书签；ids 不为空时源是 Atlas，复制子树并分配新 id"""
+        for item in items:
+            merged_children.append(self._adopt(item, ids))
+            self.metrics.count('folders_created' if item.type == FOLDER else 'bookmarks_added')
+            self.logger.debug("添加新书签: %s", item.name)
+    
+    def _with_id(self, node, chrome_node, ids):
+        """两边都有的节点沿用 Chrome 中对应节点的 id"""
+        if ids is None or node.id == chrome_node.id:
+            return node
+        return BookmarkNode(node.type, node.name, node.url, chrome_node.id, node.date_added,
+                            node.date_modified, node.children, node.extra)
+    
+    def _adopt(self, node, ids):
+        """复制来自 Atlas 的子树（非递归），所有节点使用 ids 新分配的 id；ids 为空时原样返回"""
+        if ids is None:
+            return node
+        
+        def copy(item):
+            children = [] if item.children is not None else None
+            return BookmarkNode(item.type, item.name, item.url, ids.allocate(), item.date_added,
+                                item.date_modified, children, item.extra)
+        
+        root = copy(node)
+        stack = [(node, root)]
+        while stack:
+            original, new = stack.pop()
+            for child in original.children or ():
+                child_copy = copy(child)
+                new.children.append(child_copy)
+                if child.children:
+                    stack.append((child, child_copy))
+        return root
     
     def get_bookmark_key(self, bookmark):
         """生成书签的唯一键"""
-        if bookmark.get('type') == 'url':
-            # URL类型：使用URL作为键
-            return f"url:{bookmark.get('url', '')}"
-        elif bookmark.get('type') == 'folder':
+        if bookmark.type == URL:
+            # URL类型：使用规范化的URL作为键
+            return f"url:{self.canonicalizer.canonical(bookmark.url)}"
+        elif bookmark.type == FOLDER:
             # 文件夹类型：使用名称作为键
-            return f"folder:{bookmark.get('name', '')}"
+            return f"folder:{bookmark.name}"
         else:
             # 其他类型：使用名称
-            return f"other:{bookmark.get('name', '')}"
+            return f"other:{bookmark.name}"
+    
+    def merge_roots(self, chrome_data, atlas_data, fingerprints=None):
+        """一次合并两边的根节点，返回 (合并后的 Chrome, 合并后的 Atlas)
+        
+        两边共用同一份合并结果，只复制发生变化的节点，不深拷贝整棵树。
+        fingerprints 为 (Chrome 指纹, Atlas 指纹)，用于跳过相同的子树。
+        """
+        chrome_roots = dict(chrome_data.roots)
+        atlas_roots = dict(atlas_data.roots)
+        # 两边写入同一份合并结果，新 id 从两边最大的 id 之后分配
+        ids = chrome_data.ids
+        ids.last_id = max(ids.last_id, atlas_data.ids.last_id)
+        
+        for root_key in chrome_data.roots:
+            if root_key in atlas_data.roots:
+                merged = self.merge_bookmark_folders(
+                    chrome_data.roots[root_key],
+                    atlas_data.roots[root_key],
+                    root_key,
+                    fingerprints,
+                    ids
+                )
+                chrome_roots[root_key] = merged
+                atlas_roots[root_key] = merged
+        
+        merged_atlas = BookmarkFile(atlas_roots, atlas_data.extra, ids, atlas_data.node_count)
+        return chrome_data.with_roots(chrome_roots), merged_atlas
+    
+    def is_unchanged(self, original, merged):
+        """合并结果与原文件在语义上是否相同（同一对象直接判定，否则比较指纹）"""
+        original_roots = original.roots
+        merged_roots = merged.roots
+        changed = [key for key in merged_roots if merged_roots[key] is not original_roots.get(key)]
+        if not changed:
+            return True
+        original_fps = folder_fingerprints(BookmarkFile({key: original_roots[key] for key in changed if key in original_roots}))
+        merged_fps = folder_fingerprints(BookmarkFile({key: merged_roots[key] for key in changed}))
+        for key in changed:
+            if key not in original_roots:
+                return False
+            if original_fps.get(id(original_roots[key])) != merged_fps.get(id(merged_roots[key])):
+                return False
+        return True
+    
+    def roots_in_sync(self, chrome_data, atlas_data, fingerprints):
+        """两边共有的根节点指纹是否全部相同"""
+        chrome_roots = chrome_data.roots
+        atlas_roots = atlas_data.roots
+        for root_key in chrome_roots:
+            if root_key not in atlas_roots:
+                continue
+            chrome_fp = fingerprints[0].get(id(chrome_roots[root_key]))
+            if not chrome_fp or chrome_fp != fingerprints[1].get(id(atlas_roots[root_key])):
+                return False
+        return True
+    
+    def load_base(self):
+        """上次同步后两边共有书签的基准快照，没有时返回 None（首次同步）"""
+        data = self.state.get_base()
+        return Snapshot.from_json(data, self.canonicalizer.signature) if data else None
+    
+    def snapshot(self, data, roots):
+        return Snapshot.from_tree(data, self.canonicalizer.key, roots)
+    
+    def side_journal(self, name, data, fp, base, roots):
+        """一边相对基准的变更日志；文件自上次同步后没有变化时不需要遍历"""
+        if self.state.is_unchanged(name, fp):
+            return Journal()
+        return Journal.diff(base, self.snapshot(data, roots))
+    
+    def save_state(self, chrome_fp, atlas_fp, base=None):
+        """记录本次同步后的文件指纹，以及新的基准快照；指纹为 None 时忘掉该文件，下次同步重新比较"""
+        if base is not None:
+            self.state.set_base(base.to_json(self.canonicalizer.signature))
+        for name, fp in (('chrome', chrome_fp), ('atlas', atlas_fp)):
+            if fp is None:
+                self.state.forget_file(name)
+            else:
+                self.state.update_file(name, fp)
+        try:
+            self.state.save()
+        except OSError as e:
+            self.logger.warning(f"保存同步状态失败: {e}")
     
     def sync(self):
-        """执行同步"""
+        """执行同步；同一时间只有一个进程同步，同步期间到达的触发合并为一次后续同步"""
+        result = self.lock.run(self.sync_once, self.logger)
+        if result is None:
+            self.logger.info("✓ 另一个进程已经完成了这次同步")
+            return True
+        return result
+    
+    def sync_once(self):
+        """执行一次同步，并记录本次同步的指标"""
+        self.metrics = SyncMetrics('sync_v1')
+        success = False
+        try:
+            success = self.run_sync()
+            return success
+        finally:
+            self.metrics.finish(success)
+            self.record_metrics()
+    
+    def record_metrics(self):
+        """输出本次同步的指标"""
+        metrics = self.metrics
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in metrics.phases.items())
+        self.logger.info(f"耗时 {metrics.duration * 1000:.0f}ms（{phases or '无'}）")
+        try:
+            metrics.write_jsonl(self.metrics_path)
+            if self.prometheus_path:
+                metrics.write_prometheus(self.prometheus_path)
+        except OSError as e:
+            self.logger.warning(f"写入同步指标失败: {e}")
+    
+    def run_three_way(self, base, chrome_data, atlas_data, chrome_fp, atlas_fp):
+        """三方合并：两边相对基准的变更互相应用，删除、移动和改名也会同步"""
+        roots = chrome_data.roots.keys() & atlas_data.roots.keys()
+        with self.metrics.phase('diff'):
+            chrome_journal = self.side_journal('chrome', chrome_data, chrome_fp, base, roots)
+            atlas_journal = self.side_journal('atlas', atlas_data, atlas_fp, base, roots)
+        for name, journal in (('Chrome', chrome_journal), ('Atlas', atlas_journal)):
+            counts = ', '.join(f"{op} {count}" for op, count in journal.counts().items())
+            self.logger.info(f"{name} 自上次同步后的变更: {counts or '无'}")
+        
+        if not chrome_journal and not atlas_journal:
+            self.logger.info("✓ 书签内容一致，无需更新")
+            with self.metrics.phase('state'):
+                self.save_state(chrome_fp, atlas_fp)
+            return True
+        
+        self.logger.info("\n正在备份...")
+        with self.metrics.phase('backup'):
+            self.backup_file(self.chrome_path, "chrome")
+            self.backup_file(self.atlas_path, "atlas")
+            self.backup_store.prune()
+        
+        # 两边修改了同一个书签时以较新的文件为准
+        chrome_wins = self.get_modification_time(self.chrome_path) >= self.get_modification_time(self.atlas_path)
+        self.logger.info("\n正在合并书签...")
+        with self.metrics.phase('merge'):
+            merge = ThreeWayMerge(base, chrome_journal, atlas_journal, chrome_wins)
+            chrome_changed, atlas_changed = merge.apply(chrome_data, atlas_data, self.canonicalizer.key, self.clock)
+        detail = self.logger.isEnabledFor(logging.DEBUG)
+        for name, journal in (('Chrome', merge.to_chrome), ('Atlas', merge.to_atlas)):
+            if detail:
+                for line in journal.describe():
+                    self.logger.debug("%s %s", name, line)
+            for op, count in journal.counts().items():
+                self.metrics.count(f"{name.lower()}_{op}", count)
+        
+        self.logger.info("\n正在保存同步结果...")
+        chrome_saved = atlas_saved = True
+        with self.metrics.phase('save'):
+            if chrome_changed:
+                chrome_saved = self.save_bookmarks(self.chrome_path, chrome_data)
+            if atlas_changed:
+                atlas_saved = self.save_bookmarks(self.atlas_path, atlas_data)
+        if not (chrome_saved and atlas_saved):
+            self.logger.error("\n❌ 书签保存失败")
+            return False
+        
+        # 有变更没能应用时不记录发出一方的指纹，下次同步重新与基准比较并重试
+        unapplied = merge.unapplied()
+        if unapplied:
+            self.logger.warning(f"⚠️  部分变更没能应用到另一边，下次同步时重试: {', '.join(sorted(unapplied))}")
+        with self.metrics.phase('state'):
+            self.save_state(
+                None if 'chrome' in unapplied else self.state.fingerprint('chrome', self.chrome_path),
+                None if 'atlas' in unapplied else self.state.fingerprint('atlas', self.atlas_path),
+                merge.new_base()
+            )
+        self.logger.info("✅ 书签同步完成！")
+        return True
+    
+    def run_sync(self):
+        """同步流程"""
         self.logger.info("=" * 60)
         self.logger.info("开始书签同步")
         self.logger.info("=" * 60)
@@ -204,13 +461,13 @@ class BookmarkSyncer:
         # 1. 查找 Atlas 书签
         atlas_path = self.find_atlas_bookmarks()
         if not atlas_path:
+            if self.atlas_path_given:
+                self.logger.error(f"❌ Atlas 书签文件不存在: {self.atlas_path}")
+                return False
             self.logger.error("❌ 未找到 Atlas 书签文件")
             self.logger.info("\n请手动设置 Atlas 书签路径，可能的位置：")
-            app_support = Path.home() / "Library/Application Support"
-            if app_support.exists():
-                for item in app_support.iterdir():
-                    if 'atlas' in item.name.lower() or 'openai' in item.name.lower():
-                        self.logger.info(f"  - {item}")
+            for item in self.atlas_locator.hints():
+                self.logger.info(f"  - {item}")
             return False
         
         self.atlas_path = atlas_path
@@ -223,28 +480,52 @@ class BookmarkSyncer:
         self.logger.info(f"✓ Chrome 书签: {self.chrome_path}")
         self.logger.info(f"✓ Atlas 书签: {self.atlas_path}")
         
-        # 3. 检查文件是否相同
-        chrome_hash = self.get_file_hash(self.chrome_path)
-        atlas_hash = self.get_file_hash(self.atlas_path)
+        # 3. 检查文件自上次同步后是否变化
+        with self.metrics.phase('fingerprint'):
+            chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+            atlas_fp = self.state.fingerprint('atlas', self.atlas_path)
         
-        if chrome_hash == atlas_hash:
+        if self.state.is_unchanged('chrome', chrome_fp) and self.state.is_unchanged('atlas', atlas_fp):
             self.logger.info("✓ 书签已经同步，无需更新")
             return True
         
-        # 4. 备份
-        self.logger.info("\n正在备份...")
-        self.backup_file(self.chrome_path, "chrome")
-        self.backup_file(self.atlas_path, "atlas")
-        
-        # 5. 加载书签
+        # 4. 加载书签
         self.logger.info("\n正在加载书签...")
-        chrome_data = self.load_bookmarks(self.chrome_path)
-        atlas_data = self.load_bookmarks(self.atlas_path)
+        with self.metrics.phase('load'):
+            chrome_data = self.load_bookmarks(self.chrome_path)
+            atlas_data = self.load_bookmarks(self.atlas_path)
         
         if not chrome_data or not atlas_data:
             self.logger.error("❌ 加载书签失败")
             return False
         
+        # 有上次同步的基准时做三方合并；首次同步时只合并、不删除
+        base = self.load_base()
+        if base is not None:
+            return self.run_three_way(base, chrome_data, atlas_data, chrome_fp, atlas_fp)
+        roots = chrome_data.roots.keys() & atlas_data.roots.keys()
+        
+        # 5. 比较语义指纹（忽略 id、时间戳和 checksum）
+        with self.metrics.phase('compare'):
+            fingerprints = (
+                self.get_folder_fingerprints('chrome', chrome_data, chrome_fp['digest']),
+                self.get_folder_fingerprints('atlas', atlas_data, atlas_fp['digest']),
+            )
+            in_sync = self.roots_in_sync(chrome_data, atlas_data, fingerprints)
+        
+        if in_sync:
+            self.logger.info("✓ 书签内容一致，无需更新")
+            with self.metrics.phase('state'):
+                self.save_state(chrome_fp, atlas_fp, self.snapshot(chrome_data, roots))
+            return True
+        
+        # 备份
+        self.logger.info("\n正在备份...")
+        with self.metrics.phase('backup'):
+            self.backup_file(self.chrome_path, "chrome")
+            self.backup_file(self.atlas_path, "atlas")
+            self.backup_store.prune()
+        
         # 6. 比较修改时间
         chrome_time = self.get_modification_time(self.chrome_path)
         atlas_time = self.get_modification_time(self.atlas_path)
@@ -258,34 +539,34 @@ class BookmarkSyncer:
         # 7. 智能合并
         self.logger.info("\n正在合并书签...")
         
-        # 深拷贝数据
-        import copy
-        merged_chrome = copy.deepcopy(chrome_data)
-        merged_atlas = copy.deepcopy(atlas_data)
-        
-        # 合并根节点
-        if 'roots' in chrome_data and 'roots' in atlas_data:
-            for root_key in chrome_data['roots']:
-                if root_key in atlas_data['roots']:
-                    # 双向合并
-                    self.merge_bookmark_folders(
-                        merged_chrome['roots'][root_key],
-                        atlas_data['roots'][root_key],
-                        root_key
-                    )
-                    self.merge_bookmark_folders(
-                        merged_atlas['roots'][root_key],
-                        chrome_data['roots'][root_key],
-                        root_key
-                    )
+        with self.metrics.phase('merge'):
+            merged_chrome, merged_atlas = self.merge_roots(chrome_data, atlas_data, fingerprints)
+        counters = self.metrics.counters
+        self.logger.info(f"合并完成：新增 {counters['bookmarks_added']} 个书签，{counters['folders_created']} 个文件夹")
         
         # 8. 保存合并后的书签
         self.logger.info("\n正在保存同步结果...")
         
-        chrome_saved = self.save_bookmarks(self.chrome_path, merged_chrome)
-        atlas_saved = self.save_bookmarks(self.atlas_path, merged_atlas)
+        # 只写入内容确实变化的一边
+        chrome_saved = atlas_saved = True
+        with self.metrics.phase('save'):
+            if self.is_unchanged(chrome_data, merged_chrome):
+                self.logger.info("Chrome 书签没有变化，跳过写入")
+            else:
+                chrome_saved = self.save_bookmarks(self.chrome_path, merged_chrome)
+            if self.is_unchanged(atlas_data, merged_atlas):
+                self.logger.info("Atlas 书签没有变化，跳过写入")
+            else:
+                atlas_saved = self.save_bookmarks(self.atlas_path, merged_atlas)
         
         if chrome_saved and atlas_saved:
+            with self.metrics.phase('state'):
+                # 共有的根节点两边是同一个合并结果
+                self.save_state(
+                    self.state.fingerprint('chrome', self.chrome_path),
+                    self.state.fingerprint('atlas', self.atlas_path),
+                    self.snapshot(merged_chrome, roots)
+                )
             self.logger.info("\n" + "=" * 60)
             self.logger.info("✅ 书签同步完成！")
             self.logger.info("=" * 60)
@@ -297,7 +578,17 @@ class BookmarkSyncer:
 
 def main():
     """主函数"""
-    syncer = BookmarkSyncer()
+    parser = argparse.ArgumentParser(description="Chrome ⇄ Atlas 双向书签同步")
+    parser.add_argument('--url-rules', metavar='FILE',
+                        help="URL 规范化选项（JSON），决定哪些 URL 视为同一个书签，例如 {\"strip_www\": true}")
+    args = parser.parse_args()
+    try:
+        url_rules = UrlCanonicalizer.load(args.url_rules) if args.url_rules else None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ 读取 URL 规范化选项失败 {args.url_rules}: {e}")
+        sys.exit(1)
+    
+    syncer = BookmarkSyncer(url_rules=url_rules)
     
     print("\n" + "=" * 60)
     print("  🔖 浏览器书签同步工具")
@@ -309,10 +600,10 @@ def main():
     if not success:
         print("\n❌ 同步失败，请查看日志了解详情")
         print(f"日志位置: {syncer.backup_dir / 'sync.log'}")
-        exit(1)
+        sys.exit(1)
     else:
         print("\n✅ 同步成功！请重启浏览器查看最新书签")
-        exit(0)
+        sys.exit(0)
 
 if __name__ == "__main__":
     main()
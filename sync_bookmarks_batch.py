@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+批量同步（服务器模式）
+一次运行处理清单或目录中的大量 (源, 目标) 书签文件对：进程池限制并发，每对有超时，
+单对失败不影响其他对，最后输出汇总的吞吐量报告
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from bookmark_backup import RetentionPolicy
+from bookmark_io import write_json_atomic
+from bookmark_logging import setup_logging
+from bookmark_metrics import COUNTERS
+from bookmark_url import UrlCanonicalizer
+from sync_bookmarks_v2 import BookmarkSyncerV2
+
+# 报告中最多列出的失败条目
+MAX_REPORTED_FAILURES = 100
+
+
+class BatchPair:
+    """一对需要同步的书签文件：源（Atlas）→ 目标（Chrome）"""
+
+    def __init__(self, name, source, target):
+        self.name = name
+        self.source = Path(source)
+        self.target = Path(target)
+
+
+class PairTimeout(BaseException):
+    """单对同步超时；继承 BaseException，避免被同步流程中的 except Exception 当作读取失败处理"""
+
+
+def safe_name(value):
+    """文件对名称用作状态目录名，只保留安全字符"""
+    return re.sub(r'[^\w.-]+', '_', value).strip('._') or 'pair'
+
+
+def iter_manifest(manifest_path):
+    """逐行读取清单，产出 BatchPair
+
+    每行为 JSON 对象 {"source": ..., "target": ..., "name": 可选}，或者用制表符分隔的 "源<TAB>目标"；
+    空行和以 # 开头的行会被跳过。没有名称时取目标文件所在目录名。
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                source, target, name = item['source'], item['target'], item.get('name')
+            else:
+                try:
+                    source, target = line.split('\t')
+                except ValueError:
+                    raise ValueError(f"{manifest_path}:{line_no}: 需要 \"源<TAB>目标\" 或 JSON 对象") from None
+                name = None
+            source = Path(os.path.expanduser(source))
+            target = Path(os.path.expanduser(target))
+            yield BatchPair(name or target.parent.name, source, target)
+
+
+def iter_pair_dir(directory, source_name="Atlas", target_name="Chrome"):
+    """目录中的每个子目录为一对：<子目录>/Atlas → <子目录>/Chrome，名称为子目录名"""
+    with os.scandir(directory) as entries:
+        names = sorted(entry.name for entry in entries if entry.is_dir())
+    for name in names:
+        pair_dir = Path(directory) / name
+        yield BatchPair(name, pair_dir / source_name, pair_dir / target_name)
+
+
+def unique_pairs(pairs):
+    """名称转为安全的目录名，并保证唯一（名称决定每对的状态和备份目录）"""
+    names = set()
+    for pair in pairs:
+        base = name = safe_name(pair.name)
+        i = 2
+        while name in names:
+            name = f"{base}-{i}"
+            i += 1
+        names.add(name)
+        pair.name = name
+        yield pair
+
+
+@contextmanager
+def deadline(seconds):
+    """超过 seconds 秒时在当前线程抛出 PairTimeout；不支持 SIGALRM 的平台不限时"""
+    if not seconds or not hasattr(signal, 'setitimer'):
+        yield
+        return
+
+    def expired(signum, frame):
+        raise PairTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def init_worker(log_file, level):
+    """子进程初始化：日志写入批量同步日志，而不是第一个文件对的日志"""
+    setup_logging(log_file, level)
+
+
+def sync_pair(pair, state_dir, retention=None, timeout=None, dry_run=False, url_rules=None):
+    """在当前进程中同步一对文件，返回结果记录；批量同步的子进程入口，不抛出异常
+
+    每对使用 state_dir/<名称> 作为备份目录（同步状态、备份、锁和指标互不影响）。
+    """
+    result = {
+        'name': pair.name,
+        'source': str(pair.source),
+        'target': str(pair.target),
+        'status': 'failed',
+    }
+    start = time.perf_counter()
+    syncer = None
+    try:
+        with deadline(timeout):
+            syncer = BookmarkSyncerV2(pair.target, pair.source, Path(state_dir) / pair.name, retention,
+                                      url_rules=url_rules)
+            if dry_run:
+                syncer.metrics = syncer.new_metrics()
+                plan = syncer.plan_sync()
+                success = plan is not None
+                if success:
+                    result['planned'] = plan.changeset.bookmark_count
+            else:
+                success = syncer.sync_atlas_to_chrome()
+        if success:
+            result['status'] = 'ok'
+        else:
+            result['error'] = "同步失败，详见日志"
+    except PairTimeout:
+        result['status'] = 'timeout'
+        result['error'] = f"超过 {timeout} 秒"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['duration_seconds'] = round(time.perf_counter() - start, 6)
+    if syncer is not None:
+        result['counters'] = dict(syncer.metrics.counters)
+    return result
+
+
+class BatchReport:
+    """批量同步的汇总：各状态数量、计数器总和、吞吐量和单对耗时分布"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.statuses = {'ok': 0, 'failed': 0, 'timeout': 0}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.durations = []
+        self.failures = []
+        self.duration = None
+
+    def add(self, result):
+        status = result['status']
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        for name, value in result.get('counters', {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.durations.append(result['duration_seconds'])
+        if status != 'ok' and len(self.failures) < MAX_REPORTED_FAILURES:
+            self.failures.append({key: result.get(key) for key in ('name', 'status', 'error')})
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    @property
+    def total(self):
+        return len(self.durations)
+
+    @property
+    def success(self):
+        return self.statuses['ok'] == self.total
+
+    def percentile(self, fraction):
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_json(self):
+        wall = self.duration or 0.0
+        return {
+            'time': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'pairs': self.total,
+            'statuses': dict(self.statuses),
+            'wall_seconds': round(wall, 6),
+            'pairs_per_second': round(self.total / wall, 3) if wall else None,
+            'read_mb_per_second': round(self.counters['bytes_read'] / wall / 1e6, 3) if wall else None,
+            'pair_seconds': {
+                'mean': round(sum(self.durations) / self.total, 6) if self.total else 0.0,
+                'p50': round(self.percentile(0.5), 6),
+                'p95': round(self.percentile(0.95), 6),
+                'max': round(max(self.durations, default=0.0), 6),
+            },
+            'counters': dict(self.counters),
+            'failures': self.failures,
+        }
+
+    def summary(self):
+        """几行可读的汇总"""
+        data = self.to_json()
+        yield (f"共 {self.total} 对：成功 {self.statuses['ok']}，失败 {self.statuses['failed']}，"
+               f"超时 {self.statuses['timeout']}")
+        yield (f"耗时 {data['wall_seconds']:.1f} 秒，{data['pairs_per_second'] or 0:.1f} 对/秒，"
+               f"读取 {data['read_mb_per_second'] or 0:.1f} MB/秒")
+        yield (f"单对耗时 p50 {data['pair_seconds']['p50'] * 1000:.0f}ms，"
+               f"p95 {data['pair_seconds']['p95'] * 1000:.0f}ms，最长 {data['pair_seconds']['max'] * 1000:.0f}ms")
+        yield f"新增书签 {self.counters['bookmarks_added']} 个，新建文件夹 {self.counters['folders_created']} 个"
+
+
+class BatchSyncer:
+    """用进程池批量同步文件对：并发数有上限，每对有超时，单对失败（包括子进程崩溃）不影响其他对"""
+
+    def __init__(self, state_dir, retention=None, workers=None, timeout=None, dry_run=False,
+                 level=logging.WARNING, url_rules=None):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.dry_run = dry_run
+        self.url_rules = url_rules
+        self.log_file = self.state_dir / "batch.log"
+        self.level = level
+        setup_logging(self.log_file, level)
+        self.logger = logging.getLogger(__name__)
+
+    def new_pool(self, workers=None):
+        return ProcessPoolExecutor(max_workers=workers or self.workers, initializer=init_worker,
+                                   initargs=(self.log_file, self.level))
+
+    def run(self, pairs, results_path=None):
+        """同步所有文件对（可以是生成器），返回 BatchReport；每对的结果逐行写入 results_path"""
+        report = BatchReport()
+        results_file = open(results_path, 'w', encoding='utf-8') if results_path else None
+
+        def record(result):
+            report.add(result)
+            if results_file:
+                results_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            if result['status'] != 'ok':
+                self.logger.error(f"❌ [{result['name']}] {result['status']}: {result.get('error') or '同步失败'}")
+
+        args = (self.state_dir, self.retention, self.timeout, self.dry_run, self.url_rules)
+        try:
+            if self.workers <= 1:
+                for pair in pairs:
+                    record(sync_pair(pair, *args))
+            else:
+                self.run_pool(pairs, args, record)
+        finally:
+            report.finish()
+            if results_file:
+                results_file.close()
+        return report
+
+    def run_pool(self, pairs, args, record):
+        """提交到进程池；同时排队的文件对不超过进程数的两倍，清单按需读取"""
+        max_pending = self.workers * 2
+        pending = {}
+        # 子进程崩溃时同一进程池中的其他任务也会失败，这些文件对最后逐个重试
+        retry = []
+        pool = self.new_pool()
+
+        def collect():
+            nonlocal pool
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair, owner = pending.pop(future)
+                try:
+                    record(future.result())
+                except BrokenProcessPool:
+                    if owner is pool:
+                        pool.shutdown(wait=False)
+                        pool = self.new_pool()
+                    retry.append(pair)
+
+        try:
+            for pair in pairs:
+                while len(pending) >= max_pending:
+                    collect()
+                pending[pool.submit(sync_pair, pair, *args)] = (pair, pool)
+            while pending:
+                collect()
+        finally:
+            pool.shutdown()
+        self.retry_isolated(retry, args, record)
+
+    def retry_isolated(self, pairs, args, record):
+        """在单独的子进程中逐个重试，只有真正导致崩溃的文件对记为失败"""
+        if pairs:
+            self.logger.warning(f"⚠️  工作进程异常退出，逐个重试 {len(pairs)} 对")
+        for pair in pairs:
+            with self.new_pool(1) as pool:
+                try:
+                    record(pool.submit(sync_pair, pair, *args).result())
+                except BrokenProcessPool:
+                    record({'name': pair.name, 'source': str(pair.source), 'target': str(pair.target),
+                            'status': 'failed', 'error': "工作进程异常退出", 'duration_seconds': 0.0})
+
+    def write_report(self, report, report_path):
+        write_json_atomic(Path(report_path), report.to_json(), fsync=False, indent=2)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="批量同步书签文件对（Atlas → Chrome），适合在服务器上处理导出的配置文件")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', metavar='FILE',
+                        help="清单文件：每行一个 JSON 对象 {source, target, name} 或 \"源<TAB>目标\"")
+    source.add_argument('--dir', metavar='DIR', help="每个子目录为一对，包含源文件和目标文件")
+    parser.add_argument('--source-name', default="Atlas", help="--dir 模式下子目录中源书签的文件名")
+    parser.add_argument('--target-name', default="Chrome", help="--dir 模式下子目录中目标书签的文件名")
+    parser.add_argument('--state-dir', required=True,
+                        help="状态目录：每对的同步状态和备份放在 <状态目录>/<名称>/ 下，日志和报告也写在这里")
+    parser.add_argument('--workers', type=int, help="并发进程数（默认 CPU 核数）")
+    parser.add_argument('--timeout', type=float, default=60.0, help="单对同步的超时秒数（0 表示不限时）")
+    parser.add_argument('--dry-run', action='store_true', help="只规划、统计将要添加的书签，不备份、不写入")
+    parser.add_argument('--report', metavar='FILE', help="汇总报告（JSON），默认 <状态目录>/batch_report.json")
+    parser.add_argument('--results', metavar='FILE', help="每对的结果（JSON Lines），默认 <状态目录>/batch_results.jsonl")
+    parser.add_argument('--url-rules', metavar='FILE',
+                        help="URL 规范化选项（JSON），所有文件对共用，例如 {\"strip_www\": true}")
+    parser.add_argument('--keep-last', type=int, default=3, help="每对保留最近的备份数量")
+    parser.add_argument('--keep-daily', type=int, default=7, help="每对按天保留的备份数量")
+    parser.add_argument('--verbose', action='store_true', help="记录每对的同步过程（默认只记录警告和错误）")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    retention = RetentionPolicy(args.keep_last, hourly=0, daily=args.keep_daily, weekly=0)
+    try:
+        url_rules = UrlCanonicalizer.load(args.url_rules) if args.url_rules else None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ 读取 URL 规范化选项失败 {args.url_rules}: {e}")
+        sys.exit(2)
+    syncer = BatchSyncer(args.state_dir, retention, workers=args.workers, timeout=args.timeout or None,
+                         dry_run=args.dry_run, level=logging.INFO if args.verbose else logging.WARNING,
+                         url_rules=url_rules)
+
+    if args.manifest:
+        pairs = iter_manifest(args.manifest)
+    else:
+        pairs = iter_pair_dir(args.dir, args.source_name, args.target_name)
+
+    print(f"🔖 批量同步：{args.manifest or args.dir}（{syncer.workers} 个进程）")
+    try:
+        report = syncer.run(unique_pairs(pairs), args.results or syncer.state_dir / "batch_results.jsonl")
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取文件对失败: {e}")
+        sys.exit(2)
+
+    report_path = args.report or syncer.state_dir / "batch_report.json"
+    syncer.write_report(report, report_path)
+    for line in report.summary():
+        print(line)
+    print(f"报告: {report_path}")
+    sys.exit(0 if report.success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+多目标同步（fan-out）
+一个源书签同步到配置文件中的多个目标：源只解析一次，各目标在进程池中并发同步
+"""
+
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bookmark_lock import SyncLock
+from bookmark_metrics import write_prometheus
+from bookmark_model import URL, BookmarkFile, BookmarkNode
+from bookmark_state import SyncState
+from bookmark_tree import TreeIndex, walk_tree
+from bookmark_watch import run_on_change
+from sync_bookmarks_v2 import BookmarkSyncerV2
+
+
+class SyncTarget:
+    """多目标同步的一个目标书签文件"""
+    
+    def __init__(self, name, path, root_mapping=None):
+        self.name = name
+        self.path = Path(path)
+        self.root_mapping = root_mapping or {}
+
+
+def load_fanout_config(config_path):
+    """读取多目标配置，返回 (源书签路径, [SyncTarget])
+    
+    {"source": "…/Atlas/Bookmarks",
+     "targets": [{"name": "work", "path": "…/Chrome/Profile 1/Bookmarks", "root_mapping": {"书签栏": "other"}},
+                 {"path": "~/Library/Application Support/Google/Chrome/*/Bookmarks"}]}
+    
+    路径中带通配符时展开为多个目标，名称默认取所在的配置文件夹名（如 Default、Profile 1）。
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    
+    source = Path(os.path.expanduser(config['source']))
+    targets = []
+    names = set()
+    # 通配符和明确列出的路径可能指向同一个文件，同一个文件只同步一次（第一个配置生效）
+    seen = {source.resolve()}
+    for item in config.get('targets', []):
+        pattern = os.path.expanduser(item['path'])
+        paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            path = Path(path)
+            resolved = path.resolve()
+            if resolved in seen:
+                continue
+            seen.add(resolved)
+            name = item.get('name') if len(paths) == 1 else None
+            name = name or path.parent.name
+            # 名称用于状态文件和备份记录，必须唯一
+            base, i = name, 2
+            while name in names:
+                name = f"{base}-{i}"
+                i += 1
+            names.add(name)
+            targets.append(SyncTarget(name, path, item.get('root_mapping')))
+    return source, targets
+
+
+def source_records(index):
+    """把源书签索引压缩为 (文件夹路径, 索引键, URL, 名称, 添加时间) 列表，便于传给子进程"""
+    return [(path, key, node.url, node.name, node.date_added) for key, (path, node) in index.url_map.items()]
+
+
+def index_from_records(records):
+    """由 source_records 的结果重建 plan_sync 需要的 TreeIndex"""
+    index = TreeIndex()
+    url_map = index.url_map
+    for path, key, url, name, date_added in records:
+        url_map[key] = (path, BookmarkNode(URL, name, url, date_added=date_added))
+    index.url_set = set(url_map)
+    return index
+
+
+def sync_target(target, source_path, records, backup_dir, retention, dry_run=False, url_rules=None):
+    """在当前进程中同步一个目标，返回 (是否成功, 变更集, 指标)；多目标同步的子进程入口"""
+    syncer = BookmarkSyncerV2(target.path, source_path, backup_dir, retention,
+                              target_name=target.name, root_mapping=target.root_mapping, url_rules=url_rules)
+    syncer.prune_after_backup = False
+    syncer.metrics = syncer.new_metrics()
+    success = False
+    changeset = None
+    try:
+        plan = syncer.plan_sync(source=lambda: index_from_records(records))
+        if plan is not None:
+            changeset = plan.changeset
+            success = True if dry_run else syncer.apply_plan(plan)
+    except Exception as e:
+        syncer.logger.error(f"❌ [{target.name}] 同步失败: {e}")
+    finally:
+        syncer.metrics.finish(success)
+        if not dry_run:
+            syncer.record_metrics()
+    return success, changeset, syncer.metrics
+
+
+class FanoutSyncerV2:
+    """把一个源书签同步到多个目标：源只解析一次，各目标在进程池中并发加载、解析和写入"""
+    
+    def __init__(self, source_path, targets, backup_dir=None, retention=None, workers=None,
+                 prometheus_path=None, url_rules=None):
+        if not targets:
+            raise ValueError("至少需要一个同步目标")
+        self.source_path = Path(source_path)
+        self.targets = list(targets)
+        self.retention = retention
+        # 主进程中的同步器只用来读取配置好的状态名称和统一清理备份，实际同步在 sync_target 中进行
+        self.syncers = [
+            BookmarkSyncerV2(target.path, self.source_path, backup_dir, retention,
+                             target_name=target.name, root_mapping=target.root_mapping, url_rules=url_rules)
+            for target in self.targets
+        ]
+        first = self.syncers[0]
+        self.canonicalizer = first.canonicalizer
+        self.logger = first.logger
+        self.backup_dir = first.backup_dir
+        self.lock = SyncLock(self.backup_dir, "sync_fanout")
+        self.workers = workers or min(len(self.targets), os.cpu_count() or 1)
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+    
+    def load_source(self):
+        """解析并索引源书签，返回可以传给子进程的记录列表；失败返回 None"""
+        try:
+            with open(self.source_path, 'r', encoding='utf-8') as f:
+                data = BookmarkFile.from_json(json.load(f))
+        except (OSError, ValueError) as e:
+            self.logger.error(f"❌ 读取书签失败 {self.source_path}: {e}")
+            return None
+        return source_records(walk_tree(data, url_key=self.canonicalizer.key))
+    
+    def pending_targets(self):
+        """源书签自上次同步后有变化（或没有 URL 缓存）的目标"""
+        pending = []
+        for target, syncer in zip(self.targets, self.syncers):
+            # 状态由执行同步的进程更新，每次重新读取
+            state = SyncState(self.backup_dir, syncer.state_name, self.canonicalizer.signature)
+            try:
+                atlas_fp = state.fingerprint('atlas', self.source_path)
+            except OSError:
+                pending.append(target)
+                continue
+            if not (state.is_unchanged('atlas', atlas_fp) and state.has_urls()):
+                pending.append(target)
+        return pending
+    
+    def sync(self, dry_run=False):
+        """同步到所有目标；同一时间只有一个进程同步，同步期间的触发合并为一次后续同步"""
+        if dry_run:
+            return self.sync_once(dry_run)
+        result = self.lock.run(self.sync_once, self.logger)
+        if result is None:
+            self.logger.info("✓ 另一个进程已经完成了这次同步")
+            return True
+        return result
+    
+    def sync_once(self, dry_run=False):
+        """执行一次多目标同步，返回是否所有目标都成功"""
+        self.logger.info("=" * 70)
+        self.logger.info(f"开始书签同步：{self.source_path.name} → {len(self.targets)} 个目标")
+        self.logger.info("=" * 70)
+        
+        if not self.source_path.exists():
+            self.logger.error(f"❌ 源书签不存在: {self.source_path}")
+            return False
+        
+        targets = self.pending_targets()
+        if not targets:
+            self.logger.info("✓ 源书签自上次同步后没有变化，跳过")
+            return True
+        
+        # 源书签只解析一次
+        records = self.load_source()
+        if records is None:
+            return False
+        
+        # 每个目标在独立进程中加载、规划和写入（解析 JSON 受 GIL 限制，线程无法并行）
+        args = [(target, self.source_path, records, self.backup_dir, self.retention, dry_run, self.canonicalizer)
+                for target in targets]
+        if self.workers > 1 and len(targets) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(targets))) as pool:
+                futures = [pool.submit(sync_target, *item) for item in args]
+                results = []
+                for target, future in zip(targets, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        self.logger.error(f"❌ [{target.name}] 同步失败: {e}")
+                        results.append((False, None, None))
+        else:
+            results = [sync_target(*item) for item in args]
+        
+        all_success = True
+        for target, (success, changeset, metrics) in zip(targets, results):
+            if dry_run and changeset is not None:
+                print(f"\n🎯 {target.name}: {target.path}")
+                self.syncers[0].print_changeset(changeset)
+            elif metrics is not None:
+                status = "✅" if success else "❌"
+                self.logger.info(f"{status} {target.name}: 添加 {metrics.counters['bookmarks_added']} 个书签，"
+                                 f"耗时 {metrics.duration * 1000:.0f}ms")
+            all_success = all_success and success
+        
+        if not dry_run:
+            # 所有子进程都已结束；清理时重新读取索引，保留子进程追加的备份记录
+            self.syncers[0].backup_store.reload()
+            self.syncers[0].prune_backups()
+            if self.prometheus_path:
+                try:
+                    write_prometheus(self.prometheus_path, [metrics for _, _, metrics in results if metrics])
+                except OSError as e:
+                    self.logger.warning(f"⚠️  写入同步指标失败: {e}")
+        return all_success
+    
+    def watch(self, debounce=2.0, poll_interval=5.0, rescan_interval=3600):
+        """常驻监听源书签文件，变化平稳后同步到所有目标"""
+        run_on_change(self.source_path, self.sync, self.logger, debounce, poll_interval, rescan_interval)
+        return True
@@ -4,58 +4,143 @@
 采用保守策略：只添加缺失的书签，不改变原有顺序
 """
 
+import argparse
+import csv
 import json
-import shutil
+import signal
+import sqlite3
+import sys
+import time
 from datetime import datetime
 from pathlib import Path
 import logging
 
-class BookmarkSyncerV2:
-    def __init__(self):
+from bookmark_backup import BackupStore, RetentionPolicy
+from bookmark_discovery import AtlasLocator
+from bookmark_formats import guess_format, iter_import, write_export
+from bookmark_io import atomic_open, iter_bookmark_records, write_json_atomic
+from bookmark_lock import SyncLock
+from bookmark_logging import setup_logging
+from bookmark_metrics import SyncMetrics
+from bookmark_model import URL, BookmarkFile, BookmarkNode, parse_timestamp
+from bookmark_plan import ADD_BOOKMARK, Changeset, SyncPlan
+from bookmark_search import SearchIndex
+from bookmark_sync import BookmarkMerger
+from bookmark_state import SyncState
+from bookmark_watch import run_on_change
+from bookmark_tree import dedupe_tree, iter_bookmarks, iter_roots, walk_nodes, walk_tree
+from bookmark_url import UrlCanonicalizer
+
+DEFAULT_ATLAS_PATH = Path.home() / "Library/Application Support/com.openai.atlas/browser-data/host/user-Am0Q4EbYlB5U8O6IwUFaUZM7__bb9ad6a0-2ac3-437c-a7dd-fd1f6bd9ff0b/Bookmarks"
+
+class BookmarkSyncerV2(BookmarkMerger):
+    def __init__(self, chrome_path=None, atlas_path=None, backup_dir=None, retention=None,
+                 stream_threshold=64 * 1024 * 1024, prometheus_path=None, target_name="chrome",
+                 root_mapping=None, url_rules=None, logger=None, clock=None, search_index=False):
         # Chrome 书签路径
-        self.chrome_path = Path.home() / "Library/Application Support/Google/Chrome/Default/Bookmarks"
+        self.chrome_path = Path(chrome_path) if chrome_path else Path.home() / "Library/Application Support/Google/Chrome/Default/Bookmarks"
         
         # Atlas 书签路径
-        self.atlas_path = Path.home() / "Library/Application Support/com.openai.atlas/browser-data/host/user-Am0Q4EbYlB5U8O6IwUFaUZM7__bb9ad6a0-2ac3-437c-a7dd-fd1f6bd9ff0b/Bookmarks"
+        self.atlas_path = Path(atlas_path) if atlas_path else None
+        
+        # 目标名称（多目标同步时区分状态和备份）
+        self.target_name = target_name
+        
+        # Atlas 书签超过该大小时流式读取
+        self.stream_threshold = stream_threshold
+        
+        # 备份后是否立即按保留策略清理（多目标同步时由主进程统一清理）
+        self.prune_after_backup = True
         
         # 备份目录
-        self.backup_dir = Path.home() / "bookmark-sync-backups"
+        self.backup_dir = Path(backup_dir) if backup_dir else Path.home() / "bookmark-sync-backups"
         self.backup_dir.mkdir(exist_ok=True)
         
-        # 日志配置
-        log_file = self.backup_dir / "sync_v2.log"
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
-    
-    def backup_file(self, file_path, browser_name):
-        """备份书签文件"""
+        # 没有指定 Atlas 路径时使用上次找到的位置（缓存在备份目录，只 stat 一次），失效时重新查找
+        if self.atlas_path is None:
+            self.atlas_path = AtlasLocator(self.backup_dir).locate([DEFAULT_ATLAS_PATH]) or DEFAULT_ATLAS_PATH
+        
+        # 日志配置（每个进程只配置一次，由后台线程写入）；传入 logger 时由调用方负责配置
+        if logger is None:
+            setup_logging(self.backup_dir / "sync_v2.log")
+            logger = logging.getLogger(__name__)
+        
+        # 合并逻辑：根节点映射、URL 规范化、logger 和时钟
+        BookmarkMerger.__init__(self, url_rules, root_mapping, logger, clock)
+        
+        # 同步状态缓存（每个目标一份）
+        self.state_name = "sync_state" if target_name == "chrome" else f"sync_state_{target_name}"
+        self.state = SyncState(self.backup_dir, self.state_name, self.canonicalizer.signature)
+        
+        # Chrome 书签的全文搜索索引：默认在第一次 search() 时建立，search_index=True 时同步后顺带更新
+        search_name = "search_index" if target_name == "chrome" else f"search_index_{target_name}"
+        self.search_path = self.backup_dir / f"{search_name}.sqlite"
+        self.search_index = search_index
+        
+        # 跨进程同步锁（与 V1 共用备份目录下的锁文件）
+        self.lock = SyncLock(self.backup_dir, "sync_v2")
+        
+        # 每次同步的阶段耗时和计数：JSON Lines，可选 Prometheus textfile
+        self.metrics = self.new_metrics()
+        self.metrics_path = self.backup_dir / "metrics_v2.jsonl"
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        
+        # 内容寻址的备份仓库
+        self.backup_store = BackupStore(self.backup_dir, retention)
+    
+    def backup_file(self, file_path, browser_name, digest=None):
+        """备份书签文件（相同内容只保存一次）"""
         if not file_path.exists():
             return None
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"{browser_name}_bookmarks_{timestamp}.json"
-        backup_path = self.backup_dir / backup_name
-        
-        shutil.copy2(file_path, backup_path)
-        self.logger.info(f"✓ 已备份 {browser_name}: {backup_path}")
+        try:
+            entry = self.backup_store.add(file_path, browser_name, digest)
+        except OSError as e:
+            self.logger.error(f"❌ 备份 {browser_name} 失败: {e}")
+            return None
+        backup_path = self.backup_store.object_path(entry['digest'])
+        self.logger.info(f"✓ 已备份 {browser_name}: {entry['digest'][:12]} ({entry['date']})")
         return backup_path
     
+    def prune_backups(self):
+        """按保留策略清理旧备份"""
+        try:
+            removed = self.backup_store.prune()
+        except OSError as e:
+            self.logger.warning(f"⚠️  清理备份失败: {e}")
+            return
+        if removed:
+            self.logger.info(f"🧹 已清理 {removed} 个过期备份")
+    
+    def restore_backup(self, browser_name, at=None, digest=None, target_path=None):
+        """按时间或哈希恢复备份，恢复前先备份当前文件"""
+        entry = self.backup_store.find(browser_name, at=at, digest=digest)
+        if not entry:
+            self.logger.error(f"❌ 没有找到 {browser_name} 的匹配备份")
+            return False
+        
+        if target_path is None:
+            target_path = self.chrome_path if browser_name == 'chrome' else self.atlas_path
+        target_path = Path(target_path)
+        
+        with self.lock.hold(self.logger):
+            if target_path.exists():
+                self.backup_file(target_path, browser_name)
+            self.backup_store.restore(entry, target_path)
+        self.logger.info(f"✓ 已恢复 {browser_name} 备份 {entry['digest'][:12]} ({entry['date']}) → {target_path}")
+        return True
+    
     def load_bookmarks(self, file_path):
-        """加载书签文件"""
+        """加载书签文件，转换为 BookmarkFile"""
         if not file_path.exists():
             self.logger.error(f"❌ 书签文件不存在: {file_path}")
             return None
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = BookmarkFile.from_json(json.load(f))
+                self.metrics.count('bytes_read', f.tell())
+            self.metrics.count('nodes_scanned', data.node_count)
             return data
         except Exception as e:
             self.logger.error(f"❌ 读取书签失败 {file_path}: {e}")
@@ -64,13 +149,11 @@ class BookmarkSyncerV2:
     def save_bookmarks(self, file_path, data):
         """保存书签文件"""
         try:
-            # 先写入临时文件
-            temp_path = file_path.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=3)
-            
-            # 替换原文件
-            shutil.move(temp_path, file_path)
+            # 写入唯一命名的临时文件，fsync 后原子替换原文件
+            if isinstance(data, BookmarkFile):
+                data = data.to_json()
+            written = write_json_atomic(file_path, data, indent=3)
+            self.metrics.count('bytes_written', written)
             self.logger.info(f"✓ 已保存书签: {file_path.name}")
             return True
         except Exception as e:
@@ -78,214 +161,218 @@ class BookmarkSyncerV2:
             return False
     
     def get_all_bookmark_urls(self, node, url_set=None):
-        """递归获取所有书签 URL"""
+        """获取子树中所有书签 URL"""
         if url_set is None:
             url_set = set()
         
-        if isinstance(node, dict):
-            if node.get('type') == 'url' and node.get('url'):
-                url_set.add(node['url'])
-            
-            if 'children' in node:
-                for child in node['children']:
-                    self.get_all_bookmark_urls(child, url_set)
+        if isinstance(node, BookmarkNode):
+            url_set |= walk_nodes([(None, node)]).url_set
         
         return url_set
     
-    def find_folder_by_path(self, root, path_parts):
-        """根据路径查找文件夹"""
-        if not path_parts:
-            return root
-        
-        if 'children' not in root:
-            return None
-        
-        folder_name = path_parts[0]
-        for child in root['children']:
-            if child.get('type') == 'folder' and child.get('name') == folder_name:
-                if len(path_parts) == 1:
-                    return child
-                else:
-                    return self.find_folder_by_path(child, path_parts[1:])
-        
-        return None
-    
-    def create_folder_path(self, root, path_parts):
-        """创建文件夹路径（如果不存在）"""
-        if not path_parts:
-            return root
-        
-        if 'children' not in root:
-            root['children'] = []
-        
-        folder_name = path_parts[0]
-        
-        # 查找是否已存在
-        target_folder = None
-        for child in root['children']:
-            if child.get('type') == 'folder' and child.get('name') == folder_name:
-                target_folder = child
-                break
-        
-        # 如果不存在，创建新文件夹
-        if not target_folder:
-            now_timestamp = str(int(datetime.now().timestamp() * 1000000))
-            target_folder = {
-                'children': [],
-                'date_added': now_timestamp,
-                'date_last_used': '0',
-                'date_modified': now_timestamp,
-                'id': str(len(root['children']) + 1),
-                'name': folder_name,
-                'type': 'folder'
-            }
-            root['children'].append(target_folder)
-            self.logger.info(f"  创建文件夹: {folder_name}")
-        
-        if len(path_parts) == 1:
-            return target_folder
-        else:
-            return self.create_folder_path(target_folder, path_parts[1:])
-    
     def collect_bookmarks_with_path(self, node, path="", bookmarks=None):
         """收集所有书签及其路径"""
         if bookmarks is None:
             bookmarks = []
         
-        if isinstance(node, dict):
-            if node.get('type') == 'url':
-                bookmarks.append({
-                    'data': node,
-                    'path': path
-                })
-            
-            if 'children' in node:
-                current_path = f"{path}/{node.get('name', '')}" if path else node.get('name', '')
-                for child in node['children']:
-                    self.collect_bookmarks_with_path(child, current_path, bookmarks)
+        base = tuple(p for p in path.split('/') if p)
+        for parts, bookmark in iter_bookmarks(node, base):
+            bookmarks.append({
+                'data': bookmark,
+                'path': '/'.join(parts)
+            })
         
         return bookmarks
     
-    def sync_atlas_to_chrome(self):
-        """单向同步：从 Atlas 添加新书签到 Chrome"""
-        self.logger.info("=" * 70)
-        self.logger.info("开始书签同步：Atlas → Chrome")
-        self.logger.info("=" * 70)
+    def stream_new_bookmarks(self, chrome_urls):
+        """流式读取 Atlas，只保留 Chrome 中没有的书签 (文件夹路径, 书签)"""
+        records = []
+        seen = set()
+        scanned = 0
+        try:
+            for record in iter_bookmark_records(self.atlas_path):
+                scanned += 1
+                key = self.url_key(record.url)
+                if key in chrome_urls or key in seen:
+                    continue
+                seen.add(key)
+                records.append(record)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"❌ 读取书签失败 {self.atlas_path}: {e}")
+            return None
+        self.metrics.count('nodes_scanned', scanned)
+        self.metrics.count('bytes_read', self.atlas_path.stat().st_size)
         
+        # 读完整个文件后文件夹名称才完整
+        new_bookmarks = []
+        for record in records:
+            bookmark = BookmarkNode(URL, record.name, record.url, date_added=parse_timestamp(record.date_added))
+            new_bookmarks.append((record.path, bookmark))
+        return new_bookmarks
+    
+    def save_state(self, atlas_fp, chrome_fp, chrome_urls):
+        """记录本次成功同步的输入指纹和 Chrome URL 集合"""
+        self.state.update_file('atlas', atlas_fp)
+        self.state.update_file('chrome', chrome_fp)
+        if chrome_urls is not self.state.get_urls():
+            self.state.set_urls(chrome_urls)
+        try:
+            self.state.save()
+        except OSError as e:
+            self.logger.warning(f"⚠️  保存同步状态失败: {e}")
+    
+    def plan_sync(self, source=None):
+        """规划阶段：读取两边书签并生成变更集，不做备份、不写任何文件；失败返回 None
+        
+        source 为返回 Atlas TreeIndex 的函数（多目标同步时共用同一份解析结果），只在需要时调用。
+        """
         # 检查文件
         if not self.chrome_path.exists():
             self.logger.error(f"❌ Chrome 书签不存在: {self.chrome_path}")
-            return False
+            return None
         
         if not self.atlas_path.exists():
             self.logger.error(f"❌ Atlas 书签不存在: {self.atlas_path}")
-            return False
+            return None
         
         self.logger.info(f"✓ Chrome: {self.chrome_path.name}")
         self.logger.info(f"✓ Atlas: {self.atlas_path.name}")
         
-        # 备份
-        self.logger.info("\n📦 创建备份...")
-        chrome_backup = self.backup_file(self.chrome_path, "chrome")
-        atlas_backup = self.backup_file(self.atlas_path, "atlas")
+        # 检查输入是否有变化
+        with self.metrics.phase('fingerprint'):
+            atlas_fp = self.state.fingerprint('atlas', self.atlas_path)
+            chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
         
-        if not chrome_backup or not atlas_backup:
-            self.logger.error("❌ 备份失败")
-            return False
+        if self.state.is_unchanged('atlas', atlas_fp) and self.state.has_urls():
+            self.logger.info("\n✓ Atlas 书签自上次同步后没有变化，跳过")
+            return SyncPlan(Changeset(chrome_fp=chrome_fp, atlas_fp=atlas_fp), atlas_fp, chrome_fp, up_to_date=True)
         
-        # 加载书签
+        # 加载书签（Atlas 很大时改为流式读取，不构建整棵树）
         self.logger.info("\n📖 加载书签...")
-        chrome_data = self.load_bookmarks(self.chrome_path)
-        atlas_data = self.load_bookmarks(self.atlas_path)
-        
-        if not chrome_data or not atlas_data:
-            return False
-        
-        # 获取所有书签 URL
-        chrome_urls = set()
-        atlas_bookmarks = []
-        
-        if 'roots' in chrome_data:
-            for root_key in chrome_data['roots']:
-                self.get_all_bookmark_urls(chrome_data['roots'][root_key], chrome_urls)
-        
-        if 'roots' in atlas_data:
-            for root_key in atlas_data['roots']:
-                bookmarks = self.collect_bookmarks_with_path(atlas_data['roots'][root_key])
-                atlas_bookmarks.extend(bookmarks)
+        stream_atlas = source is None and atlas_fp['size'] >= self.stream_threshold
+        if source is None and not stream_atlas:
+            with self.metrics.phase('load_atlas'):
+                atlas_data = self.load_bookmarks(self.atlas_path)
+                if not atlas_data:
+                    return None
+                atlas_index = walk_tree(atlas_data, url_key=self.url_key)
+        
+        # Chrome 未变化时直接使用缓存的 URL 集合，不解析 Chrome
+        chrome_data = None
+        chrome_index = None
+        chrome_urls = None
+        if self.state.is_unchanged('chrome', chrome_fp):
+            with self.metrics.phase('load_url_cache'):
+                chrome_urls = self.state.get_urls()
+        
+        if chrome_urls is None:
+            with self.metrics.phase('load_chrome'):
+                chrome_data = self.load_bookmarks(self.chrome_path)
+                if not chrome_data:
+                    return None
+                chrome_index = walk_tree(chrome_data, url_key=self.url_key)
+            chrome_urls = chrome_index.url_set
         
         # 找出 Atlas 独有的书签
-        new_bookmarks = []
-        for item in atlas_bookmarks:
-            url = item['data'].get('url')
-            if url and url not in chrome_urls:
-                new_bookmarks.append(item)
+        if source is not None:
+            with self.metrics.phase('load_atlas'):
+                atlas_index = source()
+            if atlas_index is None:
+                return None
+        if stream_atlas:
+            with self.metrics.phase('stream_atlas'):
+                new_bookmarks = self.stream_new_bookmarks(chrome_urls)
+            if new_bookmarks is None:
+                return None
+        else:
+            with self.metrics.phase('diff'):
+                new_bookmarks = [
+                    (path, bookmark)
+                    for url, (path, bookmark) in atlas_index.url_map.items()
+                    if url not in chrome_urls
+                ]
+        
+        changeset = Changeset(chrome_fp=chrome_fp, atlas_fp=atlas_fp)
+        if new_bookmarks:
+            # 需要知道 Chrome 已有哪些文件夹
+            if chrome_data is None:
+                with self.metrics.phase('load_chrome'):
+                    chrome_data = self.load_bookmarks(self.chrome_path)
+                    if not chrome_data:
+                        return None
+                    chrome_index = walk_tree(chrome_data, url_key=self.url_key)
+            with self.metrics.phase('plan'):
+                self.plan_changes(new_bookmarks, chrome_index.folder_index, changeset)
+        
+        return SyncPlan(changeset, atlas_fp, chrome_fp, chrome_urls, chrome_data, chrome_index)
+    
+    def print_changeset(self, changeset):
+        """打印变更集"""
+        if not changeset:
+            print("没有需要应用的变更")
+            return
+        for line in changeset.describe():
+            print(line)
+        print(f"\n共 {changeset.bookmark_count} 个新书签，{changeset.folder_count} 个新文件夹")
+    
+    def apply_plan(self, plan):
+        """应用阶段：备份后把变更集写入 Chrome，并记录同步状态"""
+        changeset = plan.changeset
+        if plan.up_to_date:
+            return True
         
-        if not new_bookmarks:
+        if not changeset:
             self.logger.info("\n✓ 书签已同步，没有需要添加的新书签")
+            with self.metrics.phase('state'):
+                self.save_state(plan.atlas_fp, plan.chrome_fp, plan.chrome_urls)
+            if plan.chrome_data is not None and self.search_index:
+                with self.metrics.phase('search_index'):
+                    self.update_search_index(plan.chrome_data, plan.chrome_fp['digest'])
             return True
         
-        self.logger.info(f"\n🔍 发现 {len(new_bookmarks)} 个新书签需要添加到 Chrome：")
+        self.logger.info(f"\n🔍 发现 {changeset.bookmark_count} 个新书签需要添加到 Chrome：")
         
-        # 添加新书签到 Chrome
-        added_count = 0
-        for item in new_bookmarks:
-            bookmark = item['data']
-            path = item['path']
-            
-            # 解析路径
-            path_parts = [p for p in path.split('/') if p]
+        # 备份
+        self.logger.info("\n📦 创建备份...")
+        with self.metrics.phase('backup'):
+            chrome_backup = self.backup_file(self.chrome_path, self.target_name, plan.chrome_fp['digest'])
+            atlas_backup = self.backup_file(self.atlas_path, "atlas", plan.atlas_fp['digest'])
             
-            # 查找或创建目标文件夹
-            if path_parts:
-                # 找到对应的根节点
-                root_name = path_parts[0]
-                target_root = None
-                
-                # 映射 Atlas 根节点到 Chrome 根节点
-                root_mapping = {
-                    '书签栏': 'bookmark_bar',
-                    'Bookmarks bar': 'bookmark_bar',
-                    '其他书签': 'other',
-                    'Other bookmarks': 'other',
-                }
-                
-                chrome_root_key = root_mapping.get(root_name, 'bookmark_bar')
-                
-                if chrome_root_key in chrome_data['roots']:
-                    target_root = chrome_data['roots'][chrome_root_key]
-                    
-                    # 创建子文件夹路径（如果有）
-                    if len(path_parts) > 1:
-                        target_folder = self.create_folder_path(target_root, path_parts[1:])
-                    else:
-                        target_folder = target_root
-                    
-                    # 添加书签
-                    if 'children' not in target_folder:
-                        target_folder['children'] = []
-                    
-                    # 创建新书签（复制数据）
-                    new_bookmark = {
-                        'date_added': bookmark.get('date_added', str(int(datetime.now().timestamp() * 1000000))),
-                        'date_last_used': '0',
-                        'id': str(len(target_folder['children']) + 1),
-                        'name': bookmark['name'],
-                        'type': 'url',
-                        'url': bookmark['url']
-                    }
-                    
-                    target_folder['children'].append(new_bookmark)
-                    added_count += 1
-                    
-                    # 显示添加的书签
-                    folder_path = '/'.join(path_parts[1:]) if len(path_parts) > 1 else '(根目录)'
-                    self.logger.info(f"  ✓ [{added_count}] {bookmark['name']}")
-                    self.logger.info(f"      位置: {root_name}/{folder_path}")
+            if not chrome_backup or not atlas_backup:
+                self.logger.error("❌ 备份失败")
+                return False
+            if self.prune_after_backup:
+                self.prune_backups()
+        
+        chrome_data = plan.chrome_data
+        chrome_index = plan.chrome_index
+        if chrome_data is None:
+            with self.metrics.phase('load_chrome'):
+                chrome_data = self.load_bookmarks(self.chrome_path)
+                if not chrome_data:
+                    return False
+                chrome_index = walk_tree(chrome_data, url_key=self.url_key)
+        
+        # 添加新书签到 Chrome；chrome_urls 中只会加入实际放置的书签，没能放置的下次同步时重试
+        chrome_urls = set(chrome_index.url_set)
+        with self.metrics.phase('apply'):
+            added_count = self.apply_changeset(chrome_data, changeset, chrome_index.folder_index, chrome_urls)
+        
+        if not added_count:
+            self.logger.info("\n✓ 没有可以放置的新书签，Chrome 保持不变")
+            return True
         
         # 保存 Chrome 书签
         self.logger.info(f"\n💾 保存更新...")
-        if self.save_bookmarks(self.chrome_path, chrome_data):
+        with self.metrics.phase('save'):
+            saved = self.save_bookmarks(self.chrome_path, chrome_data)
+        if saved:
+            with self.metrics.phase('state'):
+                chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+                self.save_state(plan.atlas_fp, chrome_fp, chrome_urls)
+            if self.search_index:
+                with self.metrics.phase('search_index'):
+                    self.update_search_index(chrome_data, chrome_fp['digest'], changeset, plan.chrome_fp['digest'])
             self.logger.info("\n" + "=" * 70)
             self.logger.info(f"✅ 同步完成！已添加 {added_count} 个新书签到 Chrome")
             self.logger.info("=" * 70)
@@ -295,24 +382,465 @@ class BookmarkSyncerV2:
         else:
             self.logger.error("\n❌ 保存失败")
             return False
+    
+    def apply_saved_changeset(self, changeset_path):
+        """重放保存的变更集（持有同步锁）"""
+        with self.lock.hold(self.logger):
+            return self.replay_changeset(changeset_path)
+    
+    def replay_changeset(self, changeset_path):
+        """重放保存的变更集；Chrome 中已存在的书签会被跳过"""
+        try:
+            changeset = Changeset.load(changeset_path)
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.error(f"❌ 读取变更集失败 {changeset_path}: {e}")
+            return False
+        
+        if not self.chrome_path.exists():
+            self.logger.error(f"❌ Chrome 书签不存在: {self.chrome_path}")
+            return False
+        
+        chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+        base_changed = not changeset.chrome_fp or changeset.chrome_fp.get('digest') != chrome_fp['digest']
+        if base_changed:
+            self.logger.warning("⚠️  Chrome 书签在规划之后已经变化，已存在的书签将被跳过")
+        
+        if not self.backup_file(self.chrome_path, self.target_name, chrome_fp['digest']):
+            self.logger.error("❌ 备份失败")
+            return False
+        self.prune_backups()
+        
+        chrome_data = self.load_bookmarks(self.chrome_path)
+        if not chrome_data:
+            return False
+        chrome_index = walk_tree(chrome_data, url_key=self.url_key)
+        chrome_urls = set(chrome_index.url_set)
+        
+        added_count = self.apply_changeset(chrome_data, changeset, chrome_index.folder_index, chrome_urls)
+        if not added_count:
+            self.logger.info("✓ 变更集中的书签都已存在，Chrome 保持不变")
+            return True
+        
+        if not self.save_bookmarks(self.chrome_path, chrome_data):
+            return False
+        new_chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+        self.update_search_index(chrome_data, new_chrome_fp['digest'], changeset, chrome_fp['digest'])
+        
+        # 输入与规划时一致时才更新同步状态
+        atlas_fp = changeset.atlas_fp
+        if (not base_changed and atlas_fp and self.atlas_path.exists()
+                and self.state.fingerprint('atlas', self.atlas_path)['digest'] == atlas_fp.get('digest')):
+            self.save_state(atlas_fp, new_chrome_fp, chrome_urls)
+        self.logger.info(f"✅ 已应用变更集，添加 {added_count} 个新书签到 Chrome")
+        return True
+    
+    def search_entries(self, data):
+        """书签文件中的每个书签 (索引键, 名称, URL, 文件夹路径)，按原始顺序"""
+        url_key = self.url_key
+        for _, root in iter_roots(data):
+            for path, bookmark in iter_bookmarks(root):
+                if bookmark.url:
+                    yield url_key(bookmark.url), bookmark.name, bookmark.url, '/'.join(path)
+    
+    def update_search_index(self, chrome_data, digest, changeset=None, base_digest=None, force=False):
+        """让搜索索引与 chrome_data（内容摘要为 digest）一致；没有开启 search_index 时只在 force 时更新
+        
+        索引停留在应用变更集之前的 Chrome（base_digest）时只添加变更集中的书签，否则与整个书签文件对齐。
+        """
+        if self.search_path is None or not (self.search_index or force):
+            return
+        rules = self.canonicalizer.signature
+        try:
+            index = SearchIndex(self.search_path)
+            try:
+                if index.is_current(digest, rules):
+                    return
+                if changeset is not None and index.is_current(base_digest, rules):
+                    roots = chrome_data.roots
+                    added = index.add(((self.url_key(change.url), change.name, change.url,
+                                        '/'.join((roots[change.root].name,) + change.path))
+                                       for change in changeset
+                                       if change.op == ADD_BOOKMARK and change.root in roots), digest, rules)
+                    removed = updated = 0
+                else:
+                    added, removed, updated = index.update(self.search_entries(chrome_data), digest, rules)
+            finally:
+                index.close()
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️  更新搜索索引失败: {e}")
+            return
+        self.logger.info(f"🔎 搜索索引已更新：+{added} -{removed} ~{updated}")
+    
+    def search(self, query, limit=20):
+        """在 Chrome 书签中搜索，返回 SearchResult 列表；索引落后于书签文件时先更新。失败返回 None"""
+        if not self.chrome_path.exists():
+            self.logger.error(f"❌ Chrome 书签不存在: {self.chrome_path}")
+            return None
+        chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+        try:
+            index = SearchIndex(self.search_path)
+            try:
+                current = index.is_current(chrome_fp['digest'], self.canonicalizer.signature)
+            finally:
+                index.close()
+            if not current:
+                self.logger.info("🔎 Chrome 书签已变化，更新搜索索引...")
+                chrome_data = self.load_bookmarks(self.chrome_path)
+                if not chrome_data:
+                    return None
+                self.update_search_index(chrome_data, chrome_fp['digest'], force=True)
+            index = SearchIndex(self.search_path)
+            try:
+                return index.search(query, limit)
+            finally:
+                index.close()
+        except sqlite3.Error as e:
+            self.logger.error(f"❌ 搜索失败: {e}")
+            return None
+    
+    def dedupe(self, browser_name='chrome', dry_run=False):
+        """删除一个书签文件中重复的书签（规范 URL 相同），按原始顺序保留第一个"""
+        file_path = self.chrome_path if browser_name == 'chrome' else self.atlas_path
+        label = self.target_name if browser_name == 'chrome' else browser_name
+        with self.lock.hold(self.logger):
+            if not file_path.exists():
+                self.logger.error(f"❌ 书签文件不存在: {file_path}")
+                return False
+            data = self.load_bookmarks(file_path)
+            if not data:
+                return False
+            
+            removed = dedupe_tree(data, self.url_key)
+            if not removed:
+                self.logger.info(f"✓ {file_path.name} 中没有重复的书签")
+                return True
+            
+            if dry_run:
+                for path, bookmark in removed:
+                    print(f"- 🔖 {'/'.join(path)}: {bookmark.name} <{bookmark.url}>")
+                print(f"\n共 {len(removed)} 个重复书签")
+                return True
+            
+            if not self.backup_file(file_path, label):
+                self.logger.error("❌ 备份失败")
+                return False
+            self.prune_backups()
+            if not self.save_bookmarks(file_path, data):
+                return False
+            if browser_name == 'chrome':
+                self.update_search_index(data, self.state.fingerprint('chrome', file_path)['digest'])
+        
+        removed_by_folder = {}
+        for path, _ in removed:
+            removed_by_folder[path] = removed_by_folder.get(path, 0) + 1
+        for path, count in sorted(removed_by_folder.items(), key=lambda item: -item[1])[:20]:
+            self.logger.info(f"  ✓ {'/'.join(path)}: -{count}")
+        self.logger.info(f"✅ 已删除 {len(removed)} 个重复书签")
+        return True
+    
+    def export_bookmarks(self, browser_name, file_path, fmt=None):
+        """把书签导出为 Netscape HTML 或 CSV（边遍历边写入临时文件，完成后改名替换）"""
+        source_path = self.chrome_path if browser_name == 'chrome' else self.atlas_path
+        fmt = fmt or guess_format(file_path)
+        if not source_path.exists():
+            self.logger.error(f"❌ 书签文件不存在: {source_path}")
+            return False
+        data = self.load_bookmarks(source_path)
+        if not data:
+            return False
+        try:
+            with atomic_open(file_path, fsync=False, mode=0o644, text=True) as f:
+                count = write_export(f, data, fmt)
+        except OSError as e:
+            self.logger.error(f"❌ 导出失败 {file_path}: {e}")
+            return False
+        self.logger.info(f"✅ 已导出 {count} 个书签到 {file_path}")
+        return True
+    
+    def import_bookmarks(self, file_path, fmt=None, dry_run=False):
+        """从其他浏览器导出的 HTML / CSV 中添加 Chrome 缺少的书签（与同步相同的只添加策略）"""
+        with self.lock.hold(self.logger):
+            if not self.chrome_path.exists():
+                self.logger.error(f"❌ Chrome 书签不存在: {self.chrome_path}")
+                return False
+            chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+            chrome_data = self.load_bookmarks(self.chrome_path)
+            if not chrome_data:
+                return False
+            chrome_index = walk_tree(chrome_data, url_key=self.url_key)
+            chrome_urls = set(chrome_index.url_set)
+            
+            # 边读边过滤，只保留 Chrome 中没有的书签
+            new_bookmarks = []
+            seen = set()
+            scanned = 0
+            try:
+                for path, bookmark in iter_import(file_path, fmt):
+                    scanned += 1
+                    key = self.url_key(bookmark.url)
+                    if key in chrome_urls or key in seen:
+                        continue
+                    seen.add(key)
+                    new_bookmarks.append((path, bookmark))
+            except (OSError, ValueError, csv.Error) as e:
+                self.logger.error(f"❌ 读取导入文件失败 {file_path}: {e}")
+                return False
+            self.logger.info(f"📖 {Path(file_path).name}: {scanned} 个书签，其中 {len(new_bookmarks)} 个 Chrome 中没有")
+            
+            changeset = self.plan_changes(new_bookmarks, chrome_index.folder_index,
+                                          Changeset(chrome_fp=chrome_fp))
+            if dry_run:
+                self.print_changeset(changeset)
+                return True
+            if not changeset:
+                self.logger.info("✓ 没有需要导入的书签")
+                return True
+            
+            if not self.backup_file(self.chrome_path, self.target_name, chrome_fp['digest']):
+                self.logger.error("❌ 备份失败")
+                return False
+            self.prune_backups()
+            added_count = self.apply_changeset(chrome_data, changeset, chrome_index.folder_index, chrome_urls)
+            if not self.save_bookmarks(self.chrome_path, chrome_data):
+                return False
+            new_chrome_fp = self.state.fingerprint('chrome', self.chrome_path)
+            self.update_search_index(chrome_data, new_chrome_fp['digest'], changeset, chrome_fp['digest'])
+        self.logger.info(f"✅ 已导入 {added_count} 个新书签到 Chrome")
+        return True
+    
+    def sync_atlas_to_chrome(self, dry_run=False, plan_path=None):
+        """单向同步：从 Atlas 添加新书签到 Chrome
+        
+        dry_run 时只打印变更集，不备份、不写文件；plan_path 指定时把变更集保存到该文件。
+        同一时间只有一个进程同步，同步期间到达的触发合并为一次后续同步。
+        """
+        if dry_run:
+            return self.sync_once(dry_run, plan_path)
+        result = self.lock.run(lambda: self.sync_once(plan_path=plan_path), self.logger)
+        if result is None:
+            self.logger.info("✓ 另一个进程已经完成了这次同步")
+            return True
+        return result
+    
+    def sync_once(self, dry_run=False, plan_path=None):
+        """执行一次同步（规划 + 应用），并记录指标"""
+        self.logger.info("=" * 70)
+        self.logger.info("开始书签同步：Atlas → Chrome")
+        self.logger.info("=" * 70)
+        
+        self.metrics = self.new_metrics()
+        success = False
+        try:
+            plan = self.plan_sync()
+            if plan is None:
+                return False
+            
+            if plan_path:
+                plan.changeset.save(plan_path)
+                self.logger.info(f"✓ 变更集已保存: {plan_path}")
+            if dry_run:
+                self.print_changeset(plan.changeset)
+                success = True
+                return True
+            
+            success = self.apply_plan(plan)
+            return success
+        finally:
+            self.metrics.finish(success)
+            if not dry_run:
+                self.record_metrics()
+    
+    def new_metrics(self):
+        """新一次同步的指标；默认目标不带目标标签"""
+        return SyncMetrics('sync_v2', None if self.target_name == "chrome" else self.target_name)
+    
+    def record_metrics(self):
+        """输出本次同步的指标"""
+        metrics = self.metrics
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in metrics.phases.items())
+        self.logger.info(f"⏱  耗时 {metrics.duration * 1000:.0f}ms（{phases or '无'}）")
+        try:
+            metrics.write_jsonl(self.metrics_path)
+            if self.prometheus_path:
+                metrics.write_prometheus(self.prometheus_path)
+        except OSError as e:
+            self.logger.warning(f"⚠️  写入同步指标失败: {e}")
+    
+    def watch(self, debounce=2.0, poll_interval=5.0, rescan_interval=3600):
+        """常驻监听 Atlas 书签文件，变化平稳后增量同步"""
+        run_on_change(self.atlas_path, self.sync_atlas_to_chrome, self.logger,
+                      debounce, poll_interval, rescan_interval)
+        return True
+
+
+def parse_time(value):
+    """解析恢复时间，支持 'YYYY-MM-DD HH:MM[:SS]' 和 ISO 格式"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(value)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="书签同步工具 V2：Atlas → Chrome")
+    parser.add_argument('--keep-last', type=int, default=10, help="保留最近的备份数量")
+    parser.add_argument('--keep-hourly', type=int, default=24, help="按小时保留的备份数量")
+    parser.add_argument('--keep-daily', type=int, default=7, help="按天保留的备份数量")
+    parser.add_argument('--keep-weekly', type=int, default=4, help="按周保留的备份数量")
+    parser.add_argument('--stream', action='store_true', help="流式读取 Atlas 书签（内存占用低，适合很大的书签文件）")
+    parser.add_argument('--watch', action='store_true', help="常驻监听 Atlas 书签，变化时自动同步")
+    parser.add_argument('--debounce', type=float, default=2.0, help="监听模式下等待写入平稳的秒数")
+    parser.add_argument('--poll-interval', type=float, default=5.0, help="无法使用系统通知时的轮询间隔（秒）")
+    parser.add_argument('--dry-run', action='store_true', help="只显示将要进行的变更，不备份、不写入")
+    parser.add_argument('--save-plan', metavar='FILE', help="把变更集保存到文件，之后可用 apply 命令应用")
+    parser.add_argument('--verbose', action='store_true', help="在日志中列出每个添加的书签")
+    parser.add_argument('--config', metavar='FILE', help="多目标配置（JSON）：一个源书签同步到多个浏览器/配置文件")
+    parser.add_argument('--workers', type=int, help="多目标同步时并发同步的进程数")
+    parser.add_argument('--url-rules', metavar='FILE',
+                        help="URL 规范化选项（JSON），决定哪些 URL 视为同一个书签，例如 {\"strip_www\": true}")
+    parser.add_argument('--search-index', action='store_true',
+                        help="每次写入 Chrome 后顺带更新搜索索引（默认在搜索时才建立/更新）")
+    parser.add_argument('--prometheus-textfile', metavar='FILE',
+                        help="同步后把指标写入 Prometheus textfile（如 node_exporter 的 textfile 目录下的 .prom 文件）")
+    
+    subparsers = parser.add_subparsers(dest='command')
+    
+    restore = subparsers.add_parser('restore', help="恢复备份")
+    restore.add_argument('browser', choices=['chrome', 'atlas'])
+    group = restore.add_mutually_exclusive_group()
+    group.add_argument('--at', type=parse_time, help="恢复该时间点及之前最新的备份")
+    group.add_argument('--hash', help="按内容哈希（前缀）恢复")
+    restore.add_argument('--to', help="恢复到指定文件（默认覆盖浏览器书签）")
+    
+    backups = subparsers.add_parser('backups', help="列出备份")
+    backups.add_argument('browser', nargs='?', choices=['chrome', 'atlas'])
+    
+    apply_parser = subparsers.add_parser('apply', help="应用保存的变更集")
+    apply_parser.add_argument('changeset', help="--save-plan 保存的变更集文件")
+    
+    search = subparsers.add_parser('search', help="搜索 Chrome 书签（名称、URL、文件夹）")
+    search.add_argument('query', nargs='+', help="搜索词，多个词需要同时匹配")
+    search.add_argument('-n', '--limit', type=int, default=20, help="最多显示的结果数")
+    
+    dedupe = subparsers.add_parser('dedupe', help="删除一个书签文件中重复的书签")
+    dedupe.add_argument('browser', nargs='?', default='chrome', choices=['chrome', 'atlas'])
+    dedupe.add_argument('--dry-run', action='store_true', help="只列出重复的书签，不备份、不写入")
+    
+    export = subparsers.add_parser('export', help="导出书签为 Netscape HTML 或 CSV")
+    export.add_argument('browser', choices=['chrome', 'atlas'])
+    export.add_argument('file', help="导出文件（.html 或 .csv）")
+    export.add_argument('--format', choices=['html', 'csv'], help="文件格式（默认按扩展名判断）")
+    
+    import_parser = subparsers.add_parser('import', help="把其他浏览器导出的 HTML / CSV 书签合并到 Chrome")
+    import_parser.add_argument('file', help="导入文件（.html 或 .csv）")
+    import_parser.add_argument('--format', choices=['html', 'csv'], help="文件格式（默认按扩展名判断）")
+    import_parser.add_argument('--dry-run', action='store_true', help="只显示将要添加的书签，不备份、不写入")
+    
+    return parser
 
 def main():
+    args = build_parser().parse_args()
+    retention = RetentionPolicy(args.keep_last, args.keep_hourly, args.keep_daily, args.keep_weekly)
+    try:
+        url_rules = UrlCanonicalizer.load(args.url_rules) if args.url_rules else None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ 读取 URL 规范化选项失败 {args.url_rules}: {e}")
+        sys.exit(1)
+    
+    if args.command == 'backups':
+        syncer = BookmarkSyncerV2(retention=retention)
+        for entry in syncer.backup_store.entries:
+            if args.browser and entry['browser'] != args.browser:
+                continue
+            print(f"{entry['date']}  {entry['browser']:<6}  {entry['digest'][:12]}  {entry['size']:>10} 字节")
+        sys.exit(0)
+    
+    if args.command == 'restore':
+        syncer = BookmarkSyncerV2(retention=retention)
+        success = syncer.restore_backup(args.browser, at=args.at, digest=args.hash, target_path=args.to)
+        sys.exit(0 if success else 1)
+    
+    if args.command == 'apply':
+        syncer = BookmarkSyncerV2(retention=retention, url_rules=url_rules,
+                                  search_index=args.search_index)
+        success = syncer.apply_saved_changeset(args.changeset)
+        sys.exit(0 if success else 1)
+    
+    if args.command == 'search':
+        syncer = BookmarkSyncerV2(retention=retention, url_rules=url_rules)
+        start = time.perf_counter()
+        results = syncer.search(' '.join(args.query), args.limit)
+        if results is None:
+            sys.exit(1)
+        for result in results:
+            print(f"🔖 {result.name}\n   {result.url}\n   📁 {result.path}")
+        print(f"\n共 {len(results)} 条结果（{(time.perf_counter() - start) * 1000:.0f}ms）")
+        sys.exit(0)
+    
+    if args.command == 'dedupe':
+        syncer = BookmarkSyncerV2(retention=retention, url_rules=url_rules,
+                                  search_index=args.search_index)
+        success = syncer.dedupe(args.browser, dry_run=args.dry_run)
+        sys.exit(0 if success else 1)
+    
+    if args.command == 'export':
+        syncer = BookmarkSyncerV2(retention=retention)
+        success = syncer.export_bookmarks(args.browser, args.file, args.format)
+        sys.exit(0 if success else 1)
+    
+    if args.command == 'import':
+        syncer = BookmarkSyncerV2(retention=retention, url_rules=url_rules,
+                                  search_index=args.search_index)
+        if args.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+        success = syncer.import_bookmarks(args.file, args.format, dry_run=args.dry_run)
+        sys.exit(0 if success else 1)
+    
     print("\n" + "=" * 70)
     print("  🔖 书签同步工具 V2")
     print("  策略：只添加缺失的书签，保持原有顺序")
     print("  方向：Atlas → Chrome")
     print("=" * 70 + "\n")
     
-    syncer = BookmarkSyncerV2()
-    success = syncer.sync_atlas_to_chrome()
+    if args.config:
+        # 多目标同步在单独的模块中，只在使用 --config 时导入
+        from sync_bookmarks_fanout import FanoutSyncerV2, load_fanout_config
+        source, targets = load_fanout_config(args.config)
+        if not targets:
+            print(f"❌ 配置中没有可用的目标: {args.config}")
+            sys.exit(1)
+        syncer = FanoutSyncerV2(source, targets, retention=retention, workers=args.workers,
+                                prometheus_path=args.prometheus_textfile, url_rules=url_rules)
+        if args.verbose:
+            logging.getLogger().setLevel(logging.DEBUG)
+        if args.watch:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            syncer.watch(args.debounce, args.poll_interval)
+            sys.exit(0)
+        success = syncer.sync(dry_run=args.dry_run)
+        print("\n✅ 同步成功！" if success else "\n❌ 部分目标同步失败，请查看日志")
+        sys.exit(0 if success else 1)
+    
+    syncer = BookmarkSyncerV2(retention=retention, prometheus_path=args.prometheus_textfile, url_rules=url_rules,
+                              search_index=args.search_index)
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    if args.stream:
+        syncer.stream_threshold = 0
+    if args.watch:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        syncer.watch(args.debounce, args.poll_interval)
+        sys.exit(0)
+    success = syncer.sync_atlas_to_chrome(dry_run=args.dry_run, plan_path=args.save_plan)
     
     if not success:
         print("\n❌ 同步失败，请查看日志")
         print(f"日志位置: {syncer.backup_dir / 'sync_v2.log'}")
-        exit(1)
+        sys.exit(1)
     else:
         print("\n✅ 同步成功！")
-        exit(0)
+        sys.exit(0)
 
 if __name__ == "__main__":
     main()